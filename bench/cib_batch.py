@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+Scaling of the crm_ops.py batch decoding over worker processes
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from crm_ops import decode_cib_file
+import synthetic
+
+
+def run(files, jobs, summary_only):
+    tasks = [(cib_file, summary_only) for cib_file in files]
+    time_start = time.time()
+    if jobs == 1:
+        results = map(decode_cib_file, tasks)
+    else:
+        pool = multiprocessing.Pool(jobs)
+        results = list(pool.imap(decode_cib_file, tasks))
+        pool.close()
+        pool.join()
+    elapsed = time.time() - time_start
+    errors = [error for cib_file, nodes, error in results if error]
+    if errors:
+        sys.stdout.write('ERROR: %s\n' % errors[0])
+        sys.exit(1)
+    return elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-f", "--files", help="number of CIB files", type=int, default=16)
+    parser.add_argument("-n", "--nodes", help="number of nodes in every CIB", type=int, default=50)
+    parser.add_argument("-o", "--ops", help="copies of every op", type=int, default=10)
+    parser.add_argument("-J", "--jobs", help="maximum number of jobs", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("-S", "--summary", help="return only the summary from workers", action='store_true')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        cib_xml = synthetic.scaled_cib(args.nodes, args.ops)
+        files = [synthetic.write_file(os.path.join(directory, 'cib-%03d.xml' % number), cib_xml)
+                 for number in xrange(args.files)]
+        sys.stdout.write('%d files of %.1f MB\n' % (args.files, len(cib_xml) / 1024.0 / 1024.0))
+
+        jobs_list = [2 ** power for power in xrange(args.jobs.bit_length()) if 2 ** power < args.jobs]
+        base_time = None
+        for jobs in jobs_list + [args.jobs]:
+            elapsed = run(files, jobs, args.summary)
+            if base_time is None:
+                base_time = elapsed
+            sys.stdout.write('jobs: %3d %8.3fs speedup: %5.2fx\n' % (jobs, elapsed, base_time / elapsed))
+    finally:
+        shutil.rmtree(directory)
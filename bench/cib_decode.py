@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Compare the streaming CIB decoder with the minidom one on a synthetic CIB
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from cib import CIB
+import synthetic
+
+
+class Quiet:
+    def debug(self, msg='', debug=1, offset=None):
+        pass
+
+
+def decode(path, method):
+    cib = CIB(Quiet())
+    cib.get_cib_from_file(path)
+    time_start = time.time()
+    getattr(cib, method)()
+    elapsed = time.time() - time_start
+    return cib, elapsed
+
+
+def run_child(path, method):
+    """
+    Decode in a forked child so the peak RSS of every method is measured separately
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        cib, elapsed = decode(path, method)
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        os.write(write_fd, '%f %d' % (elapsed, rss))
+        os._exit(0)
+    os.close(write_fd)
+    result = os.read(read_fd, 128)
+    os.waitpid(pid, 0)
+    elapsed, rss = result.split()
+    return float(elapsed), int(rss)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--nodes", help="number of nodes", type=int, default=200)
+    parser.add_argument("-o", "--ops", help="copies of every op", type=int, default=20)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'cib.xml')
+    synthetic.write_file(path, synthetic.scaled_cib(args.nodes, args.ops))
+    size = os.path.getsize(path) / 1024.0 / 1024.0
+    sys.stdout.write('CIB: %s (%.1f MB, %d nodes)\n' % (path, size, args.nodes))
+
+    for method in ['decode_lrm_dom', 'decode_lrm']:
+        elapsed, rss = run_child(path, method)
+        sys.stdout.write('%-16s %8.3fs %10d KB max RSS\n' % (method, elapsed, rss))
+
+    dom_cib, dom_time = decode(path, 'decode_lrm_dom')
+    stream_cib, stream_time = decode(path, 'decode_lrm')
+    os.unlink(path)
+    if dom_cib.nodes != stream_cib.nodes:
+        sys.stdout.write('ERROR: decoded structures differ!\n')
+        sys.exit(1)
+    sys.stdout.write('Decoded structures are equal\n')
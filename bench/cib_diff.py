@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Compare applying CIB diffs with decoding the whole CIB again
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from cib import CIB, StringIO
+import synthetic
+
+
+class Quiet:
+    def debug(self, msg='', debug=1, offset=None):
+        pass
+
+
+def make_diff(node, num_updates, call_id):
+    """
+    A format 2 patchset that stops p_haproxy on a node
+    """
+    path = "/cib/status/node_state[@id='%s']/lrm[@id='%s']/lrm_resources/lrm_resource[@id='p_haproxy']" % (node, node)
+    return '''<diff format="2">
+  <version>
+    <source admin_epoch="0" epoch="565" num_updates="%(source)d"/>
+    <target admin_epoch="0" epoch="565" num_updates="%(target)d"/>
+  </version>
+  <change operation="delete" path="%(path)s/lrm_rsc_op[@id='p_haproxy_monitor_20000']"/>
+  <change operation="modify" path="%(path)s/lrm_rsc_op[@id='p_haproxy_last_0']">
+    <change-list>
+      <change-attr name="operation" operation="set" value="stop"/>
+      <change-attr name="rc-code" operation="set" value="0"/>
+      <change-attr name="op-status" operation="set" value="0"/>
+      <change-attr name="call-id" operation="set" value="%(call_id)d"/>
+    </change-list>
+  </change>
+</diff>''' % {
+        'source': num_updates,
+        'target': num_updates + 1,
+        'path': path,
+        'call_id': call_id,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--nodes", help="number of nodes", type=int, default=200)
+    parser.add_argument("-o", "--ops", help="copies of every op", type=int, default=10)
+    parser.add_argument("-c", "--count", help="number of diffs", type=int, default=100)
+    parser.add_argument("-r", "--reparse", help="number of full decodes to average", type=int, default=3)
+    args = parser.parse_args()
+
+    cib_xml = synthetic.scaled_cib(args.nodes, args.ops)
+    sys.stdout.write('CIB: %.1f MB, %d nodes\n' % (len(cib_xml) / 1024.0 / 1024.0, args.nodes))
+
+    random.seed(0)
+    nodes = ['node-%d.synthetic.tld' % random.randrange(args.nodes) for number in xrange(args.count)]
+    diffs = [make_diff(node, number + 1, 900000 + number) for number, node in enumerate(nodes)]
+
+    time_start = time.time()
+    for number in xrange(args.reparse):
+        cib = CIB(Quiet())
+        cib.cib_xml = cib_xml
+        cib.decode_lrm()
+    full_time = (time.time() - time_start) / args.reparse
+
+    time_start = time.time()
+    for diff in diffs:
+        if not cib.apply_diff(StringIO(diff)):
+            sys.stdout.write('ERROR: diff was not applied!\n')
+            sys.exit(1)
+    diff_time = (time.time() - time_start) / args.count
+
+    for node in nodes:
+        if cib.lookup(node, 'p_haproxy')[1] != 'stop':
+            sys.stdout.write('ERROR: p_haproxy is not stopped on %s!\n' % node)
+            sys.exit(1)
+
+    sys.stdout.write('full decode: %10.3f ms\n' % (full_time * 1000))
+    sys.stdout.write('apply diff:  %10.3f ms\n' % (diff_time * 1000))
+    sys.stdout.write('speedup:     %10.0fx\n' % (full_time / diff_time))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Load test of cib_health_server.py: requests per second and latency percentiles.
+Use --path /metrics to measure the scrape latency of the metrics endpoint.
+"""
+import argparse
+import httplib
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def percentile(values, fraction):
+    """
+    Get a percentile of a sorted list
+    @param values: Sorted list of numbers
+    @param fraction: 0.0 - 1.0
+    @return: Value
+    """
+    if not values:
+        return 0
+    index = min(len(values) - 1, int(len(values) * fraction))
+    return values[index]
+
+
+def client(args):
+    """
+    Send requests over one keep-alive connection for some time
+    @return: List of latencies in seconds
+    """
+    host, port, path, duration = args
+    latencies = []
+    connection = httplib.HTTPConnection(host, port)
+    time_end = time.time() + duration
+    while time.time() < time_end:
+        time_start = time.time()
+        connection.request('GET', path)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.time() - time_start)
+    connection.close()
+    return latencies
+
+
+def wait_for_server(host, port, timeout=10):
+    time_end = time.time() + timeout
+    while time.time() < time_end:
+        try:
+            connection = httplib.HTTPConnection(host, port)
+            connection.request('GET', '/')
+            connection.getresponse().read()
+            connection.close()
+            return True
+        except Exception:
+            time.sleep(0.1)
+    return False
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--port", help="server port", type=int, default=18081)
+    parser.add_argument("-c", "--clients", help="number of client processes", type=int, default=4)
+    parser.add_argument("-t", "--time", help="test duration in seconds", type=float, default=5)
+    parser.add_argument("-u", "--path", help="request path", type=str, default='/node-1.domain.tld/p_mysql')
+    parser.add_argument("-e", "--external", help="use already running server", action='store_true')
+    args = parser.parse_args()
+
+    server = None
+    if not args.external:
+        server = subprocess.Popen(
+            [sys.executable, 'cib_health_server.py', '--test', '--address', '127.0.0.1', '--port', str(args.port)],
+            cwd=base_dir,
+        )
+    try:
+        if not wait_for_server('127.0.0.1', args.port):
+            sys.stderr.write('Server is not responding!\n')
+            sys.exit(1)
+
+        pool = multiprocessing.Pool(args.clients)
+        time_start = time.time()
+        results = pool.map(client, [('127.0.0.1', args.port, args.path, args.time)] * args.clients)
+        elapsed = time.time() - time_start
+        pool.close()
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    latencies = sorted(latency for result in results for latency in result)
+    sys.stdout.write('Requests: %d in %.2fs by %d clients\n' % (len(latencies), elapsed, args.clients))
+    sys.stdout.write('RPS: %.0f\n' % (len(latencies) / elapsed))
+    for name, fraction in [('p50', 0.5), ('p90', 0.9), ('p99', 0.99)]:
+        sys.stdout.write('%s: %.3f ms\n' % (name, percentile(latencies, fraction) * 1000))
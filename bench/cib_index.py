@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Compare a full CIB decode with the targeted single node decode and index lookup
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from cib import CIB
+import synthetic
+
+
+class Quiet:
+    def debug(self, msg='', debug=1, offset=None):
+        pass
+
+
+def full_check(cib_xml, node, resource):
+    """
+    The old health check: decode everything and find the status again
+    """
+    cib = CIB(Quiet())
+    cib.cib_xml = cib_xml
+    cib.decode_lrm()
+    return cib.determine_resource_status(cib.nodes[node]['resources'][resource]['ops'])
+
+
+def targeted_check(cib_xml, node, resource):
+    """
+    Decode only the node's lrm section and use the index
+    """
+    cib = CIB(Quiet())
+    cib.cib_xml = cib_xml
+    cib.decode_lrm(node)
+    return cib.lookup(node, resource)[1]
+
+
+def measure(function, repeat, *args):
+    time_start = time.time()
+    for number in xrange(repeat):
+        result = function(*args)
+    return (time.time() - time_start) / repeat, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--nodes", help="number of nodes", type=int, default=200)
+    parser.add_argument("-o", "--ops", help="copies of every op", type=int, default=10)
+    parser.add_argument("-r", "--repeat", help="repeat every check N times", type=int, default=5)
+    args = parser.parse_args()
+
+    cib_xml = synthetic.scaled_cib(args.nodes, args.ops)
+    sys.stdout.write('CIB: %.1f MB, %d nodes\n' % (len(cib_xml) / 1024.0 / 1024.0, args.nodes))
+    resource = 'p_haproxy'
+
+    for node_number in [0, args.nodes / 2, args.nodes - 1]:
+        node = 'node-%d.synthetic.tld' % node_number
+        full_time, full_status = measure(full_check, args.repeat, cib_xml, node, resource)
+        targeted_time, targeted_status = measure(targeted_check, args.repeat, cib_xml, node, resource)
+        if full_status != targeted_status:
+            sys.stdout.write('ERROR: status differs on %s: %s %s\n' % (node, full_status, targeted_status))
+            sys.exit(1)
+        sys.stdout.write('%-24s full: %8.2f ms targeted: %8.3f ms speedup: %6.0fx\n' % (
+            node, full_time * 1000, targeted_time * 1000, full_time / targeted_time))
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+Memory used by decoded CIB nodes: slots records against per-op attribute dicts
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from cib import CIB, Record, iterparse, StringIO
+import synthetic
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+class Quiet:
+    def debug(self, msg='', debug=1, offset=None):
+        pass
+
+
+def decode_records(cib_xml):
+    cib = CIB(Quiet())
+    cib.cib_xml = cib_xml
+    cib.decode_lrm()
+    return cib.nodes
+
+
+def decode_dicts(cib_xml):
+    """
+    The previous decoder: every op and resource is a dict of attribute strings
+    """
+    nodes = {}
+    node_data = None
+    resource_data = None
+    for event, element in iterparse(StringIO(cib_xml), events=('start', 'end')):
+        tag = element.tag
+        if event == 'start':
+            if tag == 'lrm' and 'id' in element.attrib:
+                node_data = {'id': element.attrib['id'], 'resources': {}}
+            elif tag == 'lrm_resource' and node_data is not None and 'id' in element.attrib:
+                resource_data = dict(element.attrib)
+                resource_data['ops'] = []
+            continue
+        if tag == 'lrm_rsc_op' and resource_data is not None and 'id' in element.attrib:
+            resource_data['ops'].append(dict(element.attrib))
+        elif tag == 'lrm_resource' and resource_data is not None:
+            resource_data['ops'].sort(key=lambda op: int(op.get('call-id', 0)))
+            resource_data['status'] = '?'
+            node_data['resources'][resource_data['id']] = resource_data
+            resource_data = None
+        elif tag == 'lrm' and node_data is not None:
+            nodes[node_data['id']] = node_data
+            node_data = None
+        element.clear()
+    return nodes
+
+
+def deep_size(structure):
+    """
+    Size of all objects reachable from the structure, shared objects are counted once
+    """
+    seen = set()
+    size = 0
+    stack = [structure]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+        elif isinstance(item, Record):
+            stack.extend(getattr(item, slot) for slot in item.__slots__)
+            stack.append(item.extra)
+    return size
+
+
+def measure(function, cib_xml):
+    gc.collect()
+    if tracemalloc:
+        tracemalloc.start()
+    time_start = time.time()
+    nodes = function(cib_xml)
+    elapsed = time.time() - time_start
+    if tracemalloc:
+        allocated = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    else:
+        allocated = deep_size(nodes)
+    return nodes, allocated, elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--nodes", help="number of nodes", type=int, default=200)
+    parser.add_argument("-o", "--ops", help="copies of every op", type=int, default=20)
+    args = parser.parse_args()
+
+    cib_xml = synthetic.scaled_cib(args.nodes, args.ops)
+    sys.stdout.write('CIB: %.1f MB, %d nodes\n' % (len(cib_xml) / 1024.0 / 1024.0, args.nodes))
+    if tracemalloc:
+        sys.stdout.write('Memory: tracemalloc\n')
+    else:
+        sys.stdout.write('Memory: size of reachable objects (no tracemalloc)\n')
+
+    results = {}
+    for name, function in [('dicts', decode_dicts), ('records', decode_records)]:
+        nodes, allocated, elapsed = measure(function, cib_xml)
+        results[name] = nodes
+        sys.stdout.write('%-8s %10.1f MB %8.3fs\n' % (name, allocated / 1024.0 / 1024.0, elapsed))
+
+    ops = [op.to_dict() for node in results['records'].values() for resource in node['resources'].values() for op in resource.ops]
+    old_ops = [op for node in results['dicts'].values() for resource in node['resources'].values() for op in resource['ops']]
+    if sorted(ops) != sorted(old_ops):
+        sys.stdout.write('ERROR: decoded ops differ!\n')
+        sys.exit(1)
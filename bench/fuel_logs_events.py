@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Turn a large synthetic astute.log into JSON lines events, compare the speed
+with the text output and with decoding the payload of every record before
+filtering. Every mode runs in its own process, so the peak RSS belongs to it alone.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import synthetic
+
+
+class Output:
+    """
+    Stands for stdout, counts the lines and checks that they are JSON events
+    """
+
+    def __init__(self, check):
+        self.check = check
+        self.lines = 0
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        for line in data.splitlines():
+            self.lines += 1
+            if self.check and line:
+                event = json.loads(line)
+                if event['type'] == 'rpc_cast' and not event['task_uuid']:
+                    raise StandardError('No task uuid in: %s' % line)
+
+
+def run_parser(mode, path):
+    """
+    Parse the log in this process and report the results as one line
+    """
+    import fuel_logs
+    astute_log = fuel_logs.AstuteLog
+    output = Output(mode != 'text')
+    stdout = sys.stdout
+    sys.stdout = output
+    fuel_logs.LogParser.json_lines = mode != 'text'
+    time_start = time.time()
+    log = open(path)
+    if mode == 'eager':
+        # decode every record, as if the events were made before filtering
+        classify = astute_log.rules.classify
+        for record in astute_log.records(log):
+            event = astute_log.event(record, None, path)
+            for name in classify(record):
+                event['type'] = name
+                print astute_log.dumps(event)
+    else:
+        astute_log.parse(log, path)
+    log.close()
+    duration = time.time() - time_start
+    sys.stdout = stdout
+    sys.stdout.write('%f %d %d %d\n' % (duration, output.lines, output.size,
+                                        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--size", help="log size in MB", type=int, default=128)
+    parser.add_argument("-m", "--modes", help="outputs to make", nargs='+', default=['text', 'json', 'eager'])
+    parser.add_argument("--run", help=argparse.SUPPRESS, nargs=2, metavar=('MODE', 'PATH'))
+    args = parser.parse_args()
+
+    if args.run:
+        run_parser(*args.run)
+        sys.exit(0)
+
+    path = os.path.join(tempfile.mkdtemp(), 'astute.log')
+    records = synthetic.write_log(path, lambda: synthetic.astute_records(deployments=20, nodes=50),
+                                  args.size * 1024 * 1024)
+    size = os.path.getsize(path)
+    sys.stdout.write('log: %.1f MB, %d records\n' % (size / 1024.0 / 1024.0, records))
+
+    lines = {}
+    for mode in args.modes:
+        process = subprocess.Popen([sys.executable, __file__, '--run', mode, path], stdout=subprocess.PIPE)
+        result = process.communicate()[0].split()
+        if process.returncode or len(result) != 4:
+            sys.stdout.write('%-6s failed\n' % mode)
+            continue
+        duration, output_lines, output_size, max_rss = result
+        lines[mode] = int(output_lines)
+        sys.stdout.write('%-6s %8.1f MB/s %10.1f MB peak RSS %8d lines %12d bytes of output\n' % (
+            mode, size / 1024.0 / 1024.0 / float(duration), int(max_rss) / 1024.0, int(output_lines),
+            int(output_size)))
+
+    os.unlink(path)
+    os.rmdir(os.path.dirname(path))
+
+    if len(set(lines.values())) > 1:
+        sys.stdout.write('ERROR: the modes printed different numbers of records!\n')
+        sys.exit(1)
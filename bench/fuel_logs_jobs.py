@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+Run fuel_logs.py over generated snapshots with different --jobs and compare
+the wall-clock time and the output with the sequential run
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+from fuel_logs_snapshot import build_snapshot
+
+script = synthetic.sample_path('../fuel_logs.py')
+
+
+def run(arguments):
+    time_start = time.time()
+    output = subprocess.check_output([sys.executable, script] + arguments)
+    return time.time() - time_start, hashlib.md5(output).hexdigest()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--snapshots", help="number of snapshots", type=int, default=4)
+    parser.add_argument("-n", "--nodes", help="nodes in every snapshot", type=int, default=40)
+    parser.add_argument("-l", "--lines", help="lines of every puppet-apply.log", type=int, default=20000)
+    parser.add_argument("-j", "--jobs", help="numbers of jobs to try", type=int, nargs='+',
+                        default=sorted(set([1, 2, 4, 8, multiprocessing.cpu_count()])))
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    compressed = []
+    for number in xrange(args.snapshots):
+        path = os.path.join(directory, 'snapshot-%d.tar.gz' % number)
+        build_snapshot(path, args.nodes, args.nodes * 10, args.lines, 20)
+        compressed.append(path)
+    # one big uncompressed snapshot is split into tasks by logs
+    uncompressed = [os.path.join(directory, 'snapshot.tar')]
+    build_snapshot(uncompressed[0] + '.gz', args.nodes * args.snapshots, args.nodes * 10, args.lines, 20)
+    subprocess.check_call(['gzip', '-d', uncompressed[0] + '.gz'])
+
+    sys.stdout.write('%d CPUs, %d snapshots of %d nodes\n' % (multiprocessing.cpu_count(), args.snapshots, args.nodes))
+    if multiprocessing.cpu_count() == 1:
+        sys.stdout.write('WARNING: there is only one CPU, no speedup can be measured\n')
+    failed = False
+    # with more jobs than snapshots the compressed ones are whole tasks and the uncompressed one is split
+    mixed = compressed[:2] + uncompressed
+    for name, snapshots in (('per snapshot', compressed), ('per log', uncompressed), ('mixed', mixed)):
+        sequential = None
+        for jobs in args.jobs:
+            duration, digest = run(['--jobs', str(jobs)] + snapshots)
+            if sequential is None:
+                sequential = duration, digest
+            if digest != sequential[1]:
+                failed = True
+            sys.stdout.write('%-13s jobs: %2d %8.2f s  speedup: %5.2f%s\n' % (
+                name, jobs, duration, sequential[0] / duration, '' if digest == sequential[1] else '  OUTPUT DIFFERS'))
+
+    shutil.rmtree(directory)
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Classify Astute records with the compiled rule set and with the old
+per-method substring checks, with the default rules and with many rules
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import synthetic
+import fuel_logs
+from fuel_logs_stream import LegacyAstuteLog, Digest
+
+
+class RecordsParser(fuel_logs.LogParser):
+    """
+    Takes the list of records as it is
+    """
+
+    @classmethod
+    def records(cls, content):
+        return content
+
+
+def many_rules(number):
+    """
+    The default rules and more rules with words which are not in the log
+    """
+    rules = list(fuel_logs.DEFAULT_RULES['astute'])
+    for rule in xrange(number - len(rules)):
+        rules.append({'name': 'rule_%d' % rule, 'include': ['Missing word %d' % rule],
+                      'exclude': ['other word %d' % rule]})
+    return rules
+
+
+def scan_rules(records, rules):
+    """
+    The old way with any number of rules: every check scans the record again
+    """
+    for record in records:
+        for rule in rules:
+            if not any(pattern in record for pattern in rule['include']):
+                continue
+            if any(pattern in record for pattern in rule.get('exclude', [])):
+                continue
+            print record.strip()
+
+
+def measure(name, parse, records, size):
+    output = Digest()
+    stdout = sys.stdout
+    sys.stdout = output
+    time_start = time.time()
+    parse(records)
+    duration = time.time() - time_start
+    sys.stdout = stdout
+    sys.stdout.write('%-30s %8.1f MB/s %10.0f records/s\n' % (
+        name, size / 1024.0 / 1024.0 / duration, len(records) / duration))
+    return output.digest.hexdigest()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--deployments", help="number of deployments in the log", type=int, default=40)
+    parser.add_argument("-n", "--rules", help="number of rules of the big rule set", type=int, default=30)
+    args = parser.parse_args()
+
+    records = list(fuel_logs.AstuteLog.each_record(fuel_logs.each_line(
+        ''.join(synthetic.astute_records(deployments=args.deployments, nodes=50)))))
+    size = sum(len(record) for record in records)
+    sys.stdout.write('%d records, %.1f MB\n' % (len(records), size / 1024.0 / 1024.0))
+
+    def legacy(records):
+        for record in records:
+            LegacyAstuteLog.rpc_call(record)
+            LegacyAstuteLog.rpc_cast(record)
+            LegacyAstuteLog.task_status(record)
+
+    def compiled(rules):
+        rule_set = fuel_logs.RuleSet(rules)
+
+        def parse(records):
+            RecordsParser.rules = rule_set
+            RecordsParser.parse(records)
+        return parse
+
+    failed = False
+    default_rules = fuel_logs.DEFAULT_RULES['astute']
+    big_rules = many_rules(args.rules)
+    results = [
+        (measure('methods, 3 rules', legacy, records, size),
+         measure('rule set, 3 rules', compiled(default_rules), records, size)),
+        (measure('substrings, %d rules' % len(big_rules), lambda records: scan_rules(records, big_rules),
+                 records, size),
+         measure('rule set, %d rules' % len(big_rules), compiled(big_rules), records, size)),
+    ]
+    for old, new in results:
+        if old != new:
+            sys.stdout.write('ERROR: the outputs differ!\n')
+            sys.exit(1)
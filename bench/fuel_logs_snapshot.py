@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""
+Find and parse the logs of a generated compressed snapshot: the old double
+getmembers scan against the one-pass stream and the saved member index
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import synthetic
+import fuel_logs
+
+
+class LegacyFuelSnapshot:
+    """
+    The old lookup: every kind of log scans all members of the archive
+    """
+
+    def __init__(self):
+        self.snapshot = None
+
+    def open_fuel_snapshot(self, snapshot):
+        self.snapshot = tarfile.open(snapshot)
+
+    def close_fuel_snapshot(self):
+        self.snapshot.close()
+
+    def astute_log(self):
+        for log in self.snapshot.getmembers():
+            if not log.isfile():
+                continue
+            if log.name.endswith('/astute.log'):
+                return log
+
+    def parse_astute_log(self):
+        astute_log = self.astute_log()
+        if not astute_log:
+            return
+        fuel_logs.AstuteLog.parse(self.snapshot.extractfile(astute_log))
+
+    def puppet_logs(self):
+        for log in self.snapshot.getmembers():
+            if not log.isfile():
+                continue
+            if log.name.endswith('/puppet-apply.log'):
+                yield log
+
+    def parse_puppet_logs(self):
+        for log in self.puppet_logs():
+            print ">>> %s" % log.name
+            fuel_logs.PuppetLog.parse(self.snapshot.extractfile(log))
+
+
+class Lines:
+    """
+    Stands for stdout and keeps the sorted output lines for comparison
+    """
+
+    def __init__(self):
+        self.data = []
+
+    def write(self, data):
+        self.data.append(data)
+
+    def digest(self):
+        return hashlib.md5(''.join(sorted(''.join(self.data).splitlines(True)))).hexdigest()
+
+
+def add_member(archive, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = 1400000000
+    archive.addfile(info, StringIO(data))
+
+
+def build_snapshot(path, nodes, fillers, lines, filler_lines):
+    """
+    Write a gzipped snapshot with a puppet-apply.log of every node, small
+    files around them and the astute.log at the end
+    """
+    archive = tarfile.open(path, 'w:gz')
+    puppet_log = ''.join(synthetic.puppet_lines(lines))
+    for node in xrange(nodes):
+        for filler in xrange(fillers / nodes):
+            # checksums do not compress well, like most of the files of real snapshots
+            data = ''.join(hashlib.sha1('%d-%d-%d' % (node, filler, line)).hexdigest() + '\n'
+                           for line in xrange(filler_lines))
+            add_member(archive, 'snapshot/node-%d/var/lib/file-%d' % (node, filler), data)
+        add_member(archive, 'snapshot/node-%d/var/log/puppet-apply.log' % node, puppet_log)
+    add_member(archive, 'snapshot/master/var/log/docker-logs/astute.log',
+               ''.join(synthetic.astute_records(deployments=5, nodes=nodes)))
+    archive.close()
+
+
+def run(name, parse):
+    output = Lines()
+    stdout = sys.stdout
+    sys.stdout = output
+    time_start = time.time()
+    parse()
+    duration = time.time() - time_start
+    sys.stdout = stdout
+    sys.stdout.write('%-14s %8.2f s\n' % (name, duration))
+    return output.digest()
+
+
+def parse_random_access(snapshot):
+    def parse():
+        snapshot.open_fuel_snapshot(path)
+        snapshot.parse_astute_log()
+        snapshot.parse_puppet_logs()
+        snapshot.close_fuel_snapshot()
+    return parse
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--nodes", help="number of nodes", type=int, default=100)
+    parser.add_argument("-f", "--fillers", help="number of other files", type=int, default=10000)
+    parser.add_argument("-F", "--filler-lines", help="lines of every other file", type=int, default=200)
+    parser.add_argument("-l", "--lines", help="lines of every puppet-apply.log", type=int, default=5000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'snapshot.tar.gz')
+    build_snapshot(path, args.nodes, args.fillers, args.lines, args.filler_lines)
+    sys.stdout.write('snapshot: %.1f MB, %d nodes, %d other files\n' % (
+        os.path.getsize(path) / 1024.0 / 1024.0, args.nodes, args.fillers))
+
+    indexed = fuel_logs.FuelSnapshot(use_index=True)
+    digests = [
+        run('double scan', parse_random_access(LegacyFuelSnapshot())),
+        run('one scan', parse_random_access(fuel_logs.FuelSnapshot())),
+        run('stream', lambda: fuel_logs.FuelSnapshot().parse_stream(path)),
+        run('index, build', parse_random_access(indexed)),
+        run('index, saved', parse_random_access(indexed)),
+    ]
+    shutil.rmtree(directory)
+
+    if len(set(digests)) != 1:
+        sys.stdout.write('ERROR: the outputs differ!\n')
+        sys.exit(1)
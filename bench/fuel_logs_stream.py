@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+Parse a large synthetic astute.log with the streaming parser and with the old
+parser which reads the whole file, compare the output, peak RSS and throughput.
+Every parser runs in its own process, so the peak RSS belongs to it alone.
+"""
+import argparse
+import hashlib
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import synthetic
+
+
+class LegacyAstuteLog:
+    """
+    The old parser: the file is read at once and records are built with +=
+    """
+
+    @classmethod
+    def parse(cls, content):
+        if type(content) == file:
+            content = content.read()
+        if type(content) == str:
+            content = content.splitlines()
+        for record in cls.each_record(content):
+            cls.rpc_call(record)
+            cls.rpc_cast(record)
+            cls.task_status(record)
+
+    @classmethod
+    def each_record(cls, content):
+        record = ''
+        date_regexp = re.compile('^\d+-\d+-\S+\s')
+        for line in content:
+            if re.match(date_regexp, line):
+                yield record
+                record = line
+            else:
+                record += line
+        yield record
+
+    @classmethod
+    def rpc_call(cls, record):
+        if 'Processing RPC call' in record:
+            print record.strip()
+
+    @classmethod
+    def rpc_cast(cls, record):
+        if 'Casting message to Nailgun' in record:
+            if 'deploying' in record:
+                return
+            if 'provisioning' in record:
+                return
+            print record.strip()
+
+    @classmethod
+    def task_status(cls, record):
+        if 'Task' in record:
+            if 'deploying' in record:
+                return
+            print record.strip()
+
+
+class Digest:
+    """
+    Stands for stdout and keeps only a digest of the output
+    """
+
+    def __init__(self):
+        self.digest = hashlib.md5()
+        self.size = 0
+
+    def write(self, data):
+        self.digest.update(data)
+        self.size += len(data)
+
+
+def run_parser(mode, path):
+    """
+    Parse the log in this process and report the results as one line
+    """
+    import fuel_logs
+    output = Digest()
+    stdout = sys.stdout
+    sys.stdout = output
+    time_start = time.time()
+    log = open(path)
+    if mode == 'stream':
+        fuel_logs.AstuteLog.parse(log)
+    elif mode == 'legacy':
+        LegacyAstuteLog.parse(log)
+    else:
+        # the old parser iterating the lines, like it did with tarfile members
+        LegacyAstuteLog.parse(line for line in log)
+    log.close()
+    duration = time.time() - time_start
+    sys.stdout = stdout
+    sys.stdout.write('%s %f %d %d\n' % (output.digest.hexdigest(), duration, output.size,
+                                        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--size", help="log size in MB", type=int, default=256)
+    parser.add_argument("-m", "--modes", help="parsers to run", nargs='+',
+                        default=['stream', 'legacy-lines', 'legacy'])
+    parser.add_argument("--run", help=argparse.SUPPRESS, nargs=2, metavar=('MODE', 'PATH'))
+    args = parser.parse_args()
+
+    if args.run:
+        run_parser(*args.run)
+        sys.exit(0)
+
+    path = os.path.join(tempfile.mkdtemp(), 'astute.log')
+    records = synthetic.write_log(path, lambda: synthetic.astute_records(deployments=20, nodes=50),
+                                  args.size * 1024 * 1024)
+    size = os.path.getsize(path)
+    sys.stdout.write('log: %.1f MB, %d records\n' % (size / 1024.0 / 1024.0, records))
+
+    digests = {}
+    for mode in args.modes:
+        process = subprocess.Popen([sys.executable, __file__, '--run', mode, path], stdout=subprocess.PIPE)
+        result = process.communicate()[0].split()
+        if process.returncode or len(result) != 4:
+            sys.stdout.write('%-13s failed\n' % mode)
+            continue
+        digest, duration, output_size, max_rss = result
+        digests[mode] = digest
+        sys.stdout.write('%-13s %8.1f MB/s %10.1f MB peak RSS %10d bytes of output\n' % (
+            mode, size / 1024.0 / 1024.0 / float(duration), int(max_rss) / 1024.0, int(output_size)))
+
+    os.unlink(path)
+    os.rmdir(os.path.dirname(path))
+
+    if 'stream' in digests and 'legacy-lines' in digests and digests['stream'] != digests['legacy-lines']:
+        sys.stdout.write('ERROR: the streaming parser output differs!\n')
+        sys.exit(1)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Collect Galera data of a cluster through the stand-in driver:
+sequential and concurrent collection time and the number of opened
+connections when the members are polled many times
+"""
+import argparse
+import imp
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import synthetic
+import galera_driver
+
+galera_status = imp.load_source('galera_status', synthetic.sample_path('../galera-status.py'))
+
+
+def members(count, config):
+    result = []
+    for number in xrange(count):
+        member = galera_status.Galera('node-%d.domain.tld' % (number + 1), 'galera_driver')
+        member.auth_files = [config]
+        result.append(member)
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--nodes", help="number of cluster members", type=int, default=5)
+    parser.add_argument("-D", "--delay", help="delay of every query in seconds", type=float, default=0.02)
+    parser.add_argument("-r", "--repeat", help="number of polls", type=int, default=10)
+    args = parser.parse_args()
+
+    os.environ['GALERA_DELAY'] = str(args.delay)
+    config = tempfile.NamedTemporaryFile(suffix='.cnf')
+
+    cluster = galera_status.Cluster(members(args.nodes, config.name))
+    time_start = time.time()
+    for number in xrange(args.repeat):
+        for member in cluster.members:
+            member.get_galera_data()
+    sequential_time = (time.time() - time_start) / args.repeat
+    sequential_connections = galera_driver.connections[0]
+
+    cluster = galera_status.Cluster(members(args.nodes, config.name))
+    time_start = time.time()
+    for number in xrange(args.repeat):
+        cluster.collect()
+    concurrent_time = (time.time() - time_start) / args.repeat
+    concurrent_connections = galera_driver.connections[0] - sequential_connections
+
+    if cluster.errors or len(cluster.data) != args.nodes:
+        sys.stdout.write('ERROR: %s\n' % cluster.errors)
+        sys.exit(1)
+
+    sys.stdout.write('nodes: %d, query delay: %.0f ms, polls: %d\n' % (args.nodes, args.delay * 1000, args.repeat))
+    sys.stdout.write('sequential: %8.1f ms/poll, %d connections\n' % (sequential_time * 1000, sequential_connections))
+    sys.stdout.write('concurrent: %8.1f ms/poll, %d connections\n' % (concurrent_time * 1000, concurrent_connections))
+    sys.stdout.write('diverging:  %s\n' % ', '.join(
+        '%s: %s' % (host, ','.join(sorted(keys))) for host, keys in sorted(cluster.divergence().items()) if keys))
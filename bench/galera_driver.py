@@ -0,0 +1,105 @@
+"""
+A stand-in DB-API driver for galera-status.py --driver galera_driver.
+Answers "show variables/status like 'wsrep_%'" with recorded YAML samples.
+
+GALERA_SAMPLES is a directory with <host>.yaml or <short host name>.yaml
+files or a YAML file which is used for every host, samples/galera-cluster/
+by default.
+Hosts without their own file get one of the files by a hash of the host name.
+GALERA_DELAY delays every query by this many seconds.
+"""
+import os
+import threading
+import time
+
+import synthetic
+
+loaded = {}
+connections = [0]
+queries = [0]
+counter_lock = threading.Lock()
+
+
+def load_samples(host):
+    """
+    Get the recorded data of a host
+    @param host: Host name
+    @return: Data dict
+    """
+    from yaml import safe_load
+    samples = os.environ.get('GALERA_SAMPLES', synthetic.sample_path('galera-cluster'))
+    if os.path.isdir(samples):
+        path = os.path.join(samples, '%s.yaml' % host)
+        if not os.path.isfile(path):
+            path = os.path.join(samples, '%s.yaml' % host.split('.')[0])
+        if not os.path.isfile(path):
+            files = sorted(name for name in os.listdir(samples) if name.endswith('.yaml'))
+            path = os.path.join(samples, files[hash(host) % len(files)])
+    else:
+        path = samples
+    if path not in loaded:
+        stream = open(path)
+        loaded[path] = safe_load(stream)
+        stream.close()
+    return loaded[path]
+
+
+class Cursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+
+    def execute(self, query):
+        time.sleep(float(os.environ.get('GALERA_DELAY', 0)))
+        with counter_lock:
+            queries[0] += 1
+        words = query.lower().split()
+        data = load_samples(self.connection.host)
+        if words[:2] == ['show', 'variables']:
+            keys = [key for key in data if key in self.connection.variables]
+        elif words[:2] == ['show', 'status']:
+            keys = [key for key in data if key not in self.connection.variables]
+        else:
+            raise Error('Unsupported query: %s' % query)
+        self.rows = [(key, str(data[key])) for key in sorted(keys)]
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def close(self):
+        self.rows = []
+
+
+class Connection:
+    # the keys which MySQL reports as variables, the rest are status values
+    variables = frozenset([
+        'wsrep_OSU_method', 'wsrep_auto_increment_control', 'wsrep_causal_reads', 'wsrep_certify_nonPK',
+        'wsrep_cluster_address', 'wsrep_cluster_name', 'wsrep_convert_LOCK_to_trx', 'wsrep_data_home_dir',
+        'wsrep_debug', 'wsrep_desync', 'wsrep_drupal_282555_workaround', 'wsrep_forced_binlog_format',
+        'wsrep_load_data_splitting', 'wsrep_log_conflicts', 'wsrep_max_ws_rows', 'wsrep_max_ws_size',
+        'wsrep_mysql_replication_bundle', 'wsrep_node_address', 'wsrep_node_incoming_address',
+        'wsrep_node_name', 'wsrep_on', 'wsrep_preordered', 'wsrep_provider', 'wsrep_provider_options',
+    ])
+
+    def __init__(self, host, **options):
+        self.host = host
+        self.options = options
+        with counter_lock:
+            connections[0] += 1
+
+    def cursor(self):
+        return Cursor(self)
+
+    def close(self):
+        pass
+
+
+class Error(StandardError):
+    pass
+
+
+def connect(host='localhost', **options):
+    return Connection(host, **options)
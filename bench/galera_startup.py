@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+Measure the wall-clock time of galera-status.py runs in every output mode
+and which heavy modules each mode imports.
+Python 2 has no "-X importtime", so the script is run through a wrapper
+which times every top level import instead.
+The "database" mode uses the bench/galera_driver.py stand-in, which reads
+its answers with yaml, so yaml shows up there but MySQLdb would not.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+
+script = synthetic.sample_path('../galera-status.py')
+node = synthetic.sample_path('galera-cluster/node-1.yaml')
+cluster = [synthetic.sample_path('galera-cluster/node-%d.yaml' % number) for number in (1, 2, 3)]
+
+heavy_modules = ('yaml', 'jinja2', 'MySQLdb', 'json', 'multiprocessing', 'galera_driver')
+
+# runs the script with an __import__ which measures the time of imports from the script itself
+wrapper = """
+import os, sys, time, __builtin__
+original_import = __builtin__.__import__
+times = {}
+depth = [0]
+def timed_import(name, *args, **kwargs):
+    depth[0] += 1
+    time_start = time.time()
+    try:
+        return original_import(name, *args, **kwargs)
+    finally:
+        depth[0] -= 1
+        if depth[0] == 0:
+            root = name.split('.')[0]
+            times[root] = times.get(root, 0) + time.time() - time_start
+__builtin__.__import__ = timed_import
+script = sys.argv[1]
+sys.argv = sys.argv[1:]
+# like "python script" does, the modules next to the script are importable
+sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+try:
+    execfile(script, {'__name__': '__main__', '__file__': script})
+finally:
+    sys.stdout.flush()
+    sys.stderr.write('IMPORTS %r\\n' % times)
+"""
+
+
+def run(arguments, repeat, environment):
+    """
+    Run the script several times
+    @param arguments: Command line arguments
+    @param repeat: Number of runs
+    @param environment: Environment of the runs
+    @return: The best wall-clock time and import times of the last run
+    """
+    best = None
+    imports = None
+    for _ in xrange(repeat):
+        time_start = time.time()
+        subprocess.check_call([sys.executable, script] + arguments, env=environment,
+                              stdout=open(os.devnull, 'w'), stderr=open(os.devnull, 'w'))
+        duration = time.time() - time_start
+        if best is None or duration < best:
+            best = duration
+    process = subprocess.Popen([sys.executable, '-c', wrapper, script] + arguments, env=environment,
+                               stdout=open(os.devnull, 'w'), stderr=subprocess.PIPE)
+    errors = process.communicate()[1]
+    if process.returncode != 0:
+        raise StandardError('%s %s exited with code %d:\n%s' % (script, ' '.join(arguments), process.returncode, errors))
+    for line in errors.splitlines():
+        if line.startswith('IMPORTS '):
+            imports = eval(line[len('IMPORTS '):])
+    return best, imports
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--repeat", help="runs of every mode", type=int, default=10)
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp()
+    config = os.path.join(cache_dir, 'my.cnf')
+    open(config, 'w').close()
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)),
+                                                              os.environ.get('PYTHONPATH')]))
+
+    modes = [
+        ('json, database', ['--json', '--driver', 'galera_driver', '-c', config]),
+        ('json, file', ['--json', '-f', node]),
+        ('yaml, file', ['--yaml', '-f', node]),
+        ('plain, file', ['--plain', '-f', node]),
+        ('report, cold cache', ['-f', node, '--template-cache', os.path.join(cache_dir, 'cold')]),
+        ('report, warm cache', ['-f', node, '--template-cache', os.path.join(cache_dir, 'warm')]),
+        ('cluster, files', ['-f' + path for path in cluster]),
+    ]
+    # fill the warm cache
+    run(modes[5][1], 1, environment)
+
+    sys.stdout.write('%-20s %10s  %s\n' % ('mode', 'wall ms', 'heavy imports (ms)'))
+    for name, arguments in modes:
+        if name.endswith('cold cache'):
+            # every run starts with an empty cache
+            best = None
+            for _ in xrange(args.repeat):
+                shutil.rmtree(os.path.join(cache_dir, 'cold'), ignore_errors=True)
+                duration, imports = run(arguments, 1, environment)
+                best = duration if best is None else min(best, duration)
+            shutil.rmtree(os.path.join(cache_dir, 'cold'), ignore_errors=True)
+            imports = run(arguments, 1, environment)[1]
+        else:
+            best, imports = run(arguments, args.repeat, environment)
+        loaded = ', '.join('%s %.1f' % (module, imports[module] * 1000)
+                           for module in heavy_modules if module in (imports or {}))
+        sys.stdout.write('%-20s %10.1f  %s\n' % (name, best * 1000, loaded or '-'))
+
+    shutil.rmtree(cache_dir)
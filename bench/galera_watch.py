@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Replay wsrep snapshots with growing counters through galera-status.py --watch --replay,
+check the rates and averages and measure the cost of a sample
+"""
+import argparse
+import imp
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import synthetic
+
+script = synthetic.sample_path('../galera-status.py')
+galera_status = imp.load_source('galera_status', script)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-t", "--steps", help="number of snapshots", type=int, default=200)
+    parser.add_argument("-H", "--history", help="ring buffer size", type=int, default=60)
+    parser.add_argument("-W", "--window", help="samples to average over", type=int, default=10)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    files = []
+    for number, snapshot in enumerate(synthetic.galera_snapshots(args.steps)):
+        path = os.path.join(directory, 'sample-%04d.yaml' % number)
+        stream = open(path, 'w')
+        stream.write(snapshot)
+        stream.close()
+        files.append(path)
+
+    galera = galera_status.Galera()
+    history = galera_status.History(args.history)
+    load_time = 0
+    sample_time = 0
+    for number, path in enumerate(files):
+        time_start = time.time()
+        galera.load_from_yaml(path)
+        time_loaded = time.time()
+        history.add(float(number), galera.data)
+        stats = history.stats(args.window)
+        sample_time += time.time() - time_loaded
+        load_time += time_loaded - time_start
+
+    command = [sys.executable, script, '--watch', '1', '--replay', '--json',
+               '--history', str(args.history), '--window', str(args.window)] + ['-f%s' % path for path in files]
+    time_start = time.time()
+    lines = subprocess.check_output(command).splitlines()
+    run_time = time.time() - time_start
+    shutil.rmtree(directory)
+
+    expected = {
+        'wsrep_replicated_bytes': 10000.0,
+        'wsrep_received_bytes': 2000.0,
+        'wsrep_local_commits': 50.0,
+        'wsrep_local_cert_failures': 1.0,
+        'flow_control_paused_ratio': 0.05,
+        'wsrep_local_recv_queue': 2.0,
+        'interval': float(min(args.window, args.history) - 1),
+    }
+    if len(lines) != args.steps:
+        sys.stdout.write('ERROR: %d lines for %d samples!\n' % (len(lines), args.steps))
+        sys.exit(1)
+    for name, result in (('History', stats), ('--watch', json.loads(lines[-1])['stats'])):
+        for field, value in expected.iteritems():
+            if abs(result[field] - value) > 1e-9:
+                sys.stdout.write('ERROR: %s %s is %s, not %s!\n' % (name, field, result[field], value))
+                sys.exit(1)
+
+    ring_bytes = (history.times.buffer_info()[1] * history.times.itemsize +
+                  history.values.buffer_info()[1] * history.values.itemsize)
+    sys.stdout.write('samples: %d, history: %d, window: %d\n' % (args.steps, args.history, args.window))
+    sys.stdout.write('load:     %8.3f ms/sample\n' % (load_time * 1000 / args.steps))
+    sys.stdout.write('history:  %8.3f ms/sample\n' % (sample_time * 1000 / args.steps))
+    sys.stdout.write('replay:   %8.3f ms/sample end to end\n' % (run_time * 1000 / args.steps))
+    sys.stdout.write('ring:     %8d bytes\n' % ring_bytes)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Replay CSVs with growing counters through the stand-in socket and one
+interactive session, check the rates of the collector and measure the poll cost
+"""
+import argparse
+import imp
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import synthetic
+from haproxy_server import StatsServer
+
+haproxy_status = imp.load_source('haproxy_status', synthetic.sample_path('../haproxy-status.py'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rows", help="number of CSV rows", type=int, default=10000)
+    parser.add_argument("-t", "--steps", help="number of polls", type=int, default=20)
+    parser.add_argument("-H", "--history", help="ring buffer size", type=int, default=10)
+    args = parser.parse_args()
+
+    csv_files = synthetic.evolving_stats(args.steps, args.rows)
+    path = os.path.join(tempfile.mkdtemp(), 'stats.sock')
+    server = StatsServer(path, csv_files).start()
+
+    sys.argv = ['haproxy-status.py', '--socket', path, '--watch', '1']
+    interface = haproxy_status.Interface()
+    collector = haproxy_status.Collector(args.history)
+
+    fetch_time = 0
+    parse_time = 0
+    collect_time = 0
+    for step in xrange(args.steps):
+        time_start = time.time()
+        csv = interface.get_from_session()
+        time_fetched = time.time()
+        status = haproxy_status.Status(interface, csv)
+        time_parsed = time.time()
+        # one poll per second of the virtual time
+        collector.add(float(step), status)
+        collector.annotate(status.data, 5)
+        time_collected = time.time()
+        fetch_time += time_fetched - time_start
+        parse_time += time_parsed - time_fetched
+        collect_time += time_collected - time_parsed
+
+    interface.close_session()
+    server.stop()
+    os.rmdir(os.path.dirname(path))
+
+    if server.request != args.steps:
+        sys.stdout.write('ERROR: %d requests for %d polls!\n' % (server.request, args.steps))
+        sys.exit(1)
+
+    expected = {'stot': 10.0, 'bin': 1000.0, 'bout': 5000.0, 'hrsp_5xx': 1.0, 'error_ratio': 0.1, 'interval': 5.0}
+    for service in status.data.itervalues():
+        for server_element in service.itervalues():
+            for field, value in expected.iteritems():
+                if abs(server_element['rates'][field] - value) > 1e-9:
+                    sys.stdout.write('ERROR: %s rate is %s, not %s!\n' % (field, server_element['rates'][field], value))
+                    sys.exit(1)
+
+    ring_bytes = sum(series.times.buffer_info()[1] * series.times.itemsize +
+                     series.values.buffer_info()[1] * series.values.itemsize
+                     for series in collector.series.itervalues())
+
+    sys.stdout.write('servers: %d, polls: %d, history: %d\n' % (len(collector.series), args.steps, args.history))
+    sys.stdout.write('fetch:    %8.2f ms/poll\n' % (fetch_time * 1000 / args.steps))
+    sys.stdout.write('parse:    %8.2f ms/poll\n' % (parse_time * 1000 / args.steps))
+    sys.stdout.write('collect:  %8.2f ms/poll\n' % (collect_time * 1000 / args.steps))
+    sys.stdout.write('history:  %8.2f MB in ring buffers\n' % (ring_bytes / 1024.0 / 1024.0))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Diff two consecutive snapshots of a large stats table.
+lastchg grows on every row between polls like it does on a real balancer,
+and a small share of servers change status, check status or flap.
+"""
+import argparse
+import imp
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import synthetic
+
+haproxy_status = imp.load_source('haproxy_status', synthetic.sample_path('../haproxy-status.py'))
+
+
+def next_snapshot(csv, changed, interval=1):
+    """
+    Make the next poll of the stats table
+    @param csv: CSV text
+    @param changed: Share of rows to change
+    @param interval: Seconds between polls
+    @return: CSV text and the number of changed rows
+    """
+    lines = csv.splitlines()
+    columns = lines[0].lstrip('#').strip().split(',')
+    status_field = columns.index('status')
+    check_field = columns.index('check_status')
+    lastchg_field = columns.index('lastchg')
+    random.seed(0)
+    output = [lines[0]]
+    count = 0
+    for line in lines[1:]:
+        fields = line.split(',')
+        if fields[lastchg_field]:
+            fields[lastchg_field] = str(int(fields[lastchg_field]) + interval)
+        if fields[1] not in ('FRONTEND', 'BACKEND') and random.random() < changed:
+            count += 1
+            change = random.randrange(3)
+            if change == 0:
+                fields[status_field] = 'DOWN' if fields[status_field] == 'UP' else 'UP'
+            elif change == 1:
+                fields[check_field] = 'L7STS'
+            else:
+                fields[lastchg_field] = '0'
+        output.append(','.join(fields))
+    return '\n'.join(output) + '\n', count
+
+
+def naive_changes(old, new):
+    """
+    Compare every field of every server
+    """
+    events = []
+    for service_name, service in new.data.iteritems():
+        for server_name, server in service.iteritems():
+            old_server = old.data.get(service_name, {}).get(server_name, {})
+            for field in server:
+                if field != 'lastchg' and server[field] != old_server.get(field):
+                    events.append((service_name, server_name, field))
+    return events
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rows", help="number of CSV rows", type=int, default=10000)
+    parser.add_argument("-c", "--changed", help="share of changed servers", type=float, default=0.01)
+    parser.add_argument("-r", "--repeat", help="number of diffs to average", type=int, default=5)
+    args = parser.parse_args()
+
+    old_csv = synthetic.scaled_stats(args.rows)
+    new_csv, changed = next_snapshot(old_csv, args.changed)
+    old = haproxy_status.Status(None, old_csv)
+    new = haproxy_status.Status(None, new_csv)
+
+    time_start = time.time()
+    for number in xrange(args.repeat):
+        old.signatures_cache = None
+        new.signatures_cache = None
+        events = new.changes(old)
+    diff_time = (time.time() - time_start) / args.repeat
+
+    time_start = time.time()
+    for number in xrange(args.repeat):
+        naive_changes(old, new)
+    naive_time = (time.time() - time_start) / args.repeat
+
+    changed_servers = set((event['pxname'], event['svname']) for event in events)
+    if len(changed_servers) != changed:
+        sys.stdout.write('ERROR: %d servers were changed, %d were found!\n' % (changed, len(changed_servers)))
+        sys.exit(1)
+
+    sys.stdout.write('rows: %d, changed servers: %d, events: %d\n' % (args.rows, changed, len(events)))
+    sys.stdout.write('all fields:    %8.1f ms\n' % (naive_time * 1000))
+    sys.stdout.write('changes:       %8.1f ms\n' % (diff_time * 1000))
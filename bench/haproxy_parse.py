@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+Compare the header driven HAProxy CSV parser with the old nested loop parser
+"""
+import argparse
+import imp
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import synthetic
+
+haproxy_status = imp.load_source('haproxy_status', synthetic.sample_path('../haproxy-status.py'))
+
+
+def legacy_parse_csv(csv, fields):
+    """
+    The old parser: every field of every row is looked up by its number
+    """
+    status_fields = dict((name, {'number': number, 'title': name}) for number, name in enumerate(fields))
+    data = {}
+    for csv_line in csv.split("\n"):
+        if csv_line.startswith('#'):
+            continue
+        if csv_line.startswith('pxname'):
+            continue
+        csv_fields = csv_line.split(',')
+        if len(csv_fields) < len(status_fields):
+            continue
+        service_field = status_fields['pxname']
+        server_field = status_fields['svname']
+        for status_field_name in status_fields:
+            status_field = status_fields[status_field_name]
+            status_field_number = status_field['number']
+            service_field_value = csv_fields[service_field['number']]
+            server_field_value = csv_fields[server_field['number']]
+            if service_field_value not in data:
+                data[service_field_value] = {}
+            if server_field_value not in data[service_field_value]:
+                data[service_field_value][server_field_value] = {}
+            csv_field_value = csv_fields[status_field_number]
+            server = data[service_field_value][server_field_value]
+            server[status_field_name] = csv_field_value
+    return data
+
+
+def measure(function, repeat):
+    time_start = time.time()
+    for number in xrange(repeat):
+        result = function()
+    return (time.time() - time_start) / repeat, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rows", help="number of CSV rows", type=int, default=10000)
+    parser.add_argument("-r", "--repeat", help="number of parses to average", type=int, default=5)
+    args = parser.parse_args()
+
+    csv = synthetic.scaled_stats(args.rows)
+    fields = haproxy_status.Status.default_columns
+    sys.stdout.write('CSV: %d rows, %.1f MB\n' % (csv.count('\n') - 1, len(csv) / 1024.0 / 1024.0))
+
+    legacy_time, legacy_data = measure(lambda: legacy_parse_csv(csv, fields), args.repeat)
+    new_time, status = measure(lambda: haproxy_status.Status(None, csv), args.repeat)
+
+    for pxname, service in legacy_data.iteritems():
+        for svname, server in service.iteritems():
+            for field, value in server.iteritems():
+                if str(status.data[pxname][svname][field]) != value:
+                    sys.stdout.write('ERROR: %s/%s %s differs!\n' % (pxname, svname, field))
+                    sys.exit(1)
+
+    sys.stdout.write('nested loop: %10.1f ms\n' % (legacy_time * 1000))
+    sys.stdout.write('csv reader:  %10.1f ms\n' % (new_time * 1000))
+    sys.stdout.write('speedup:     %10.1fx\n' % (legacy_time / new_time))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Compare queries on the columnar stats table with the same queries
+written as loops over the nested status data
+"""
+import argparse
+import heapq
+import imp
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import synthetic
+
+haproxy_status = imp.load_source('haproxy_status', synthetic.sample_path('../haproxy-status.py'))
+
+
+def nested_rows(data):
+    for service in data.itervalues():
+        for server in service.itervalues():
+            yield server
+
+
+def nested_top(data):
+    return heapq.nlargest(20, nested_rows(data), key=lambda server: server['qcur'] if server['qcur'] != '' else -1)
+
+
+def nested_errors(data):
+    return [server for server in nested_rows(data) if server['hrsp_5xx'] != '' and server['hrsp_5xx'] > 0]
+
+
+def nested_down(data):
+    pattern = re.compile('^nova')
+    return [server for server in nested_rows(data) if server['status'] == 'DOWN' and pattern.search(server['pxname'])]
+
+
+def columnar_query(table, where, sort=None, top=None):
+    indexes = table.where(where)
+    if sort:
+        indexes = table.sort(indexes, sort, True, top)[:top]
+    return indexes
+
+
+def json_rows(csv, columns):
+    """
+    Run a JSON query of the script on the CSV
+    @param csv: CSV text
+    @param columns: Value of --columns
+    @return: Number of rows in the output
+    """
+    with tempfile.NamedTemporaryFile(suffix='.csv') as csv_file:
+        csv_file.write(csv)
+        csv_file.flush()
+        output = subprocess.check_output([sys.executable, synthetic.sample_path('../haproxy-status.py'),
+                                          '-f', csv_file.name, '--columns', columns, '-j'])
+    return sum(len(service) for service in json.loads(output).itervalues())
+
+
+def measure(function, repeat):
+    time_start = time.time()
+    for number in xrange(repeat):
+        result = function()
+    return (time.time() - time_start) / repeat, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rows", help="number of CSV rows", type=int, default=10000)
+    parser.add_argument("-r", "--repeat", help="number of queries to average", type=int, default=10)
+    args = parser.parse_args()
+
+    csv = synthetic.scaled_stats(args.rows)
+    status = haproxy_status.Status(None, csv)
+    build_time, table = measure(status.table, 1)
+
+    # every row is in the JSON output even without the pxname and svname columns
+    for columns in ('pxname,svname,bin', 'bin,scur'):
+        rows = json_rows(csv, columns)
+        if rows != table.size:
+            sys.stdout.write('ERROR: --columns %s -j: %d rows against %d!\n' % (columns, rows, table.size))
+            sys.exit(1)
+
+    queries = [
+        ('top 20 by qcur', lambda: nested_top(status.data),
+         lambda: columnar_query(table, [], 'qcur', 20)),
+        ('hrsp_5xx>0', lambda: nested_errors(status.data),
+         lambda: columnar_query(table, ['hrsp_5xx>0'])),
+        ('DOWN in ^nova', lambda: nested_down(status.data),
+         lambda: columnar_query(table, ['status=DOWN', 'pxname~^nova'])),
+    ]
+
+    sys.stdout.write('rows: %d, building the table: %.1f ms\n' % (table.size, build_time * 1000))
+    sys.stdout.write('%-20s %8s %12s %12s\n' % ('query', 'rows', 'nested, ms', 'columnar, ms'))
+    for name, nested, columnar in queries:
+        nested_time, nested_result = measure(nested, args.repeat)
+        columnar_time, columnar_result = measure(columnar, args.repeat)
+        if name != 'top 20 by qcur' and len(nested_result) != len(columnar_result):
+            sys.stdout.write('ERROR: %s: %d rows against %d!\n' % (name, len(nested_result), len(columnar_result)))
+            sys.exit(1)
+        sys.stdout.write('%-20s %8d %12.2f %12.2f\n' % (name, len(columnar_result), nested_time * 1000, columnar_time * 1000))
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Load test of haproxy-status.py --serve against the stand-in stats socket:
+scrape latency and the number of socket queries as client concurrency grows
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import synthetic
+from haproxy_server import StatsServer
+from cib_health_load import client, percentile, wait_for_server
+
+base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-p", "--port", help="server port", type=int, default=19101)
+    parser.add_argument("-c", "--clients", help="numbers of client processes", type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument("-t", "--time", help="duration of every test in seconds", type=float, default=3)
+    parser.add_argument("-u", "--path", help="request path", type=str, default='/metrics')
+    parser.add_argument("-n", "--rows", help="number of CSV rows", type=int, default=100)
+    parser.add_argument("-D", "--delay", help="answer delay of the socket in seconds", type=float, default=0.02)
+    parser.add_argument("--ttl", help="TTL of the cached stats", type=float, default=1.0)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    stats = StatsServer(os.path.join(directory, 'stats.sock'), [synthetic.scaled_stats(args.rows)], args.delay).start()
+    server = subprocess.Popen(
+        [sys.executable, 'haproxy-status.py', '--serve', '--address', '127.0.0.1', '--port', str(args.port),
+         '--socket', stats.path, '--ttl', str(args.ttl)],
+        cwd=base_dir,
+    )
+    try:
+        if not wait_for_server('127.0.0.1', args.port):
+            sys.stderr.write('Server is not responding!\n')
+            sys.exit(1)
+
+        sys.stdout.write('path: %s, rows: %d, socket delay: %.0f ms, ttl: %.1f s\n' % (
+            args.path, args.rows, args.delay * 1000, args.ttl))
+        sys.stdout.write('%8s %10s %8s %10s %10s %10s\n' % ('clients', 'requests', 'RPS', 'p50, ms', 'p99, ms', 'queries'))
+        for clients in args.clients:
+            queries = stats.request
+            pool = multiprocessing.Pool(clients)
+            time_start = time.time()
+            results = pool.map(client, [('127.0.0.1', args.port, args.path, args.time)] * clients)
+            elapsed = time.time() - time_start
+            pool.close()
+            latencies = sorted(latency for result in results for latency in result)
+            sys.stdout.write('%8d %10d %8.0f %10.2f %10.2f %10d\n' % (
+                clients, len(latencies), len(latencies) / elapsed, percentile(latencies, 0.5) * 1000,
+                percentile(latencies, 0.99) * 1000, stats.request - queries))
+    finally:
+        server.terminate()
+        server.wait()
+        stats.stop()
+        shutil.rmtree(directory)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+"""
+A stand-in for the HAProxy stats socket and the stats page.
+Answers "show stat [<iid> <type> <sid>]" with a CSV file, like HAProxy does.
+After the "prompt" command the connection stays open and every answer
+ends with an empty line and the "> " prompt. Like "stats timeout" of HAProxy,
+--idle-timeout closes such connections when no command comes for a while.
+With --port the CSV is served over HTTP at any url instead.
+"""
+import argparse
+import BaseHTTPServer
+import os
+import socket
+import SocketServer
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+
+
+def filter_stats(csv, iid=-1, types=-1, sid=-1):
+    """
+    Select rows of the stats CSV the same way "show stat <iid> <type> <sid>" does
+    @param csv: CSV text with the "# pxname,..." header
+    @param iid: Proxy id or -1 for all proxies
+    @param types: Bit mask of types: 1 - frontends, 2 - backends, 4 - servers
+    @param sid: Server id or -1 for all servers
+    @return: CSV text
+    """
+    if iid == -1 and types == -1 and sid == -1:
+        return csv
+    lines = csv.splitlines()
+    columns = lines[0].lstrip('#').strip().split(',')
+    iid_field = columns.index('iid')
+    sid_field = columns.index('sid')
+    type_field = columns.index('type')
+    selected = [lines[0]]
+    for line in lines[1:]:
+        fields = line.split(',')
+        if len(fields) <= type_field:
+            continue
+        if iid != -1 and fields[iid_field] != str(iid):
+            continue
+        if types != -1 and not types & (1 << int(fields[type_field])):
+            continue
+        if sid != -1 and fields[sid_field] != str(sid):
+            continue
+        selected.append(line)
+    return '\n'.join(selected) + '\n'
+
+
+class StatsHandler(SocketServer.StreamRequestHandler):
+    """
+    Answers one command and closes the connection, like the stats socket in non-interactive mode,
+    or keeps answering commands in the interactive mode
+    """
+
+    def answer(self, command):
+        if command[:2] != ['show', 'stat']:
+            return 'Unknown command.\n'
+        query = [int(value) for value in command[2:5]]
+        time.sleep(self.server.delay)
+        return filter_stats(self.server.next_csv(), *query)
+
+    def handle(self):
+        command = self.rfile.readline().split()
+        if command != ['prompt']:
+            self.wfile.write(self.answer(command))
+            return
+        self.wfile.write('\n> ')
+        self.wfile.flush()
+        if self.server.idle_timeout:
+            self.connection.settimeout(self.server.idle_timeout)
+        while True:
+            try:
+                command = self.rfile.readline().split()
+            except socket.timeout:
+                return
+            if not command or command == ['quit']:
+                return
+            self.wfile.write(self.answer(command) + '\n> ')
+
+
+class ServeFilesMixIn:
+    """
+    Common part of the stand-in servers
+    """
+
+    def next_csv(self):
+        """
+        Get the CSV for the next request
+        @return: CSV text
+        """
+        with self.lock:
+            csv = self.csv_files[self.request % len(self.csv_files)]
+            self.request += 1
+        return csv
+
+    def start(self):
+        """
+        Serve in a background thread
+        @return: self
+        """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+
+class StatsServer(ServeFilesMixIn, SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """
+    A UNIX socket server which serves CSV files.
+    Every "show stat" gets the next file, so the counters can change between polls.
+    """
+    daemon_threads = True
+
+    def __init__(self, path, csv_files, delay=0, idle_timeout=None):
+        if os.path.exists(path):
+            os.unlink(path)
+        SocketServer.UnixStreamServer.__init__(self, path, StatsHandler)
+        self.path = path
+        self.csv_files = csv_files
+        self.delay = delay
+        self.idle_timeout = idle_timeout
+        self.request = 0
+        self.lock = threading.Lock()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class HTTPStatsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serves the CSV at any url like the stats page with ";csv" does
+    """
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        csv = self.server.next_csv()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(csv)))
+        self.end_headers()
+        self.wfile.write(csv)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HTTPStatsServer(ServeFilesMixIn, SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    A HTTP server which serves CSV files in turn
+    """
+    daemon_threads = True
+
+    def __init__(self, port, csv_files, delay=0, address='127.0.0.1'):
+        BaseHTTPServer.HTTPServer.__init__(self, (address, port), HTTPStatsHandler)
+        self.url = 'http://%s:%d/;csv' % self.server_address
+        self.csv_files = csv_files
+        self.delay = delay
+        self.request = 0
+        self.lock = threading.Lock()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def read_files(files):
+    """
+    Read CSV files
+    @param files: List of paths
+    @return: List of CSV texts
+    """
+    data = []
+    for path in files:
+        csv = open(path)
+        data.append(csv.read())
+        csv.close()
+    return data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--socket", help="path to the socket", type=str, default='/tmp/haproxy-stats.sock')
+    parser.add_argument("-p", "--port", help="serve over HTTP on this port instead of the socket", type=int)
+    parser.add_argument("-D", "--delay", help="delay every answer by this many seconds", type=float, default=0)
+    parser.add_argument("-i", "--idle-timeout", help="close interactive sessions idle for this many seconds",
+                        type=float)
+    parser.add_argument("-n", "--rows", help="serve a synthetic CSV with this many rows", type=int)
+    parser.add_argument("-t", "--steps", help="serve this many CSVs with growing counters", type=int)
+    parser.add_argument("files", help="CSV files to serve in turn", nargs='*')
+    args = parser.parse_args()
+
+    if args.steps:
+        csv_files = synthetic.evolving_stats(args.steps, args.rows)
+    elif args.rows:
+        csv_files = [synthetic.scaled_stats(args.rows)]
+    else:
+        csv_files = read_files(args.files or [synthetic.sample_path('stats.csv')])
+
+    if args.port:
+        server = HTTPStatsServer(args.port, csv_files, args.delay)
+        sys.stdout.write('Serving %d file(s) at %s\n' % (len(csv_files), server.url))
+    else:
+        server = StatsServer(args.socket, csv_files, args.delay, args.idle_timeout)
+        sys.stdout.write('Serving %d file(s) at %s\n' % (len(csv_files), args.socket))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
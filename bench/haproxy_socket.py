@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Compare reading the stats socket 32 bytes at a time with the buffered reader
+of haproxy-status.py: wall time and the number of recv system calls.
+The time of the filtered query is mostly spent filtering in the stand-in server.
+"""
+import argparse
+import imp
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import synthetic
+from haproxy_server import StatsServer
+
+haproxy_status = imp.load_source('haproxy_status', synthetic.sample_path('../haproxy-status.py'))
+
+
+class CountingSocket:
+    """
+    Counts calls which are system calls on the real socket
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.calls = 0
+
+    def recv(self, size):
+        self.calls += 1
+        return self.sock.recv(size)
+
+    def recv_into(self, buf):
+        self.calls += 1
+        return self.sock.recv_into(buf)
+
+
+def legacy_read(sock):
+    """
+    The old reader: 32 byte reads and string concatenation
+    """
+    buffer_size = 32
+    data = ''
+    buf = sock.recv(buffer_size)
+    while buf:
+        data += buf
+        buf = sock.recv(buffer_size)
+    return data
+
+
+def fetch(path, command, reader, repeat):
+    """
+    Send the command and read the answer
+    @return: average time, average recv calls and the last answer
+    """
+    calls = 0
+    time_start = time.time()
+    for number in xrange(repeat):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(path)
+        sock.sendall(command)
+        counting = CountingSocket(sock)
+        data = reader(counting)
+        sock.close()
+        calls += counting.calls
+    return (time.time() - time_start) / repeat, calls / repeat, data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--rows", help="number of CSV rows", type=int, default=10000)
+    parser.add_argument("-r", "--repeat", help="number of fetches to average", type=int, default=10)
+    parser.add_argument("-q", "--query", help="show stat filter", type=int, nargs=3, default=[-1, 4, -1],
+                        metavar=('IID', 'TYPE', 'SID'))
+    args = parser.parse_args()
+
+    csv = synthetic.scaled_stats(args.rows)
+    path = os.path.join(tempfile.mkdtemp(), 'stats.sock')
+    server = StatsServer(path, [csv]).start()
+
+    sys.argv = ['haproxy-status.py', '--socket', path]
+    interface = haproxy_status.Interface()
+
+    results = [
+        ('32 byte reads', fetch(path, 'show stat\n', legacy_read, args.repeat)),
+        ('recv_into', fetch(path, 'show stat\n', interface.read_socket, args.repeat)),
+        ('recv_into, query %d %d %d' % tuple(args.query),
+         fetch(path, 'show stat %d %d %d\n' % tuple(args.query), interface.read_socket, args.repeat)),
+    ]
+    server.stop()
+    os.rmdir(os.path.dirname(path))
+
+    if results[0][1][2] != csv or results[1][1][2] != csv:
+        sys.stdout.write('ERROR: the answer differs from the served CSV!\n')
+        sys.exit(1)
+
+    sys.stdout.write('CSV: %d rows, %.1f MB\n' % (args.rows, len(csv) / 1024.0 / 1024.0))
+    sys.stdout.write('%-30s %10s %10s %10s\n' % ('reader', 'time, ms', 'recv', 'bytes'))
+    for name, (fetch_time, calls, data) in results:
+        sys.stdout.write('%-30s %10.1f %10d %10d\n' % (name, fetch_time * 1000, calls, len(data)))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Fetch stats from many stand-in balancers, half over HTTP and half over
+UNIX sockets, every one answering with a delay. Concurrent fetching
+should keep the latency flat as the number of sources grows.
+"""
+import argparse
+import imp
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import synthetic
+from haproxy_server import StatsServer, HTTPStatsServer
+
+haproxy_status = imp.load_source('haproxy_status', synthetic.sample_path('../haproxy-status.py'))
+
+
+def start_servers(count, csv, delay, directory):
+    """
+    Start stand-in balancers
+    @return: List of servers and command line options
+    """
+    servers = []
+    options = []
+    for number in xrange(count):
+        if number % 2:
+            server = StatsServer(os.path.join(directory, 'stats-%d.sock' % number), [csv], delay).start()
+            options += ['--socket', server.path]
+        else:
+            server = HTTPStatsServer(0, [csv], delay).start()
+            options += ['--url', server.url]
+        servers.append(server)
+    return servers, options
+
+
+def measure(interface, repeat, sequential):
+    time_start = time.time()
+    for number in xrange(repeat):
+        if sequential:
+            for source in interface.sources:
+                interface.get_source_status(source)
+        else:
+            interface.get_status()
+    return (time.time() - time_start) / repeat
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--sources", help="numbers of sources", type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument("-D", "--delay", help="answer delay of every source in seconds", type=float, default=0.05)
+    parser.add_argument("-r", "--repeat", help="number of fetches to average", type=int, default=5)
+    args = parser.parse_args()
+
+    csv = synthetic.read_sample('stats.csv')
+    directory = tempfile.mkdtemp()
+
+    sys.stdout.write('delay: %.0f ms\n' % (args.delay * 1000))
+    sys.stdout.write('%8s %15s %15s\n' % ('sources', 'sequential, ms', 'concurrent, ms'))
+    for count in args.sources:
+        servers, options = start_servers(count, csv, args.delay, directory)
+        sys.argv = ['haproxy-status.py', '--timeout', '5'] + options
+        interface = haproxy_status.Interface()
+        sequential_time = measure(interface, args.repeat, True)
+        concurrent_time = measure(interface, args.repeat, False)
+        if len(interface.statuses) != count or (count > 1 and interface.status.differences()):
+            sys.stdout.write('ERROR: wrong merged status!\n')
+            sys.exit(1)
+        for server in servers:
+            server.stop()
+        sys.stdout.write('%8d %15.1f %15.1f\n' % (count, sequential_time * 1000, concurrent_time * 1000))
+
+    shutil.rmtree(directory)
@@ -0,0 +1,256 @@
+"""
+Generators of large synthetic inputs built from the files in samples/
+"""
+import os
+import re
+
+samples_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'samples')
+
+
+def sample_path(name):
+    """
+    Get a full path to a sample file
+    @param name: File name inside the samples directory
+    @return: Path string
+    """
+    return os.path.normpath(os.path.join(samples_dir, name))
+
+
+def read_sample(name):
+    """
+    Read the contents of a sample file
+    @param name: File name inside the samples directory
+    @return: File contents
+    """
+    sample = open(sample_path(name))
+    data = sample.read()
+    sample.close()
+    return data
+
+
+def scaled_cib(nodes=200, op_copies=1):
+    """
+    Build a CIB with many nodes by replicating node_state blocks of samples/cib.xml
+    @param nodes: Number of nodes in the status section
+    @param op_copies: Every lrm_rsc_op is repeated this many times with new call-ids
+    @return: XML text
+    """
+    cib = read_sample('cib.xml')
+    status_start = cib.index('<status>') + len('<status>')
+    status_end = cib.index('</status>')
+    header = cib[:status_start]
+    footer = cib[status_end:]
+
+    node_states = re.findall(r'<node_state .*?</node_state>', cib[status_start:status_end], re.S)
+    node_names = re.findall(r'<node_state id="([^"]+)"', cib[status_start:status_end])
+
+    call_id = [100000]
+
+    def copy_op(match):
+        op = match.group(0)
+        copies = [op]
+        for number in xrange(1, op_copies):
+            call_id[0] += 1
+            copy = op.replace('id="', 'id="copy%d-' % number, 1)
+            copy = re.sub(r'call-id="\d+"', 'call-id="%d"' % call_id[0], copy)
+            copies.append(copy)
+        return '\n'.join(copies)
+
+    blocks = []
+    for number in xrange(nodes):
+        template = node_states[number % len(node_states)]
+        name = node_names[number % len(node_names)]
+        block = template.replace(name, 'node-%d.synthetic.tld' % number)
+        if op_copies > 1:
+            block = re.sub(r'<lrm_rsc_op [^>]*/>', copy_op, block)
+        blocks.append(block)
+
+    return header + '\n' + '\n'.join(blocks) + '\n' + footer
+
+
+def write_file(path, data):
+    """
+    Write data to a file
+    @param path: Path to the file
+    @param data: Data string
+    @return: Path to the file
+    """
+    output = open(path, 'w')
+    output.write(data)
+    output.close()
+    return path
+
+
+def scaled_stats(rows=10000):
+    """
+    Build a large HAProxy "show stat" CSV by replicating proxies of samples/stats.csv
+    @param rows: Minimum number of data rows
+    @return: CSV text
+    """
+    lines = read_sample('stats.csv').splitlines()
+    header = lines[0]
+    records = [line for line in lines[1:] if line and not line.startswith('#')]
+
+    output = [header]
+    copy = 0
+    while len(output) <= rows:
+        for record in records:
+            pxname, rest = record.split(',', 1)
+            output.append('%s-%d,%s' % (pxname, copy, rest))
+        copy += 1
+    return '\n'.join(output) + '\n'
+
+
+def evolving_stats(steps=10, rows=None):
+    """
+    Build a sequence of HAProxy CSVs where counters grow from step to step.
+    Every server gets 10 sessions, 1000 bytes in, 5000 bytes out and
+    one 5xx response per step, so rates are known in advance.
+    @param steps: Number of CSVs
+    @param rows: Build every CSV from scaled_stats with this many rows instead of samples/stats.csv
+    @return: List of CSV texts
+    """
+    if rows:
+        base = scaled_stats(rows)
+    else:
+        base = read_sample('stats.csv')
+    lines = base.splitlines()
+    columns = lines[0].lstrip('#').strip().split(',')
+    increments = {
+        columns.index('stot'): 10,
+        columns.index('req_tot'): 10,
+        columns.index('bin'): 1000,
+        columns.index('bout'): 5000,
+        columns.index('hrsp_5xx'): 1,
+    }
+
+    records = [line.split(',') for line in lines[1:] if line and not line.startswith('#')]
+    csv_files = []
+    for step in xrange(steps):
+        output = [lines[0]]
+        for record in records:
+            fields = list(record)
+            for number, increment in increments.iteritems():
+                fields[number] = str(int(fields[number] or 0) + increment * step)
+            output.append(','.join(fields))
+        csv_files.append('\n'.join(output) + '\n')
+    return csv_files
+
+
+def galera_snapshots(steps=10, name='galera-cluster/node-1.yaml'):
+    """
+    Build a sequence of wsrep YAML snapshots of one node where counters grow from step to step.
+    Every step adds 10000 replicated bytes, 2000 received bytes, 50 commits,
+    one certification failure and 0.05 s of flow control pause, the receive queue is 2,
+    so rates are known in advance when the snapshots are taken a second apart.
+    @param steps: Number of snapshots
+    @param name: Base sample file
+    @return: List of YAML texts
+    """
+    from yaml import safe_load, safe_dump
+    base = safe_load(read_sample(name))
+    increments = {
+        'wsrep_replicated_bytes': 10000,
+        'wsrep_received_bytes': 2000,
+        'wsrep_local_commits': 50,
+        'wsrep_local_cert_failures': 1,
+        'wsrep_flow_control_paused_ns': 50000000,
+    }
+    snapshots = []
+    for step in xrange(steps):
+        data = dict(base)
+        for key, increment in increments.iteritems():
+            data[key] = str(int(base.get(key) or 0) + increment * step)
+        data['wsrep_local_recv_queue'] = '2'
+        snapshots.append(safe_dump(data, default_flow_style=False))
+    return snapshots
+
+
+def astute_records(deployments=1, nodes=10, steps=10, start=1400000000):
+    """
+    Build Astute log records of deployments: RPC calls, progress reports cast
+    to Nailgun, task status records and debug noise with multi-line payloads.
+    Every deployment produces 3 + steps * (nodes + 3) records, of them one RPC call,
+    steps + 1 casts of which steps are "deploying" ones, and one task status record.
+    @param deployments: Number of deployments
+    @param nodes: Nodes in every deployment
+    @param steps: Progress reports of every deployment
+    @param start: Unix time of the first record
+    @return: Iterator of record texts ending with a new line
+    """
+    import time
+    second = [start]
+
+    def stamp(severity):
+        second[0] += 1
+        return '%s %s: [393]' % (time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(second[0])), severity)
+
+    for deployment in xrange(deployments):
+        uuid = '%08x-6d2a-4b8e-9c1f-%012x' % (deployment, deployment * 7919)
+        uids = [str(deployment * nodes + node + 1) for node in xrange(nodes)]
+        yield "%s Processing RPC call 'deploy'\n" % stamp('info')
+        yield '%s Got message with payload {"method"=>"deploy", "respond_to"=>"deploy_resp",\n' \
+              ' "args"=>{"task_uuid"=>"%s",\n  "deployment_info"=>[%s]}}\n' % (
+                  stamp('debug'), uuid, ', '.join('{"uid"=>"%s", "role"=>"compute"}' % uid for uid in uids))
+        for step in xrange(steps):
+            progress = (step + 1) * 100 / (steps + 1)
+            for uid in uids:
+                yield '%s Run puppet on node %s\n' \
+                      '  puppet is still running, last run summary:\n' \
+                      '  {"resources"=>{"changed"=>%d, "failed"=>0}}\n' % (stamp('debug'), uid, step)
+            yield '%s Data received by DeploymentProxyReporter to report it up:\n' \
+                  ' {"nodes"=>[%s]}\n' % (stamp('debug'), ', '.join(
+                      '{"uid"=>"%s", "progress"=>%d, "status"=>"deploying"}' % (uid, progress) for uid in uids))
+            yield '%s Casting message to Nailgun: {"method"=>"deploy_resp", "args"=>{"task_uuid"=>"%s",' \
+                  ' "nodes"=>[%s]}}\n' % (stamp('info'), uuid, ', '.join(
+                      '{"uid"=>"%s", "progress"=>%d, "status"=>"deploying"}' % (uid, progress) for uid in uids))
+        yield '%s Casting message to Nailgun: {"method"=>"deploy_resp", "args"=>{"task_uuid"=>"%s",' \
+              ' "status"=>"ready", "progress"=>100, "nodes"=>[%s]}}\n' % (stamp('info'), uuid, ', '.join(
+                  '{"uid"=>"%s", "progress"=>100, "status"=>"ready"}' % uid for uid in uids))
+        yield '%s Task %s: deployment of %d nodes is ready\n' % (stamp('info'), uuid, nodes)
+
+
+def puppet_lines(lines=1000, error_every=50, start=1400000000):
+    """
+    Build puppet-apply.log lines, every error_every line is an error
+    @param lines: Number of lines
+    @param error_every: Distance between errors
+    @param start: Unix time of the first line
+    @return: Iterator of lines ending with a new line
+    """
+    import time
+    for number in xrange(lines):
+        stamp = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(start + number))
+        if number % error_every == error_every - 1:
+            yield '%s err: (/Stage[main]/Openstack::Controller/Service[nova-api]) ' \
+                  'Could not start Service[nova-api]: Execution of \'/usr/bin/service nova-api start\' returned 1\n' % stamp
+        else:
+            yield '%s notice: (/Stage[main]/Nova::Api/Nova_config[DEFAULT/osapi_compute_workers]/value) ' \
+                  'value changed \'2\' to \'%d\'\n' % (stamp, number % 8)
+
+
+def write_log(path, records, size):
+    """
+    Write generated records to a file until it reaches the size, the records are repeated if needed
+    @param path: File path
+    @param records: Function which returns an iterator of records
+    @param size: Size in bytes
+    @return: Number of records written
+    """
+    stream = open(path, 'w')
+    written = 0
+    count = 0
+    buffered = []
+    while written < size:
+        for record in records():
+            buffered.append(record)
+            written += len(record)
+            count += 1
+            if len(buffered) >= 1000:
+                stream.write(''.join(buffered))
+                buffered = []
+            if written >= size:
+                break
+    stream.write(''.join(buffered))
+    stream.close()
+    return count
@@ -1,6 +1,216 @@
+import os
+import keyword
 import subprocess
 from xml.dom.minidom import *
 
+try:
+    from xml.etree.cElementTree import iterparse
+except ImportError:
+    from xml.etree.ElementTree import iterparse
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+
+def slot_name(field):
+    """
+    Convert XML attribute name to a valid attribute name
+    @param field: XML attribute name
+    @return: Slot name
+    """
+    name = field.replace('-', '_')
+    if keyword.iskeyword(name):
+        name += '_'
+    return name
+
+
+def intern_value(value):
+    """
+    Intern a string value so the same values share memory
+    @param value: Attribute value
+    @return: Interned value
+    """
+    if isinstance(value, unicode):
+        try:
+            value = value.encode('ascii')
+        except UnicodeError:
+            return value
+    if isinstance(value, str):
+        return intern(value)
+    return value
+
+
+def record_converters(fields, slots, numeric):
+    """
+    Build a table of slots and converters of record fields
+    @param fields: XML attribute names
+    @param slots: Slot names
+    @param numeric: Names of integer attributes
+    @return: Dict of attribute name: (slot, converter)
+    """
+    converters = {}
+    for field, slot in zip(fields, slots):
+        if field in numeric:
+            converters[field] = (slot, int)
+        else:
+            converters[field] = (slot, intern)
+    return converters
+
+
+class Record(object):
+    """
+    Compact record of XML attributes. Known attributes are kept in
+    slots, numeric ones as integers, the others in the extra dict.
+    Mapping methods give the original attribute strings back.
+    """
+
+    __slots__ = ('extra',)
+    fields = ()
+    numeric = frozenset()
+    field_slots = {}
+    converters = {}
+
+    def __init__(self, attributes=None):
+        if not attributes:
+            return
+        converters = self.converters
+        try:
+            for name, value in attributes.iteritems():
+                slot, convert = converters[name]
+                setattr(self, slot, convert(value))
+        except (KeyError, TypeError, ValueError):
+            # unknown attributes or values, take the slow path
+            for name, value in attributes.iteritems():
+                self[name] = value
+
+    def __getattr__(self, name):
+        # slots are not set until there is a value
+        if name == 'extra' or name in self.__slots__:
+            return None
+        raise AttributeError(name)
+
+    def __setitem__(self, name, value):
+        slot = self.field_slots.get(name, None)
+        if slot and name in self.numeric:
+            try:
+                setattr(self, slot, int(value))
+                return
+            except (TypeError, ValueError):
+                setattr(self, slot, None)
+                slot = None
+        if slot:
+            setattr(self, slot, intern_value(value))
+            return
+        if self.extra is None:
+            self.extra = {}
+        self.extra[intern_value(name)] = intern_value(value)
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        slot = self.field_slots.get(name, None)
+        if slot:
+            setattr(self, slot, None)
+        if self.extra and name in self.extra:
+            del self.extra[name]
+
+    def __getitem__(self, name):
+        slot = self.field_slots.get(name, None)
+        if slot:
+            value = getattr(self, slot)
+            if value is not None:
+                if name in self.numeric:
+                    return str(value)
+                return value
+        if self.extra and name in self.extra:
+            return self.extra[name]
+        raise KeyError(name)
+
+    def __contains__(self, name):
+        try:
+            self[name]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def keys(self):
+        keys = [field for field in self.fields if getattr(self, self.field_slots[field]) is not None]
+        if self.extra:
+            keys += self.extra.keys()
+        return keys
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_dict(self):
+        """
+        Convert the record to the plain structure
+        @return: Dict of attribute strings
+        """
+        data = {}
+        for key, value in self.items():
+            if isinstance(value, list):
+                value = [item.to_dict() if isinstance(item, Record) else item for item in value]
+            data[key] = value
+        return data
+
+    def copy(self):
+        return self.to_dict()
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__) + (self.extra,)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__ + ('extra',), state):
+            setattr(self, slot, value)
+
+
+class Op(Record):
+    """
+    Operation of lrm_rsc_op block
+    """
+
+    fields = (
+        'id', 'operation_key', 'operation', 'crm-debug-origin', 'crm_feature_set',
+        'transition-key', 'transition-magic', 'call-id', 'rc-code', 'op-status',
+        'interval', 'last-run', 'last-rc-change', 'exec-time', 'queue-time', 'op-digest',
+    )
+    numeric = frozenset(['call-id', 'rc-code', 'op-status', 'interval', 'last-run', 'last-rc-change', 'exec-time', 'queue-time'])
+    __slots__ = tuple(map(slot_name, fields))
+    field_slots = dict(zip(fields, __slots__))
+    converters = record_converters(fields, __slots__, numeric)
+
+
+class Resource(Record):
+    """
+    Resource of lrm_resource block with its ops and status
+    """
+
+    fields = ('id', 'type', 'class', 'provider', 'ops', 'status')
+    __slots__ = tuple(map(slot_name, fields))
+    field_slots = dict(zip(fields, __slots__))
+    converters = record_converters(fields, __slots__, frozenset())
+
+
 
 class CIB:
     """
@@ -9,7 +219,13 @@ class CIB:
 
     def __init__(self, interface):
         self.nodes = {}
+        self.index = {}
         self.interface = interface
+        self.cib_file = None
+        self.cib_xml = None
+        self.xml = None
+        self.version = None
+        self.changed = set()
 
     def show_nodes(self):
         """
@@ -18,7 +234,78 @@ class CIB:
         """
         import pprint
         printer = pprint.PrettyPrinter(indent=2)
-        return printer.pformat(self.nodes)
+        return printer.pformat(self.export_nodes())
+
+    def export_nodes(self):
+        """
+        Convert decoded nodes to plain dicts and lists for output
+        @return: Nodes structure with attribute strings
+        """
+        nodes = {}
+        for node_id, node_data in self.nodes.items():
+            resources = {}
+            for resource_id, resource_data in node_data['resources'].items():
+                resources[resource_id] = resource_data.to_dict()
+            nodes[node_id] = {
+                'id': node_data['id'],
+                'resources': resources,
+            }
+        return nodes
+
+    def export_metrics(self):
+        """
+        Convert decoded nodes to Prometheus text format metrics
+        @return: Metrics text
+        """
+        def label(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        lines = []
+        if self.version:
+            for name, value in zip(['admin_epoch', 'epoch', 'num_updates'], self.version):
+                lines.append('# HELP pacemaker_cib_%s CIB version %s' % (name, name))
+                lines.append('# TYPE pacemaker_cib_%s gauge' % name)
+                lines.append('pacemaker_cib_%s %d' % (name, value))
+
+        status_lines = []
+        running_lines = []
+        rc_code_lines = []
+        monitor_lines = []
+        ops_lines = []
+        for node_id, node_data in sorted(self.nodes.items()):
+            for resource_id, resource_data in sorted(node_data['resources'].items()):
+                labels = 'node="%s",resource="%s"' % (label(node_id), label(resource_id))
+                status = resource_data.status
+                status_lines.append('pacemaker_resource_status{%s,status="%s"} 1' % (labels, label(status)))
+                running_lines.append('pacemaker_resource_running{%s} %d' % (labels, status in ['start', 'promote']))
+                ops_lines.append('pacemaker_resource_ops{%s} %d' % (labels, len(resource_data.ops)))
+
+                last_op = None
+                last_monitor = None
+                for op in resource_data.ops:
+                    if op.rc_code is not None:
+                        last_op = op
+                    if op.operation == 'monitor' and op.interval and op.exec_time is not None:
+                        last_monitor = op
+                if last_op:
+                    rc_code_lines.append('pacemaker_resource_last_rc_code{%s,operation="%s"} %d' % (
+                        labels, label(last_op.operation), last_op.rc_code))
+                if last_monitor:
+                    monitor_lines.append('pacemaker_resource_monitor_exec_time_seconds{%s} %.3f' % (
+                        labels, last_monitor.exec_time / 1000.0))
+
+        for name, metric_type, metric_help, metric_lines in [
+            ('pacemaker_resource_status', 'gauge', 'Resource status on the node', status_lines),
+            ('pacemaker_resource_running', 'gauge', 'Resource is started or promoted on the node', running_lines),
+            ('pacemaker_resource_last_rc_code', 'gauge', 'rc-code of the last operation', rc_code_lines),
+            ('pacemaker_resource_monitor_exec_time_seconds', 'gauge', 'exec-time of the last recurring monitor', monitor_lines),
+            ('pacemaker_resource_ops', 'gauge', 'Number of recorded operations', ops_lines),
+        ]:
+            lines.append('# HELP %s %s' % (name, metric_help))
+            lines.append('# TYPE %s %s' % (name, metric_type))
+            lines += metric_lines
+
+        return '\n'.join(lines) + '\n'
 
     def __str__(self):
         return self.xml
@@ -28,23 +315,26 @@ class CIB:
 
     def get_cib_from_file(self, cib_file=None):
         """
-        Get cib XML DOM structure by reading xml file
+        Set a file as the CIB source. The file is parsed later by decode_lrm.
         @param cib_file: Path to file (cibadmin -Q > cib.xml)
-        @return: XML document
+        @return: Path to file
         """
-        self.cib_file = cib_file
-        self.xml = xml.dom.minidom.parse(self.cib_file)
-        if not self.xml:
+        if not (cib_file and os.path.isfile(cib_file)):
             raise StandardError('Could not get CIB from file!')
-        return self.xml
+        self.cib_file = cib_file
+        self.cib_xml = None
+        return self.cib_file
 
-    def get_cib_from_pacemaker(self):
+    def run_cibadmin(self, options=None):
         """
-        Get cib XML DOM from Pacemaker by calling cibadmin
-        @return: XML document
+        Run cibadmin query and return its output
+        @param options: List of additional cibadmin options
+        @return: XML text
         """
         shell = False
         cmd = ['/usr/sbin/cibadmin', '--query']
+        if options:
+            cmd += options
         exception = 'Could not get CIB using cibadmin!'
 
         try:
@@ -55,20 +345,195 @@ class CIB:
                 shell=shell,
             )
 
-            status_code = popen.wait()
-            stdout = popen.stdout
-            stderr = popen.stderr
-
-            cib = stdout.read()
-            exception += ' ' + stderr.read()
+            # communicate() drains the pipes while waiting, a large CIB
+            # would fill the pipe buffer and block wait() forever
+            cib, stderr = popen.communicate()
+            status_code = popen.returncode
+            exception += ' ' + stderr
         except:
             raise StandardError(exception)
         if status_code != 0 or len(cib) == 0:
             raise StandardError(exception)
+        return cib
+
+    def get_cib_from_pacemaker(self):
+        """
+        Get cib XML text from Pacemaker by calling cibadmin
+        @return: XML text
+        """
+        self.cib_file = None
+        self.cib_xml = self.run_cibadmin()
+        return self.cib_xml
+
+    def get_cib_version(self):
+        """
+        Get the CIB version by reading only the root element.
+        If there is no CIB source yet only the root element is
+        requested from Pacemaker.
+        @return: (admin_epoch, epoch, num_updates) tuple
+        """
+        if self.cib_xml is not None:
+            source = StringIO(self.cib_xml)
+        elif self.cib_file is not None:
+            source = open(self.cib_file, 'r')
+        else:
+            source = StringIO(self.run_cibadmin(['--xpath', '/cib', '--no-children']))
+
+        version = None
+        try:
+            for event, element in iterparse(source, events=('start',)):
+                version = self.get_version(element.attrib)
+                break
+        finally:
+            source.close()
+
+        if not version:
+            raise StandardError('Could not get CIB version!')
+        self.interface.debug('Version: %s' % str(version), 2, 1)
+        return version
+
+    def get_version(self, attributes):
+        """
+        Get the version tuple from the attributes of cib element
+        @param attributes: Attributes of the cib element
+        @return: (admin_epoch, epoch, num_updates) tuple
+        """
+        return tuple(
+            self.get_version_number(attributes, attribute)
+            for attribute in ['admin_epoch', 'epoch', 'num_updates']
+        )
+
+    def get_version_number(self, attributes, attribute):
+        """
+        Helper used to read version attributes of the cib element
+        @param attributes: Attributes of the cib element
+        @param attribute: Attribute name
+        @return: Integer value
+        """
+        try:
+            return int(attributes[attribute])
+        except (KeyError, ValueError):
+            return 0
+
+    def cache_namespace(self, node_id=None):
+        """
+        Name used to separate cache entries of different CIB sources
+        @param node_id: Only this node was decoded
+        @return: Namespace string
+        """
+        if self.cib_file is not None:
+            namespace = os.path.abspath(self.cib_file)
         else:
-            self.xml = xml.dom.minidom.parseString(cib)
+            namespace = 'pacemaker'
+        if node_id is not None:
+            namespace += '#' + node_id
+        return namespace
+
+    def cache_key(self, version):
+        """
+        Cache entries of a file are also keyed by its size and mtime,
+        a file can be rewritten with the same version
+        @param version: CIB version tuple
+        @return: Key tuple
+        """
+        if self.cib_file is None:
+            return version
+        try:
+            stat_result = os.stat(self.cib_file)
+        except OSError:
+            return version
+        return version + (stat_result.st_size, int(stat_result.st_mtime * 1000000))
+
+    def decode_lrm_cached(self, cache, node_id=None):
+        """
+        Load decoded nodes from the cache if the CIB version has not
+        changed, or decode the CIB and store the nodes in the cache.
+        @param cache: CIBCache instance
+        @param node_id: Decode only this node
+        @return: Nodes structure
+        """
+        version = self.get_cib_version()
+        namespace = self.cache_namespace(node_id)
+        cached = cache.load(namespace, self.cache_key(version))
+        if cached is not None:
+            self.interface.debug('Cache hit: %s' % str(version), 1)
+            self.nodes, self.index = cached
+            self.version = version
+            return self.nodes
+
+        self.interface.debug('Cache miss: %s' % str(version), 1)
+        if self.cib_file is None and self.cib_xml is None:
+            self.get_cib_from_pacemaker()
+            # the CIB could have been changed after the version query
+            version = self.get_cib_version()
+
+        if self.decode_lrm(node_id) is None:
+            return None
+        self.version = version
+        cache.store(namespace, self.cache_key(version), (self.nodes, self.index))
+        return self.nodes
+
+    def cib_source(self):
+        """
+        Get a file name or a file-like object with the CIB XML
+        @return: Source suitable for parsers
+        """
+        if self.cib_xml is not None:
+            return StringIO(self.cib_xml)
+        if self.cib_file is not None:
+            return self.cib_file
+        raise StandardError('There is no CIB source!')
+
+    def lrm_section_source(self, node_id):
+        """
+        Cut the lrm section of a single node out of the CIB text
+        without parsing the rest of the document.
+        @param node_id: Node name
+        @return: File-like object with the section or None if it was not found
+        """
+        from xml.sax.saxutils import quoteattr
+        import mmap
+
+        if self.cib_xml is not None:
+            text = self.cib_xml
+            cib_file = None
+        elif self.cib_file is not None:
+            cib_file = open(self.cib_file, 'rb')
+            if os.fstat(cib_file.fileno()).st_size == 0:
+                cib_file.close()
+                return None
+            text = mmap.mmap(cib_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            raise StandardError('There is no CIB source!')
+
+        try:
+            start = text.find('<lrm id=%s' % quoteattr(node_id))
+            if start < 0:
+                return None
+            tag_end = text.find('>', start)
+            if tag_end < 0:
+                return None
+            if text[tag_end - 1] == '/':
+                end = tag_end + 1
+            else:
+                end = text.find('</lrm>', tag_end)
+                if end < 0:
+                    return None
+                end += len('</lrm>')
+            return StringIO(text[start:end])
+        finally:
+            if cib_file:
+                text.close()
+                cib_file.close()
+
+    def get_cib_dom(self):
+        """
+        Build a full XML DOM tree from the CIB source
+        @return: XML document
+        """
+        self.xml = xml.dom.minidom.parse(self.cib_source())
         if not self.xml:
-            raise StandardError(exception)
+            raise StandardError('Could not parse CIB!')
         return self.xml
 
     def decode_lrm_op(self, lrm_op_block):
@@ -77,7 +542,7 @@ class CIB:
         @param lrm_op_block: Op block of the XML document
         @return: Operation structure
         """
-        op = {}
+        op = Op()
         for op_attribute in lrm_op_block.attributes.keys():
             op[op_attribute] = lrm_op_block.attributes[op_attribute].value
         return op
@@ -88,10 +553,9 @@ class CIB:
         @param op Operation structure
         @return: call-id integer
         """
-        try:
-            return int(op['call-id'])
-        except (KeyError, ValueError):
+        if op.call_id is None:
             return 0
+        return op.call_id
 
     def decode_lrm_resource(self, lrm_resource_block):
         """
@@ -99,11 +563,11 @@ class CIB:
         @param lrm_resource_block: Resource block of the XML document
         @return: Resource structure
         """
-        resource = {}
+        resource = Resource()
 
         for lrm_resource_attribute in lrm_resource_block.attributes.keys():
             resource[lrm_resource_attribute] = lrm_resource_block.attributes[lrm_resource_attribute].value
-        resource['ops'] = []
+        resource.ops = []
 
         lrm_rsc_ops = lrm_resource_block.getElementsByTagName('lrm_rsc_op')
 
@@ -111,11 +575,11 @@ class CIB:
             if not (lrm_of_single_op.attributes and lrm_of_single_op.hasAttribute('id')):
                 continue
             op = self.decode_lrm_op(lrm_of_single_op)
-            self.interface.debug('Op: %s' % op['id'], 2, 3)
-            resource['ops'].append(op)
+            self.interface.debug('Op: %s' % op.id, 2, 3)
+            resource.ops.append(op)
 
-        resource['ops'].sort(key=self.get_call_id)
-        resource['status'] = self.determine_resource_status(resource['ops'])
+        resource.ops.sort(key=self.get_call_id)
+        resource.status = self.determine_resource_status(resource.ops)
 
         return resource
 
@@ -143,11 +607,13 @@ class CIB:
 
         return node_data
 
-    def decode_lrm(self):
+    def decode_lrm_dom(self):
         """
-        Find lrm sections and decode them
+        Find lrm sections in the DOM tree and decode them
         @return: Nodes structure
         """
+        if not self.xml:
+            self.get_cib_dom()
         lrm_of_all_nodes = self.xml.getElementsByTagName('lrm')
         if len(lrm_of_all_nodes) == 0:
             return None
@@ -159,8 +625,336 @@ class CIB:
             node_data = self.decode_lrm_node(lrm_of_single_node)
             self.interface.debug('Node: %s' % node_id, 2, 1)
             self.nodes[node_id] = node_data
+        self.build_index()
         return self.nodes
 
+    def decode_lrm(self, node_id=None):
+        """
+        Decode lrm sections in a single pass over the CIB source.
+        Every element is freed as soon as it has been decoded so the
+        whole document is never kept in memory.
+        If node_id is given only this node's lrm section is decoded.
+        @param node_id: Decode only this node
+        @return: Nodes structure
+        """
+        source = None
+        if node_id is not None:
+            source = self.lrm_section_source(node_id)
+        if source is None:
+            source = self.cib_source()
+
+        node_data = None
+        node_index = None
+        resource_data = None
+        found_lrm = False
+
+        for event, element in iterparse(source, events=('start', 'end')):
+            tag = element.tag
+
+            if event == 'start':
+                if tag == 'cib':
+                    self.version = self.get_version(element.attrib)
+                elif tag == 'lrm':
+                    found_lrm = True
+                    if 'id' in element.attrib and node_id in [None, element.attrib['id']]:
+                        node_data = {
+                            'id': element.attrib['id'],
+                            'resources': {},
+                        }
+                        node_index = {}
+                elif tag == 'lrm_resource' and node_data is not None:
+                    if 'id' in element.attrib:
+                        resource_data = Resource(element.attrib)
+                        resource_data.ops = []
+                continue
+
+            if tag == 'lrm_rsc_op':
+                if resource_data is not None and 'id' in element.attrib:
+                    op = Op(element.attrib)
+                    self.interface.debug('Op: %s' % op.id, 2, 3)
+                    resource_data.ops.append(op)
+
+            elif tag == 'lrm_resource':
+                if resource_data is not None:
+                    resource_data.ops.sort(key=self.get_call_id)
+                    last_op = self.determine_last_op(resource_data.ops)
+                    resource_data.status = self.last_op_status(last_op)
+                    self.interface.debug('Resource: %s' % resource_data.id, 2, 2)
+                    node_data['resources'][resource_data.id] = resource_data
+                    node_index[resource_data.id] = (last_op, resource_data.status)
+                resource_data = None
+
+            elif tag == 'lrm':
+                if node_data is not None:
+                    self.interface.debug('Node: %s' % node_data['id'], 2, 1)
+                    self.nodes[node_data['id']] = node_data
+                    self.index[node_data['id']] = node_index
+                    if node_id is not None:
+                        # the requested node is decoded, skip the rest
+                        break
+                node_data = None
+                node_index = None
+
+            element.clear()
+
+        if not found_lrm:
+            return None
+        return self.nodes
+
+    def build_index(self):
+        """
+        Build the resource status index from already decoded nodes
+        @return: Index structure
+        """
+        self.index = {}
+        for node_id, node_data in self.nodes.items():
+            node_index = {}
+            for resource_id, resource_data in node_data['resources'].items():
+                last_op = self.determine_last_op(resource_data.ops)
+                node_index[resource_id] = (last_op, self.last_op_status(last_op))
+            self.index[node_id] = node_index
+        return self.index
+
+    def lookup(self, node_id, resource_id):
+        """
+        Get the last effective op and the status of a resource on a node
+        @param node_id: Node name
+        @param resource_id: Resource name
+        @return: (last_op, status) or None if there is no such resource
+        """
+        return self.index.get(node_id, {}).get(resource_id, None)
+
+    def apply_diff(self, diff_source):
+        """
+        Apply a Pacemaker CIB diff to the decoded nodes.
+        Both the old (diff-removed/diff-added) and the patchset
+        (format="2") diffs are supported. Only changed resources
+        are decoded and their status is calculated again.
+        @param diff_source: Path or file-like object with the diff XML
+        @return: True if the diff was applied, False if it's for another CIB version
+        """
+        from xml.etree.ElementTree import parse
+        root = parse(diff_source).getroot()
+        if root.tag == 'diff':
+            diff = root
+        else:
+            diff = root.find('.//diff')
+        if diff is None:
+            raise StandardError('There is no diff in the document!')
+
+        if diff.get('format', None) == '2':
+            source = diff.find('version/source')
+            target = diff.find('version/target')
+        else:
+            source = diff.find('diff-removed')
+            target = diff.find('diff-added')
+        if source is None or target is None:
+            raise StandardError('Could not get the diff version!')
+        source_version = self.get_version(source.attrib)
+        target_version = self.get_version(target.attrib)
+
+        if self.version is not None and self.version != source_version:
+            self.interface.debug('Diff %s -> %s does not match CIB version %s' % (
+                str(source_version), str(target_version), str(self.version)), 1)
+            return False
+
+        self.changed = set()
+        if diff.get('format', None) == '2':
+            self.apply_diff_changes(diff)
+        else:
+            self.apply_diff_tree(source, 'removed')
+            self.apply_diff_tree(target, 'added')
+
+        for node_id, resource_id in self.changed:
+            self.update_resource(node_id, resource_id)
+        self.interface.debug('Diff %s -> %s: %d resources changed' % (
+            str(source_version), str(target_version), len(self.changed)), 1)
+        self.version = target_version
+        return True
+
+    def apply_diff_changes(self, diff):
+        """
+        Apply changes of a format 2 patchset
+        @param diff: Diff element
+        """
+        import re
+        for change in diff.findall('change'):
+            path = dict(re.findall(r"/(\w+)(?:\[@id='([^']*)'\])?", change.get('path', '')))
+            tag = re.findall(r"/(\w+)", change.get('path', ''))[-1:]
+            if not tag:
+                continue
+            tag = tag[0]
+            node_id = path.get('lrm', path.get('node_state', None))
+            resource_id = path.get('lrm_resource', None)
+            operation = change.get('operation', None)
+
+            if operation == 'delete':
+                self.diff_delete(tag, node_id, resource_id, path.get('lrm_rsc_op', None))
+            elif operation == 'create':
+                for element in change:
+                    self.diff_create(element, node_id, resource_id)
+            elif operation == 'modify' and tag in ['lrm_rsc_op', 'lrm_resource']:
+                attributes = {}
+                for change_attr in change.findall('change-list/change-attr'):
+                    attributes[change_attr.get('name')] = change_attr.get('value', None)
+                self.diff_modify(tag, node_id, resource_id, path.get('lrm_rsc_op', None), attributes)
+
+    def apply_diff_tree(self, element, side, node_id=None, resource_id=None):
+        """
+        Walk one side of an old format diff and apply the marked elements
+        @param element: Element to look into
+        @param side: 'removed' or 'added'
+        @param node_id: Node of the element
+        @param resource_id: Resource of the element
+        """
+        for child in element:
+            tag = child.tag
+            child_node_id = node_id
+            child_resource_id = resource_id
+            if tag in ['node_state', 'lrm']:
+                child_node_id = child.get('id', node_id)
+            elif tag == 'lrm_resource':
+                child_resource_id = child.get('id', None)
+
+            marker = child.get('__crm_diff_marker__', None)
+            if marker and side == 'removed':
+                self.diff_delete(tag, child_node_id, child_resource_id, child.get('id', None))
+                continue
+            if marker and side == 'added':
+                self.diff_create(child, node_id, resource_id)
+                continue
+
+            if side == 'added' and tag in ['lrm_rsc_op', 'lrm_resource']:
+                self.diff_modify(tag, child_node_id, child_resource_id, child.get('id', None), child.attrib)
+            self.apply_diff_tree(child, side, child_node_id, child_resource_id)
+
+    def diff_delete(self, tag, node_id, resource_id, op_id):
+        """
+        Remove an element from the decoded nodes
+        @param tag: Tag of the removed element
+        @param node_id: Node of the element
+        @param resource_id: Resource of the element
+        @param op_id: Op id if it's an op
+        """
+        if tag == 'status':
+            self.nodes = {}
+            self.index = {}
+            return
+        if node_id not in self.nodes:
+            return
+        resources = self.nodes[node_id]['resources']
+
+        if tag in ['node_state', 'lrm']:
+            del self.nodes[node_id]
+            self.index.pop(node_id, None)
+        elif tag == 'lrm_resources':
+            for resource_id in resources:
+                self.changed.add((node_id, resource_id))
+            resources.clear()
+        elif tag == 'lrm_resource':
+            resources.pop(resource_id, None)
+            self.changed.add((node_id, resource_id))
+        elif tag == 'lrm_rsc_op' and resource_id in resources:
+            resource = resources[resource_id]
+            resource.ops = [op for op in resource.ops if op.id != op_id]
+            self.changed.add((node_id, resource_id))
+
+    def diff_attributes(self, element):
+        """
+        Get attributes of a diff element without diff markers
+        @param element: Diff element
+        @return: Attributes dict
+        """
+        attributes = dict(element.attrib)
+        attributes.pop('__crm_diff_marker__', None)
+        return attributes
+
+    def diff_create(self, element, node_id, resource_id):
+        """
+        Decode a new element and put it to the decoded nodes
+        replacing the existing one with the same id
+        @param element: Created element
+        @param node_id: Node of the parent element
+        @param resource_id: Resource of the parent element
+        """
+        tag = element.tag
+        if tag == 'lrm_rsc_op':
+            resource = self.nodes.get(node_id, {}).get('resources', {}).get(resource_id, None)
+            if resource is None or 'id' not in element.attrib:
+                return
+            op = Op(self.diff_attributes(element))
+            resource.ops = [old_op for old_op in resource.ops if old_op.id != op.id]
+            resource.ops.append(op)
+            self.changed.add((node_id, resource_id))
+            return
+
+        if tag == 'lrm_resource':
+            lrm_resources = [(node_id, element)]
+        elif tag == 'lrm_resources':
+            self.diff_delete(tag, node_id, None, None)
+            lrm_resources = [(node_id, lrm_resource) for lrm_resource in element.iter('lrm_resource')]
+        else:
+            lrm_resources = []
+            for lrm in element.iter('lrm'):
+                lrm_node_id = lrm.get('id', None)
+                if lrm_node_id is None:
+                    continue
+                self.diff_delete('lrm_resources', lrm_node_id, None, None)
+                self.nodes.setdefault(lrm_node_id, {'id': lrm_node_id, 'resources': {}})
+                lrm_resources += [(lrm_node_id, lrm_resource) for lrm_resource in lrm.iter('lrm_resource')]
+
+        for lrm_node_id, lrm_resource in lrm_resources:
+            if 'id' not in lrm_resource.attrib or lrm_node_id not in self.nodes:
+                continue
+            resource = Resource(self.diff_attributes(lrm_resource))
+            resource.ops = [Op(self.diff_attributes(op)) for op in lrm_resource.iter('lrm_rsc_op') if 'id' in op.attrib]
+            self.nodes[lrm_node_id]['resources'][resource.id] = resource
+            self.changed.add((lrm_node_id, resource.id))
+
+    def diff_modify(self, tag, node_id, resource_id, op_id, attributes):
+        """
+        Change attributes of an existing op or resource
+        @param tag: Tag of the changed element
+        @param node_id: Node of the element
+        @param resource_id: Resource of the element
+        @param op_id: Op id if it's an op
+        @param attributes: Dict of new values, None value removes the attribute
+        """
+        resource = self.nodes.get(node_id, {}).get('resources', {}).get(resource_id, None)
+        if resource is None:
+            return
+        if tag == 'lrm_rsc_op':
+            records = [op for op in resource.ops if op.id == op_id]
+        else:
+            records = [resource]
+
+        for record in records:
+            for name, value in attributes.items():
+                if name in ['id', '__crm_diff_marker__']:
+                    continue
+                if value is None:
+                    if name in record:
+                        del record[name]
+                else:
+                    record[name] = value
+            self.changed.add((node_id, resource_id))
+
+    def update_resource(self, node_id, resource_id):
+        """
+        Sort ops and calculate the status of a changed resource
+        @param node_id: Node name
+        @param resource_id: Resource name
+        """
+        resource = self.nodes.get(node_id, {}).get('resources', {}).get(resource_id, None)
+        if resource is None:
+            self.index.get(node_id, {}).pop(resource_id, None)
+            return
+        resource.ops.sort(key=self.get_call_id)
+        last_op = self.determine_last_op(resource.ops)
+        resource.status = self.last_op_status(last_op)
+        self.index.setdefault(node_id, {})[resource_id] = (last_op, resource.status)
+        self.interface.debug('Resource: %s %s' % (resource_id, resource.status), 2, 2)
+
     def determine_resource_status(self, ops):
         """
         Determite the status of a resource by analyzing
@@ -168,33 +962,222 @@ class CIB:
         @param ops: Operations array
         @return: Resource status string
         """
+        return self.last_op_status(self.determine_last_op(ops))
+
+    def determine_last_op(self, ops):
+        """
+        Find the last operation that defines the resource status
+        @param ops: Operations array sorted by call-id
+        @return: Operation structure or None
+        """
         last_op = None
 
         for op in ops:
-            self.interface.debug('Status Op: %s' % op, 3, 3)
+            self.interface.debug('Status Op: %s' % op.id, 3, 3)
             # skip incomplite ops
-            if not op.get('op-status', None) == '0':
+            if not op.op_status == 0:
                 continue
 
             # skip useless operations
-            if not op.get('operation', None) in ['start', 'stop', 'monitor', 'promote']:
+            if not op.operation in ['start', 'stop', 'monitor', 'promote']:
                 continue
 
             # skip unsuccessfull operations
-            if not (op.get('rc-code', None) == '0' or op.get('operation', None) == 'monitor'):
+            if not (op.rc_code == 0 or op.operation == 'monitor'):
                 continue
 
             last_op = op
 
+        return last_op
+
+    def last_op_status(self, last_op):
+        """
+        Get the resource status from its last effective operation
+        @param last_op: Operation structure or None
+        @return: Resource status string
+        """
         if not last_op:
             return '?'
 
-        if last_op.get('operation', None) in ['promote', 'start', 'stop']:
-            status = last_op['operation']
-        elif last_op.get('rc-code', None) in ['0', '8']:
+        if last_op.operation in ['promote', 'start', 'stop']:
+            status = last_op.operation
+        elif last_op.rc_code in [0, 8]:
             status = 'start'
         else:
             status = 'stop'
 
         self.interface.debug('Status: %s' % status, 3, 3)
         return status
+
+
+class CIBCache:
+    """
+    On-disk cache of decoded CIB nodes keyed by the CIB version.
+    The entries are pickles and loading a pickle can run code, so only
+    files owned by this user in a directory nobody else can write to are read.
+    """
+
+    # one directory per user, it is created with mode 0700
+    default_directory = '/var/tmp/cib-cache-%d' % os.getuid()
+
+    def __init__(self, directory=None, max_entries=16, max_age=86400):
+        """
+        @param directory: Directory to keep the cache files in
+        @param max_entries: Keep no more than this number of files
+        @param max_age: Remove files older than this number of seconds
+        """
+        if not directory:
+            directory = self.default_directory
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.suffix = '.pickle'
+
+    def prefix(self, namespace):
+        """
+        File name prefix of all entries of the namespace
+        @param namespace: CIB source namespace
+        @return: Prefix string
+        """
+        from hashlib import md5
+        return 'cib-%s-' % md5(namespace).hexdigest()[:12]
+
+    def path(self, namespace, version):
+        """
+        Path to the cache file of this CIB version
+        @param namespace: CIB source namespace
+        @param version: CIB version tuple
+        @return: Path string
+        """
+        name = self.prefix(namespace) + '-'.join(map(str, version)) + self.suffix
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def trusted(stat_result):
+        """
+        Check that a cache file or directory belongs to this user
+        and can not be written by anybody else
+        @param stat_result: Result of os.stat
+        @return: True or False
+        """
+        import stat
+        if stat_result.st_uid != os.getuid():
+            return False
+        return not stat.S_IMODE(stat_result.st_mode) & (stat.S_IWGRP | stat.S_IWOTH)
+
+    def secure_directory(self, create=False):
+        """
+        Check the cache directory, and create it if asked
+        @param create: Create the directory if it does not exist
+        @return: True if the directory can be used
+        """
+        import stat
+        if create and not os.path.lexists(self.directory):
+            try:
+                os.makedirs(self.directory, 0700)
+            except OSError:
+                return False
+        try:
+            stat_result = os.lstat(self.directory)
+        except OSError:
+            return False
+        return stat.S_ISDIR(stat_result.st_mode) and self.trusted(stat_result)
+
+    def load(self, namespace, version):
+        """
+        Load decoded nodes of this CIB version
+        @param namespace: CIB source namespace
+        @param version: CIB version tuple
+        @return: Nodes structure or None if there is no such entry
+        """
+        import cPickle
+        import stat
+        if not self.secure_directory():
+            return None
+        path = self.path(namespace, version)
+        try:
+            descriptor = os.open(path, os.O_RDONLY | getattr(os, 'O_NOFOLLOW', 0))
+        except OSError:
+            return None
+        # the opened file itself is checked, it can not be replaced after the check
+        stat_result = os.fstat(descriptor)
+        if not (stat.S_ISREG(stat_result.st_mode) and self.trusted(stat_result)):
+            os.close(descriptor)
+            return None
+        cache_file = os.fdopen(descriptor, 'rb')
+        try:
+            return cPickle.load(cache_file)
+        except Exception:
+            # broken entry, it will be written again
+            self.remove(path)
+            return None
+        finally:
+            cache_file.close()
+
+    def store(self, namespace, version, nodes):
+        """
+        Save decoded nodes of this CIB version and evict stale entries
+        @param namespace: CIB source namespace
+        @param version: CIB version tuple
+        @param nodes: Nodes structure
+        """
+        import cPickle
+        import tempfile
+        if not self.secure_directory(create=True):
+            return
+        try:
+            descriptor, temp_path = tempfile.mkstemp(prefix='tmp-', dir=self.directory)
+            cache_file = os.fdopen(descriptor, 'wb')
+            cPickle.dump(nodes, cache_file, cPickle.HIGHEST_PROTOCOL)
+            cache_file.close()
+            # rename is atomic, readers never see a partial file
+            os.rename(temp_path, self.path(namespace, version))
+        except (IOError, OSError):
+            # the cache is optional, just work without it
+            return
+        self.evict(namespace, version)
+
+    def remove(self, path):
+        """
+        Remove a cache file ignoring errors
+        @param path: Path to the file
+        """
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def evict(self, namespace, version):
+        """
+        Remove other versions of this namespace, expired entries
+        and the oldest entries above max_entries
+        @param namespace: CIB source namespace
+        @param version: Current CIB version tuple
+        """
+        import time
+        prefix = self.prefix(namespace)
+        current = self.path(namespace, version)
+        now = time.time()
+        entries = []
+
+        for name in os.listdir(self.directory):
+            if not (name.startswith('cib-') and name.endswith(self.suffix)):
+                continue
+            path = os.path.join(self.directory, name)
+            if path == current:
+                continue
+            if name.startswith(prefix):
+                self.remove(path)
+                continue
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if now - mtime > self.max_age:
+                self.remove(path)
+                continue
+            entries.append((mtime, path))
+
+        entries.sort(reverse=True)
+        for mtime, path in entries[self.max_entries - 1:]:
+            self.remove(path)
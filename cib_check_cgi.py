@@ -3,9 +3,11 @@ import cgi
 import cgitb
 import sys
 import platform
-from cib import CIB
+from cib import CIB, CIBCache
 cgitb.enable()
 
+cache_directory = CIBCache.default_directory
+
 
 class CGI_interface:
     def __init__(self):
@@ -28,19 +30,16 @@ class CGI_interface:
             self.send_cgi(400, 'No resource sent')
 
         self.create_cib()
-        self.cib.decode_lrm()
+        self.decode_cib()
 
-        if not self.hostname in self.cib.nodes:
+        if not self.hostname in self.cib.index:
             self.send_cgi(404, 'Node "%s" was not found' % self.hostname)
-        node = self.cib.nodes[self.hostname]
 
-        if not self.resource in node['resources']:
+        found = self.cib.lookup(self.hostname, self.resource)
+        if not found:
             self.send_cgi(404, 'Resource "%s" was not found on node "%s"' % (self.resource, self.hostname))
 
-        resource = node['resources'][self.resource]
-        ops = resource['ops']
-
-        status = self.cib.determine_resource_status(ops)
+        last_op, status = found
 
         if status in ['start', 'promote']:
             code = 200
@@ -64,11 +63,15 @@ class CGI_interface:
             self.cib = CIB(self)
             if self.use_xml:
                 self.cib.get_cib_from_file('samples/cib.xml')
-            else:
-                self.cib.get_cib_from_pacemaker()
         except Exception as e:
             self.send_cgi(500, 'Could not get CIB', str(e))
 
+    def decode_cib(self):
+        try:
+            self.cib.decode_lrm_cached(CIBCache(cache_directory), self.hostname)
+        except Exception as e:
+            self.send_cgi(500, 'Could not decode CIB', str(e))
+
     def debug(self, msg='', debug=1, offset=None):
         pass
 
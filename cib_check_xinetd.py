@@ -1,11 +1,12 @@
 #!/usr/bin/env python
 import sys
 import platform
-from cib import CIB
+from cib import CIB, CIBCache
 
 resource = 'p_haproxy'
 hostname = 'node-1.domain.tld'
 use_xml = True
+cache_directory = CIBCache.default_directory
 
 
 class Xinetd_interface:
@@ -24,19 +25,16 @@ class Xinetd_interface:
             self.send_data(400, 'No resource set')
 
         self.create_cib()
-        self.cib.decode_lrm()
+        self.decode_cib()
 
-        if not self.hostname in self.cib.nodes:
+        if not self.hostname in self.cib.index:
             self.send_data(404, 'Node "%s" was not found' % self.hostname)
-        node = self.cib.nodes[self.hostname]
 
-        if not self.resource in node['resources']:
+        found = self.cib.lookup(self.hostname, self.resource)
+        if not found:
             self.send_data(404, 'Resource "%s" was not found on node "%s"' % (self.resource, self.hostname))
 
-        resource = node['resources'][self.resource]
-        ops = resource['ops']
-
-        status = self.cib.determine_resource_status(ops)
+        last_op, status = found
 
         if status in ['start', 'promote']:
             code = 200
@@ -62,11 +60,15 @@ class Xinetd_interface:
             self.cib = CIB(self)
             if self.use_xml:
                 self.cib.get_cib_from_file('samples/cib.xml')
-            else:
-                self.cib.get_cib_from_pacemaker()
         except Exception as e:
             self.send_data(500, 'Could not get CIB', str(e))
 
+    def decode_cib(self):
+        try:
+            self.cib.decode_lrm_cached(CIBCache(cache_directory), self.hostname)
+        except Exception as e:
+            self.send_data(500, 'Could not decode CIB', str(e))
+
     def debug(self, msg='', debug=1, offset=None):
         pass
 
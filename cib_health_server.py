@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+import sys
+import argparse
+import platform
+import threading
+import time
+import BaseHTTPServer
+import SocketServer
+from cib import CIB
+
+
+class Interface:
+    """
+    Functions related to input, output and formatting of data
+    """
+
+    def __init__(self):
+        self.parser = argparse.ArgumentParser()
+        self.parser.add_argument("-d", "--debug", help="debug output", type=int, choices=[0, 1, 2, 3], default=0)
+        self.parser.add_argument("-a", "--address", help="listen on this address", type=str, default='0.0.0.0')
+        self.parser.add_argument("-p", "--port", help="listen on this port", type=int, default=8081)
+        self.parser.add_argument("-f", "--file", help="read CIB from file instead of Pacemaker", type=str)
+        self.parser.add_argument("-t", "--test", help="test mode: read CIB from samples/cib.xml", action='store_true')
+        self.parser.add_argument("-i", "--interval", help="check CIB version every N seconds", type=float, default=1.0)
+        self.parser.add_argument("-r", "--refresh", help="decode CIB every N seconds even if its version is the same (0 - never)",
+                                 type=float, default=0)
+        self.parser.add_argument("-s", "--stale", help="answer 500 if CIB was not checked for N seconds", type=float, default=30.0)
+        self.args = self.parser.parse_args()
+
+        if self.args.test and not self.args.file:
+            self.args.file = 'samples/cib.xml'
+
+    def debug(self, msg='', debug=1, offset=None):
+        """
+        Debug print string
+        @param msg: Message to write
+        @param debug: Minimum debug level this message should be shown
+        @param offset: Number of spaces before the message
+        """
+        if not offset:
+            offset = debug
+
+        if self.args.debug >= debug:
+            sys.stderr.write('  ' * offset + str(msg) + "\n")
+
+
+class HealthState:
+    """
+    Decoded CIB kept in memory and refreshed in background
+    """
+
+    def __init__(self, interface):
+        self.interface = interface
+        self.index = None
+        self.metrics = None
+        self.version = None
+        self.decoded = 0
+        self.checked = 0
+        self.error = None
+        self.hostname = platform.node()
+
+    def create_cib(self):
+        """
+        Creates a CIB instance either from file or from Pacemaker
+        @return: CIB instance without data
+        """
+        cib = CIB(self.interface)
+        if self.interface.args.file:
+            cib.get_cib_from_file(self.interface.args.file)
+        return cib
+
+    def refresh(self):
+        """
+        Check the CIB version and decode the CIB if it has changed
+        """
+        refresh = self.interface.args.refresh
+        cib = self.create_cib()
+        version = cib.get_cib_version()
+        now = time.time()
+
+        if version == self.version and not (refresh and now - self.decoded >= refresh):
+            self.checked = now
+            return
+
+        if not self.interface.args.file:
+            cib.get_cib_from_pacemaker()
+            version = cib.get_cib_version()
+        if cib.decode_lrm() is None:
+            raise StandardError('There are no lrm sections in CIB!')
+
+        # readers take the reference once, replacing it is atomic
+        self.index = cib.index
+        self.metrics = cib.export_metrics()
+        self.version = version
+        self.decoded = now
+        self.checked = now
+        self.interface.debug('Decoded CIB version: %s' % str(version), 1)
+
+    def refresh_loop(self):
+        """
+        Refresh the CIB forever
+        """
+        while True:
+            time.sleep(self.interface.args.interval)
+            try:
+                self.refresh()
+                self.error = None
+            except Exception as e:
+                self.error = str(e)
+                self.interface.debug('Refresh error: %s' % self.error, 1)
+
+    def start(self):
+        """
+        Load the CIB first time and start the refresh thread
+        """
+        self.refresh()
+        thread = threading.Thread(target=self.refresh_loop)
+        thread.daemon = True
+        thread.start()
+
+    def status(self, hostname, resource):
+        """
+        Get the HTTP code and the message for a resource on a node
+        @param hostname: Node name
+        @param resource: Resource name
+        @return: code, message
+        """
+        index = self.index
+        if index is None:
+            return 500, 'Could not get CIB: %s' % self.error
+
+        if time.time() - self.checked > self.interface.args.stale:
+            return 500, 'CIB data is stale: %s' % self.error
+
+        if not hostname in index:
+            return 404, 'Node "%s" was not found' % hostname
+
+        if not resource in index[hostname]:
+            return 404, 'Resource "%s" was not found on node "%s"' % (resource, hostname)
+
+        last_op, status = index[hostname][resource]
+
+        if status in ['start', 'promote']:
+            code = 200
+        else:
+            code = 503
+
+        return code, 'Resource "%s" on node "%s" has status "%s"' % (resource, hostname, status)
+
+
+class HealthHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Answers /<hostname>/<resource> requests
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # send headers and body in one packet
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0].strip('/').split('/')
+        state = self.server.state
+
+        if path == ['metrics']:
+            self.send_metrics()
+            return
+
+        if len(path) == 2 and path[0] and path[1]:
+            code, msg = state.status(path[0], path[1])
+        elif len(path) == 1 and path[0]:
+            code, msg = state.status(state.hostname, path[0])
+        else:
+            code, msg = 400, 'Use /<hostname>/<resource>'
+
+        self.send_data(code, msg)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def send_data(self, code=200, msg='OK', body=None):
+        if not body:
+            body = msg
+        data = "<html>%s</html>\r\n" % body
+        self.send_response(code, msg)
+        self.send_header('Content-type', 'text/html')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    def send_metrics(self):
+        """
+        Send metrics rendered at the last CIB decode
+        """
+        state = self.server.state
+        metrics = state.metrics
+        if metrics is None or time.time() - state.checked > state.interface.args.stale:
+            self.send_data(500, 'CIB data is not available: %s' % state.error)
+            return
+        self.send_response(200)
+        self.send_header('Content-type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(metrics)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(metrics)
+
+    def log_message(self, format, *args):
+        self.server.state.interface.debug(format % args, 2)
+
+
+class HealthServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+###########################################################################################################
+
+if __name__ == '__main__':
+    interface = Interface()
+    state = HealthState(interface)
+    try:
+        state.start()
+    except Exception as e:
+        sys.stderr.write('Could not load CIB: %s\n' % str(e))
+        sys.exit(1)
+    server = HealthServer((interface.args.address, interface.args.port), HealthHandler)
+    server.state = state
+    interface.debug('Listening on %s:%d' % (interface.args.address, interface.args.port), 1)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
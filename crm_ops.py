@@ -2,10 +2,212 @@
 import sys
 import argparse
 import time
-from cib import CIB
+from cib import CIB, CIBCache
 from color import Color
 
 
+class BatchDecoder:
+    """
+    Quiet interface used to decode CIB files in pool workers
+    """
+
+    def debug(self, msg='', debug=1, offset=None):
+        pass
+
+
+def resource_failed(resource):
+    """
+    Check if a resource has failed operations
+    @param resource: Resource structure
+    @return: Boolean
+    """
+    for op in resource.ops:
+        # 0 - done, 1 - cancelled, -1 - pending
+        if op.op_status not in [None, 0, 1, -1]:
+            return True
+        if op.op_status == 0 and op.rc_code not in [None, 0, 7, 8]:
+            return True
+    return False
+
+
+def cluster_summary(nodes):
+    """
+    Find out if resources of a cluster are running and failed
+    @param nodes: Nodes structure of the cluster
+    @return: Dict of resource: (running, failed)
+    """
+    summary = {}
+    for node_data in nodes.values():
+        for resource_id, resource_data in node_data['resources'].items():
+            running, failed = summary.get(resource_id, (False, False))
+            running = running or resource_data.status in ['start', 'promote']
+            failed = failed or resource_failed(resource_data)
+            summary[resource_id] = (running, failed)
+    return summary
+
+
+def decode_cib_file(task):
+    """
+    Decode a CIB file in a pool worker
+    @param task: (cib_file, summary_only)
+    @return: (cib_file, nodes or cluster summary, error)
+    """
+    cib_file, summary_only = task
+    cib = CIB(BatchDecoder())
+    try:
+        cib.get_cib_from_file(cib_file)
+        if cib.decode_lrm() is None:
+            return cib_file, None, 'There are no lrm sections in CIB!'
+    except Exception as e:
+        return cib_file, None, str(e)
+    if summary_only:
+        # do not send all the nodes back to the parent process
+        return cib_file, cluster_summary(cib.nodes), None
+    return cib_file, cib.nodes, None
+
+
+class OpAnalytics:
+    """
+    Collects operation timings and rc-code history in a single pass
+    """
+
+    def __init__(self, top=10):
+        self.top = top
+        self.slowest = []
+        self.exec_times = {}
+        self.resource_times = {}
+        self.flapping = []
+        self.timelines = {}
+        self.resource_timelines = {}
+        self.ops = 0
+
+    def op_type(self, op):
+        """
+        Group name of an operation: probes and recurring monitors are separated
+        @param op: Operation structure
+        @return: Operation type string
+        """
+        if op.operation == 'monitor':
+            if op.interval:
+                return 'monitor'
+            return 'probe'
+        return str(op.operation)
+
+    def op_time(self, op):
+        """
+        Time of an operation
+        @param op: Operation structure
+        @return: Timestamp or None
+        """
+        if op.last_run is not None:
+            return op.last_run
+        return op.last_rc_change
+
+    def is_failure(self, op_type, rc_code):
+        """
+        Check if an rc code means a failure of this kind of operation.
+        "Not running" is a normal answer of probes and monitors
+        and "running master" of master/slave resources.
+        @param op_type: Operation type
+        @param rc_code: rc code number
+        @return: True or False
+        """
+        if rc_code in (0, 8):
+            return False
+        if rc_code == 7 and op_type in ('probe', 'monitor'):
+            return False
+        return True
+
+    def keep_top(self, heap, item):
+        """
+        Keep only top N largest items in a heap
+        @param heap: List used as a heap
+        @param item: New item
+        """
+        import heapq
+        if len(heap) < self.top:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+
+    def add_resource(self, node_id, resource_id, resource):
+        """
+        Account all ops of a resource
+        @param node_id: Node name
+        @param resource_id: Resource name
+        @param resource: Resource structure with ops sorted by call-id
+        """
+        rc_codes = []
+        failures = []
+        timeline = self.timelines.setdefault(node_id, [])
+        resource_timeline = self.resource_timelines.setdefault(resource_id, [])
+
+        for op in resource.ops:
+            self.ops += 1
+            op_type = self.op_type(op)
+            op_time = self.op_time(op)
+
+            if op.exec_time is not None:
+                self.exec_times.setdefault(op_type, []).append(op.exec_time)
+                times = self.resource_times.setdefault(resource_id, [0, 0])
+                times[0] += op.exec_time
+                times[1] += 1
+                self.keep_top(self.slowest, (op.exec_time, node_id, resource_id, op_type, op.rc_code, op_time))
+
+            if op_time is not None:
+                timeline.append((op_time, resource_id, op_type, op.rc_code, op.exec_time))
+                resource_timeline.append((op_time, node_id, op_type, op.rc_code, op.exec_time))
+
+            if op.rc_code is not None and op.op_status == 0:
+                rc_codes.append(op.rc_code)
+                failures.append(self.is_failure(op_type, op.rc_code))
+
+        # only going into and out of failures counts, like probe 7 -> start 0 -> promote 8 does not
+        transitions = 0
+        for number in xrange(1, len(rc_codes)):
+            if rc_codes[number] != rc_codes[number - 1] and (failures[number] or failures[number - 1]):
+                transitions += 1
+        if transitions:
+            self.keep_top(self.flapping, (transitions, len(set(rc_codes)), node_id, resource_id, tuple(rc_codes)))
+
+    def percentile(self, values, fraction):
+        """
+        Nearest-rank percentile of a sorted list
+        @param values: Sorted list of numbers
+        @param fraction: 0.0 - 1.0
+        @return: Value
+        """
+        import math
+        index = max(0, int(math.ceil(len(values) * fraction)) - 1)
+        return values[index]
+
+    def exec_time_stats(self):
+        """
+        Exec-time statistics per operation type
+        @return: List of (op_type, count, p50, p90, p99, max)
+        """
+        stats = []
+        for op_type, values in sorted(self.exec_times.items()):
+            values.sort()
+            stats.append((
+                op_type,
+                len(values),
+                self.percentile(values, 0.5),
+                self.percentile(values, 0.9),
+                self.percentile(values, 0.99),
+                values[-1],
+            ))
+        return stats
+
+    def slowest_resources(self):
+        """
+        Resources with the largest total exec-time
+        @return: List of (resource_id, total, count)
+        """
+        import heapq
+        return heapq.nlargest(self.top, [(times[0], resource_id, times[1]) for resource_id, times in self.resource_times.items()])
+
+
 class Interface:
     """
     Funcions related to input, output and formattiong of data
@@ -39,6 +241,19 @@ class Interface:
         self.parser.add_argument("-f", "--file", help="read CIB from file instead of Pacemaker", type=str)
         self.parser.add_argument("-y", "--yaml", help="output as YAML", action='store_true')
         self.parser.add_argument("-j", "--json", help="output as JSON", action='store_true')
+        self.parser.add_argument("-m", "--metrics", help="output as Prometheus metrics", action='store_true')
+        self.parser.add_argument("-c", "--cache", help="cache decoded CIB in this directory (default: %s)" % CIBCache.default_directory,
+                                 type=str, nargs='?', const=CIBCache.default_directory)
+        self.parser.add_argument("-D", "--diffs", help="apply CIB diff files from this directory in order", type=str)
+        self.parser.add_argument("-b", "--batch", help="decode many CIB files (globs are allowed) and report each one", type=str,
+                                 nargs='+', metavar='FILE')
+        self.parser.add_argument("-J", "--jobs", help="number of batch worker processes (default: number of CPUs)", type=int)
+        self.parser.add_argument("-S", "--summary", help="show stopped and failed resources across all batch files", action='store_true')
+        self.parser.add_argument("-A", "--analytics", help="show slowest ops, exec-time percentiles, flapping resources and timelines",
+                                 action='store_true')
+        self.parser.add_argument("-t", "--top", help="number of lines in analytics tables", type=int, default=10)
+        self.parser.add_argument("-l", "--limit", help="show only this many latest ops of every timeline", type=int)
+        self.parser.add_argument("-w", "--watch", help="poll CIB every N seconds and show only changes", type=float, metavar='INTERVAL')
         self.args = self.parser.parse_args()
 
     def create_cib(self):
@@ -48,9 +263,35 @@ class Interface:
         self.cib = CIB(self)
         if self.args.file:
             self.cib.get_cib_from_file(self.args.file)
-        else:
+        elif not self.args.cache:
+            # with cache the CIB is fetched only if its version has changed
             self.cib.get_cib_from_pacemaker()
 
+    def decode_cib(self):
+        """
+        Decode the CIB nodes using the cache if it's enabled
+        """
+        if self.args.cache:
+            self.cib.decode_lrm_cached(CIBCache(self.args.cache))
+        else:
+            self.cib.decode_lrm()
+        if self.args.diffs:
+            self.apply_diffs(self.args.diffs)
+
+    def apply_diffs(self, directory):
+        """
+        Replay recorded CIB diffs against the decoded CIB
+        @param directory: Directory with diff files
+        """
+        import os
+        for diff_file in sorted(os.listdir(directory)):
+            diff_path = os.path.join(directory, diff_file)
+            if not os.path.isfile(diff_path):
+                continue
+            self.debug('Diff: %s' % diff_path, 1)
+            if not self.cib.apply_diff(diff_path):
+                raise StandardError('Diff "%s" does not match CIB version %s' % (diff_path, str(self.cib.version)))
+
     def show_cib_nodes(self):
         """
         Print out parsed CIB nodes data
@@ -262,7 +503,7 @@ class Interface:
         @return: YAML string
         """
         from yaml import dump
-        self.puts(dump(self.cib.nodes))
+        self.puts(dump(self.cib.export_nodes()))
 
     def print_json(self):
         """
@@ -270,7 +511,7 @@ class Interface:
         @return: JSON string
         """
         from json import dumps
-        self.puts(dumps(self.cib.nodes))
+        self.puts(dumps(self.cib.export_nodes()))
 
     def print_table(self):
         """
@@ -280,6 +521,8 @@ class Interface:
             self.print_yaml()
         elif self.args.json:
             self.print_json()
+        elif self.args.metrics:
+            self.output(self.cib.export_metrics())
         else:
             for node_id, node_data in sorted(self.cib.nodes.items()):
                 if self.args.node:
@@ -294,10 +537,329 @@ class Interface:
                     for op in resource_data['ops']:
                         self.print_op(op)
 
+    def op_signature(self, op):
+        """
+        Values of an op that are compared between watch cycles
+        @param op: Operation structure
+        @return: Tuple of values
+        """
+        return op.id, op.call_id, op.operation, op.rc_code, op.op_status, op.interval
+
+    def resource_signature(self, resource):
+        """
+        Values of a resource that are compared between watch cycles
+        @param resource: Resource structure
+        @return: Tuple of values
+        """
+        return resource.status, tuple(self.op_signature(op) for op in resource.ops)
+
+    def changed_resources(self, old_nodes, new_nodes):
+        """
+        Find resources which status or ops have changed
+        @param old_nodes: Nodes structure of the previous cycle
+        @param new_nodes: Nodes structure of the current cycle
+        @return: List of (node_id, resource_id, old_resource, new_resource)
+        """
+        changes = []
+        for node_id in sorted(set(old_nodes) | set(new_nodes)):
+            if self.args.node and node_id != self.args.node:
+                continue
+            old_resources = old_nodes.get(node_id, {}).get('resources', {})
+            new_resources = new_nodes.get(node_id, {}).get('resources', {})
+            for resource_id in sorted(set(old_resources) | set(new_resources)):
+                if self.args.primitive and resource_id != self.args.primitive:
+                    continue
+                old_resource = old_resources.get(resource_id, None)
+                new_resource = new_resources.get(resource_id, None)
+                if old_resource is not None and new_resource is not None:
+                    if self.resource_signature(old_resource) == self.resource_signature(new_resource):
+                        continue
+                changes.append((node_id, resource_id, old_resource, new_resource))
+        return changes
+
+    def print_changes(self, changes):
+        """
+        Print changed resources with their status transitions and new ops
+        @param changes: List of (node_id, resource_id, old_resource, new_resource)
+        """
+        last_node_id = None
+        for node_id, resource_id, old_resource, new_resource in changes:
+            if node_id != last_node_id:
+                self.print_node({'id': node_id})
+                last_node_id = node_id
+
+            if new_resource is None:
+                self.puts('- %s %s' % (resource_id, self.error_color('Removed')), 4)
+                continue
+            self.print_resource(new_resource)
+
+            if old_resource is None:
+                old_status = None
+                old_ops = set()
+            else:
+                old_status = old_resource.status
+                old_ops = set(self.op_signature(op) for op in old_resource.ops)
+
+            if old_status != new_resource.status:
+                transition = '%s -> %s' % (
+                    self.status_color(old_status, str(old_status).title()),
+                    self.status_color(new_resource.status, new_resource.status.title()),
+                )
+                self.puts(transition, 6)
+
+            for op in new_resource.ops:
+                if self.op_signature(op) not in old_ops:
+                    self.print_op(op)
+
+    def watch(self):
+        """
+        Poll the CIB and print only changes until interrupted
+        """
+        old_nodes = None
+        old_version = None
+
+        while True:
+            time_start = time.time()
+            try:
+                self.cib = CIB(self)
+                if self.args.file:
+                    self.cib.get_cib_from_file(self.args.file)
+                version = self.cib.get_cib_version()
+
+                if version == old_version:
+                    self.debug('Cycle: %.3f ms, version %s is not changed' % ((time.time() - time_start) * 1000, str(version)), 1)
+                else:
+                    if not self.args.file:
+                        self.cib.get_cib_from_pacemaker()
+                        version = self.cib.get_cib_version()
+                    self.cib.decode_lrm()
+
+                    if old_nodes is None:
+                        self.print_table()
+                    elif self.args.yaml or self.args.json:
+                        self.print_table()
+                    else:
+                        changes = self.changed_resources(old_nodes, self.cib.nodes)
+                        if changes:
+                            header = '%s version: %s' % (time.strftime('%Y-%m-%d %H:%M:%S'), '.'.join(map(str, version)))
+                            self.puts(self.title_color(header))
+                            self.print_changes(changes)
+                    sys.stdout.flush()
+
+                    old_nodes = self.cib.nodes
+                    old_version = version
+                    self.debug('Cycle: %.3f ms, version %s is decoded' % ((time.time() - time_start) * 1000, str(version)), 1)
+            except StandardError as e:
+                self.debug('Cycle error: %s' % str(e), 1)
+
+            time.sleep(max(0, self.args.watch - (time.time() - time_start)))
+
+    def batch_files(self):
+        """
+        Expand batch file patterns
+        @return: List of file paths
+        """
+        import glob
+        import os
+        files = []
+        for pattern in self.args.batch:
+            matches = sorted(glob.glob(pattern))
+            if not matches and os.path.isfile(pattern):
+                matches = [pattern]
+            if not matches:
+                sys.stderr.write('No files match: %s\n' % pattern)
+            for cib_file in matches:
+                if cib_file not in files:
+                    files.append(cib_file)
+        return files
+
+    def batch_results(self, files):
+        """
+        Decode CIB files in parallel
+        @param files: List of file paths
+        @return: Iterator of (cib_file, nodes or cluster summary, error) in the order of files
+        """
+        import multiprocessing
+        tasks = [(cib_file, self.args.summary) for cib_file in files]
+        jobs = self.args.jobs or multiprocessing.cpu_count()
+        jobs = min(jobs, len(files))
+        self.debug('Batch: %d files, %d jobs' % (len(files), jobs), 1)
+        if jobs <= 1:
+            for task in tasks:
+                yield decode_cib_file(task)
+            return
+        pool = multiprocessing.Pool(jobs)
+        try:
+            for result in pool.imap(decode_cib_file, tasks):
+                yield result
+        finally:
+            pool.terminate()
+
+    def summarize(self, summary, cluster):
+        """
+        Count a cluster in the batch summary
+        @param summary: Dict of resource: [clusters, stopped, failed]
+        @param cluster: Dict of resource: (running, failed) of the cluster
+        """
+        for resource_id, (running, failed) in cluster.items():
+            counters = summary.setdefault(resource_id, [0, 0, 0])
+            counters[0] += 1
+            if not running:
+                counters[1] += 1
+            if failed:
+                counters[2] += 1
+
+    def print_summary(self, summary, clusters):
+        """
+        Print the batch summary table
+        @param summary: Dict of resource: [clusters, stopped, failed]
+        @param clusters: Number of decoded clusters
+        """
+        self.puts(self.title_color('Clusters: %d' % clusters))
+        self.puts('%-40s %8s %8s %8s' % ('Resource', 'Clusters', 'Stopped', 'Failed'))
+        for resource_id, counters in sorted(summary.items(), key=lambda item: (-item[1][1] - item[1][2], item[0])):
+            line = '%-40s %8d %8d %8d' % (resource_id, counters[0], counters[1], counters[2])
+            if counters[2]:
+                line = self.error_color(line)
+            elif counters[1]:
+                line = self.not_running_color(line)
+            self.puts(line)
+
+    def batch(self):
+        """
+        Decode and report many CIB files
+        """
+        from json import dumps
+        files = self.batch_files()
+        summary = {}
+        clusters = 0
+
+        for cib_file, nodes, error in self.batch_results(files):
+            if error:
+                sys.stderr.write('%s: %s\n' % (cib_file, error))
+                continue
+            clusters += 1
+            if self.args.summary:
+                self.summarize(summary, nodes)
+                continue
+
+            self.cib = CIB(self)
+            self.cib.nodes = nodes
+            if self.args.json:
+                self.puts(dumps({'source': cib_file, 'nodes': self.cib.export_nodes()}))
+            elif self.args.yaml:
+                from yaml import dump
+                self.puts('---')
+                self.puts(dump({'source': cib_file, 'nodes': self.cib.export_nodes()}))
+            else:
+                self.puts('>>> %s' % cib_file)
+                self.print_table()
+            sys.stdout.flush()
+
+        if self.args.summary:
+            self.print_summary(summary, clusters)
+
+    def format_time(self, timestamp):
+        """
+        Format a timestamp for tables
+        @param timestamp: Seconds since epoch
+        @return: Date and time string
+        """
+        if timestamp is None:
+            return '?'
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+
+    def format_msec(self, msec):
+        """
+        Format milliseconds for tables
+        @param msec: Milliseconds
+        @return: Time string
+        """
+        if msec is None:
+            return '?'
+        return self.seconds_to_time(msec, 0, msec=True)
+
+    def print_analytics(self):
+        """
+        Collect and print operation analytics
+        """
+        analytics = OpAnalytics(self.args.top)
+        for node_id, node_data in self.cib.nodes.items():
+            if self.args.node and node_id != self.args.node:
+                continue
+            for resource_id, resource_data in node_data['resources'].items():
+                if self.args.primitive and resource_id != self.args.primitive:
+                    continue
+                analytics.add_resource(node_id, resource_id, resource_data)
+        self.debug('Analytics: %d ops' % analytics.ops, 1)
+
+        self.puts(self.title_color('Slowest operations'))
+        self.puts('%-12s %-24s %-32s %-10s %-19s %s' % ('ExecTime', 'Node', 'Resource', 'Operation', 'LastRun', 'Result'))
+        for exec_time, node_id, resource_id, op_type, rc_code, op_time in sorted(analytics.slowest, reverse=True):
+            self.puts('%-12s %-24s %-32s %-10s %-19s %s' % (
+                self.format_msec(exec_time), node_id, resource_id, op_type, self.format_time(op_time), self.rc_code_to_string(rc_code)))
+        self.puts()
+
+        self.puts(self.title_color('Exec-time by operation'))
+        self.puts('%-10s %8s %12s %12s %12s %12s' % ('Operation', 'Count', 'p50', 'p90', 'p99', 'Max'))
+        for op_type, count, p50, p90, p99, maximum in analytics.exec_time_stats():
+            self.puts('%-10s %8d %12s %12s %12s %12s' % (
+                op_type, count, self.format_msec(p50), self.format_msec(p90), self.format_msec(p99), self.format_msec(maximum)))
+        self.puts()
+
+        self.puts(self.title_color('Resources by total exec-time'))
+        self.puts('%-32s %8s %12s' % ('Resource', 'Ops', 'Total'))
+        for total, resource_id, count in analytics.slowest_resources():
+            self.puts('%-32s %8d %12s' % (resource_id, count, self.format_msec(total)))
+        self.puts()
+
+        self.puts(self.title_color('Flapping resources'))
+        self.puts('%-24s %-32s %12s %s' % ('Node', 'Resource', 'Transitions', 'RC codes'))
+        for transitions, codes, node_id, resource_id, rc_codes in sorted(analytics.flapping, reverse=True):
+            self.puts('%-24s %-32s %12d %s' % (node_id, resource_id, transitions, ' -> '.join(map(str, rc_codes))))
+
+        for node_id, timeline in sorted(analytics.timelines.items()):
+            self.puts()
+            self.puts(self.title_color('Timeline: %s' % node_id))
+            for op_time, resource_id, op_type, rc_code, exec_time in self.timeline_slice(timeline):
+                self.puts('%s %-32s %-10s %-12s %s' % (
+                    self.format_time(op_time), resource_id, op_type, self.format_msec(exec_time), self.rc_code_to_string(rc_code)), 1)
+
+        for resource_id, timeline in sorted(analytics.resource_timelines.items()):
+            if not timeline:
+                continue
+            self.puts()
+            self.puts(self.title_color('Timeline: %s' % resource_id))
+            for op_time, node_id, op_type, rc_code, exec_time in self.timeline_slice(timeline):
+                self.puts('%s %-24s %-10s %-12s %s' % (
+                    self.format_time(op_time), node_id, op_type, self.format_msec(exec_time), self.rc_code_to_string(rc_code)), 1)
+
+    def timeline_slice(self, timeline):
+        """
+        Sort a timeline and cut the latest ops if --limit is set
+        @param timeline: List of op tuples starting with the time
+        @return: List of op tuples
+        """
+        timeline = sorted(timeline)
+        if self.args.limit is not None:
+            timeline = timeline[-self.args.limit:] if self.args.limit > 0 else []
+        return timeline
+
 ###########################################################################################################
 
 if __name__ == '__main__':
     interface = Interface()
-    interface.create_cib()
-    interface.cib.decode_lrm()
-    interface.print_table()
+    if interface.args.batch:
+        interface.batch()
+    elif interface.args.watch:
+        try:
+            interface.watch()
+        except KeyboardInterrupt:
+            pass
+    else:
+        interface.create_cib()
+        interface.decode_cib()
+        if interface.args.analytics:
+            interface.print_analytics()
+        else:
+            interface.print_table()
@@ -3,74 +3,448 @@ import tarfile
 import sys
 import os
 import re
+import json
 import argparse
+from fnmatch import fnmatch
+from StringIO import StringIO
 
+CHUNK_SIZE = 1024 * 1024
+
+
+def each_line(content, chunk_size=CHUNK_SIZE):
+    """
+    Read lines from a log without loading all of it into memory
+    @param content: A string, a list of lines or an open file or tarfile member
+    @param chunk_size: Read this many bytes at once
+    @return: Iterator of lines without line ends
+    """
+    if isinstance(content, basestring):
+        content = content.splitlines()
+    if not hasattr(content, 'read'):
+        for line in content:
+            yield line.rstrip('\r\n')
+        return
+    # the beginning of a line which did not fit into the previous chunks
+    tail = []
+    while True:
+        chunk = content.read(chunk_size)
+        if not chunk:
+            break
+        lines = chunk.split('\n')
+        if len(lines) == 1:
+            tail.append(chunk)
+            continue
+        tail.append(lines[0])
+        lines[0] = ''.join(tail)
+        tail = [lines.pop()]
+        for line in lines:
+            yield line.rstrip('\r')
+    line = ''.join(tail)
+    if line:
+        yield line.rstrip('\r')
+
+
+# the filters of the logs, the same structure is read from --rules YAML files
+DEFAULT_RULES = {
+    'astute': [
+        {'name': 'rpc_call', 'include': ['Processing RPC call']},
+        {'name': 'rpc_cast', 'include': ['Casting message to Nailgun'], 'exclude': ['deploying', 'provisioning']},
+        {'name': 'task_status', 'include': ['Task'], 'exclude': ['deploying']},
+    ],
+    'puppet': [
+        {'name': 'error', 'include': ['err:']},
+    ],
+}
+
+
+class RuleSet:
+    """
+    Named rules of include and exclude patterns. A record is matched by a rule
+    if it contains any of its include patterns and none of its exclude patterns.
+    Most records match no rule, so they are rejected first: a few plain strings
+    are looked for one by one and many patterns by one regular expression scan.
+    If all the patterns are plain strings, the found strings tell the matched
+    rules at once and only their exclude patterns are checked.
+    """
+    special_characters = frozenset('.^$*+?{}[]\\|()')
+    # with fewer include patterns checking them one by one is faster than the combined scan
+    combined_patterns = 4
+
+    def __init__(self, rules):
+        """
+        @param rules: List of dicts with the name, include and exclude lists of regular expressions
+        """
+        self.rules = []
+        includes = []
+        for rule in rules:
+            # the records are byte strings
+            include = [pattern.encode('utf-8') for pattern in rule.get('include') or []]
+            exclude = [pattern.encode('utf-8') for pattern in rule.get('exclude') or []]
+            self.rules.append((rule['name'], map(self.make_check, include), map(self.make_check, exclude)))
+            for pattern in include:
+                if pattern not in includes:
+                    includes.append(pattern)
+        plain = all(map(self.is_plain, includes))
+        # a few plain include strings are looked for with 'in'
+        self.strings = None
+        # many plain ones are found by one scan which tells the rules
+        self.findall = None
+        self.found_rules = None
+        self.overlapping = []
+        # the regular expressions are only rejected by one scan
+        self.search = None
+        if plain and len(includes) < self.combined_patterns:
+            self.strings = includes
+        elif plain:
+            self.index_strings(includes)
+        else:
+            # plain strings are not put into groups, the regexp engine can skip
+            # the places which do not start with the first character of any of them
+            alternatives = [pattern if self.is_plain(pattern) else '(?:%s)' % pattern for pattern in includes]
+            self.search = re.compile('|'.join(alternatives)).search
+        self.counts = dict((name, 0) for name, include, exclude in self.rules)
+
+    def index_strings(self, includes):
+        """
+        Make the scan of the plain include strings and find out which rules
+        every found string means
+        @param includes: List of the include strings
+        """
+        # the longest string wins at the same place, the strings inside it are found too
+        includes = sorted(includes, key=len, reverse=True)
+        self.findall = re.compile('|'.join(includes)).findall
+        self.found_rules = {}
+        for string in includes:
+            numbers = set()
+            for inner in includes:
+                if inner not in string:
+                    continue
+                for number, (name, include, exclude) in enumerate(self.rules):
+                    if inner in include:
+                        numbers.add(number)
+            self.found_rules[string] = numbers
+        # the scan does not find the strings which begin inside a found one,
+        # if the start of a string can be the end of another one, it is checked again
+        for string in includes:
+            for other in includes:
+                if string == other:
+                    continue
+                if any(string.startswith(other[start:]) for start in xrange(1, len(other))):
+                    self.overlapping.append(string)
+                    break
 
-class AstuteLog:
     @classmethod
-    def parse(cls, content):
-        if type(content) == file:
-            content = content.read()
-        if type(content) == str:
-            content = content.splitlines()
-        for record in cls.each_record(content):
-            cls.rpc_call(record)
-            cls.rpc_cast(record)
-            cls.task_status(record)
+    def is_plain(cls, pattern):
+        return not cls.special_characters.intersection(pattern)
 
     @classmethod
-    def each_record(cls, content):
-        record = ''
-        date_regexp = re.compile('^\d+-\d+-\S+\s')
-        for line in content:
-            if re.match(date_regexp, line):
-                yield record
-                record = line
+    def make_check(cls, pattern):
+        """
+        Plain strings are looked for without regular expressions
+        @param pattern: Regular expression
+        @return: The string or the compiled expression
+        """
+        if cls.is_plain(pattern):
+            return pattern
+        return re.compile(pattern)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load the rules of every kind of log from a YAML file
+        @param path: Path to the file
+        @return: Dict of RuleSet objects by the kind of log
+        """
+        from yaml import safe_load
+        with open(path, 'r') as rules_file:
+            rules = safe_load(rules_file)
+        if type(rules) is not dict:
+            raise StandardError('There are no rules in: %s' % path)
+        return dict((kind, cls(kind_rules or [])) for kind, kind_rules in rules.items())
+
+    def classify(self, record):
+        """
+        Find the rules which match the record
+        @param record: Record text
+        @return: List of the names of the matched rules
+        """
+        if self.strings is not None:
+            for string in self.strings:
+                if string in record:
+                    break
             else:
-                record += line
-        yield record
+                return []
+            rules = self.included(record, self.rules)
+        elif self.findall:
+            found = self.findall(record)
+            if not found:
+                return []
+            numbers = set()
+            for string in found:
+                numbers.update(self.found_rules[string])
+            for string in self.overlapping:
+                if string in record:
+                    numbers.update(self.found_rules[string])
+            rules = [self.rules[number] for number in sorted(numbers)]
+        elif self.search and self.search(record):
+            rules = self.included(record, self.rules)
+        else:
+            return []
+        names = []
+        for name, include, exclude in rules:
+            for check in exclude:
+                if check in record if type(check) is str else check.search(record):
+                    break
+            else:
+                self.counts[name] += 1
+                names.append(name)
+        return names
+
+    @staticmethod
+    def included(record, rules):
+        """
+        Check the include patterns of the rules one by one
+        @param record: Record text
+        @param rules: List of rules
+        @return: List of the rules with an include pattern in the record
+        """
+        matched = []
+        for rule in rules:
+            for check in rule[1]:
+                if check in record if type(check) is str else check.search(record):
+                    matched.append(rule)
+                    break
+        return matched
+
+    def reset_counts(self):
+        """
+        Get the counts of matched records and start counting from zero
+        @return: List of rule names and counts
+        """
+        counts = [(name, self.counts[name]) for name, include, exclude in self.rules]
+        self.counts = dict.fromkeys(self.counts, 0)
+        return counts
+
+
+class LogParser:
+    """
+    Common part of the log parsers: classify the records and print them
+    """
+    rules = RuleSet([])
+    # print the rule name before every record
+    tags = False
+    # print only the number of records matched by every rule
+    count = False
+    # print events as JSON lines instead of the records
+    json_lines = False
+    header_regexp = re.compile(r'^(\S+)\s+(\w+):\s+(?:\[\d+\]\s+)?([^\n]*)')
 
     @classmethod
-    def rpc_call(cls, record):
-        if 'Processing RPC call' in record:
-            print record.strip()
+    def records(cls, content):
+        return each_line(content)
+
+    @classmethod
+    def parse(cls, content, source=None):
+        """
+        Print the records matched by the rules
+        @param content: A string, a list of lines or an open file or tarfile member
+        @param source: Name of the log for the events
+        """
+        classify = cls.rules.classify
+        for record in cls.records(content):
+            for name in classify(record):
+                if cls.count:
+                    continue
+                if cls.json_lines:
+                    # the record is decoded only after it has passed the rules
+                    print cls.dumps(cls.event(record, name, source))
+                elif cls.tags:
+                    print '[%s] %s' % (name, record.strip())
+                else:
+                    print record.strip()
+        counts = cls.rules.reset_counts()
+        if cls.count and cls.json_lines:
+            print cls.dumps({'source': source, 'counts': dict(counts)})
+        elif cls.count:
+            for name, number in counts:
+                print '%s: %d' % (name, number)
+
+    @staticmethod
+    def dumps(event):
+        """
+        Encode an event to JSON, the logs can have bytes which are not UTF-8.
+        The keys are not sorted, sort_keys turns off the C encoder.
+        @param event: Event dict
+        @return: JSON string
+        """
+        try:
+            return json.dumps(event)
+        except UnicodeDecodeError:
+            return json.dumps(event, encoding='latin-1')
 
     @classmethod
-    def rpc_cast(cls, record):
-        if 'Casting message to Nailgun' in record:
-            if 'deploying' in record:
-                return
-            if 'provisioning' in record:
-                return
-            print record.strip()
+    def event(cls, record, name, source=None):
+        return cls.base_event(record, name, source)
 
     @classmethod
-    def task_status(cls, record):
-        if 'Task' in record:
-            if 'deploying' in record:
-                return
-            print record.strip()
+    def base_event(cls, record, name, source=None):
+        """
+        Make an event with the time, the severity and the message of a record
+        @param record: Record text
+        @param name: Name of the matched rule
+        @param source: Name of the log
+        @return: Event dict
+        """
+        event = {
+            'type': name,
+            'source': source,
+            'timestamp': None,
+            'severity': None,
+            'message': record.strip().split('\n', 1)[0],
+        }
+        header = cls.header_regexp.match(record)
+        if header:
+            event['timestamp'], event['severity'], event['message'] = header.groups()
+        return event
 
 
-class PuppetLog:
+class AstuteLog(LogParser):
+    date_regexp = re.compile(r'^\d+-\d+-\S+\s')
+    rules = RuleSet(DEFAULT_RULES['astute'])
+    uuid_regexp = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+    method_regexp = re.compile(r"RPC call '(\w+)'")
+    uid_regexp = re.compile(r'"uid"\s*=>\s*"?(\w+)')
+    # the keys of the Ruby hashes are quoted strings
+    nil_regexp = re.compile(r'"\s*=>\s*nil\b')
+    arrow_regexp = re.compile(r'"\s*=>\s*')
+
     @classmethod
-    def parse(cls, content):
-        if type(content) == file:
-            content = content.read()
-        if type(content) == str:
-            content = content.splitlines()
-        for line in content:
-            cls.err_line(line)
+    def records(cls, content):
+        return cls.each_record(each_line(content))
+
+    @classmethod
+    def each_record(cls, lines):
+        """
+        Join the lines of multi-line records
+        @param lines: Iterator of lines without line ends
+        @return: Iterator of records, every record starts with a date
+        """
+        match = cls.date_regexp.match
+        record = []
+        for line in lines:
+            if match(line):
+                if record:
+                    yield '\n'.join(record)
+                record = [line]
+            else:
+                record.append(line)
+        if record:
+            yield '\n'.join(record)
 
     @classmethod
-    def err_line(cls, line):
-        if 'err:' in line:
-            print line.strip()
+    def payload(cls, record):
+        """
+        Decode the Ruby hash printed in the record
+        @param record: Record text
+        @return: Dict or None if there is no hash or it could not be decoded
+        """
+        start = record.find('{')
+        end = record.rfind('}')
+        if start < 0 or end < start:
+            return None
+        text = record[start:end + 1]
+        text = cls.nil_regexp.sub('": null', text)
+        text = cls.arrow_regexp.sub('": ', text)
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            return None
+        if type(payload) is not dict:
+            return None
+        return payload
+
+    @classmethod
+    def event(cls, record, name, source=None):
+        """
+        Make an event with the task, nodes, progress and status of an RPC call,
+        a message cast to Nailgun or a task status record
+        @param record: Record text
+        @param name: Name of the matched rule
+        @param source: Name of the log
+        @return: Event dict
+        """
+        event = cls.base_event(record, name, source)
+        # the payload is not a part of the message
+        event['message'] = event['message'].split('{', 1)[0].strip().rstrip(':')
+        event.update({
+            'method': None,
+            'task_uuid': None,
+            'nodes': [],
+            'progress': None,
+            'status': None,
+        })
+        method = cls.method_regexp.search(event['message'])
+        if method:
+            event['method'] = method.group(1)
+
+        payload = cls.payload(record)
+        if payload is None:
+            uuid = cls.uuid_regexp.search(record)
+            if uuid:
+                event['task_uuid'] = uuid.group(0)
+            event['nodes'] = [{'uid': uid} for uid in cls.uid_regexp.findall(record)]
+            return event
+
+        arguments = payload.get('args')
+        if type(arguments) is not dict:
+            arguments = payload
+        event['method'] = payload.get('method', event['method'])
+        event['task_uuid'] = arguments.get('task_uuid')
+        event['progress'] = arguments.get('progress')
+        event['status'] = arguments.get('status')
+        nodes = arguments.get('nodes') or arguments.get('deployment_info') or arguments.get('provisioning_info') or []
+        if type(nodes) is dict:
+            nodes = nodes.get('nodes') or []
+        for node in nodes:
+            if type(node) is not dict or 'uid' not in node:
+                continue
+            event['nodes'].append(dict((key, node[key]) for key in ('uid', 'status', 'progress') if key in node))
+        return event
+
+
+class PuppetLog(LogParser):
+    rules = RuleSet(DEFAULT_RULES['puppet'])
+
+
+def notice(message):
+    """
+    Print a header or a progress message, they go to stderr
+    when the output is JSON lines, so it stays parsable
+    @param message: Text
+    """
+    if LogParser.json_lines:
+        sys.stderr.write(message + '\n')
+    else:
+        print message
 
 
 class FuelSnapshot:
-    def __init__(self):
+    """
+    Finds the logs inside a diagnostic snapshot tarball
+    """
+
+    def __init__(self, astute_patterns=None, puppet_patterns=None, use_index=False):
+        """
+        @param astute_patterns: Shell patterns of the Astute log member names
+        @param puppet_patterns: Shell patterns of the Puppet log member names
+        @param use_index: Keep the member index of every snapshot in a file next to it
+        """
         self._snapshot = None
+        self.path = None
+        self.members = None
+        self.astute_patterns = astute_patterns or ['*/astute.log']
+        self.puppet_patterns = puppet_patterns or ['*/puppet-apply.log']
+        self.use_index = use_index
 
     @property
     def snapshot(self):
@@ -78,16 +452,83 @@ class FuelSnapshot:
 
     def open_fuel_snapshot(self, snapshot):
         self._snapshot = tarfile.open(snapshot)
+        self.path = snapshot
+        self.members = None
+        if self.use_index:
+            self.members = self.load_index()
 
     def close_fuel_snapshot(self):
         if self.snapshot:
             self.snapshot.close()
+        self._snapshot = None
+        self.members = None
+
+    @staticmethod
+    def matches(name, patterns):
+        for pattern in patterns:
+            if fnmatch(name, pattern):
+                return True
+        return False
+
+    def index_path(self):
+        return self.path + '.index'
+
+    def load_index(self):
+        """
+        Load the saved member index if it was made for this snapshot file
+        @return: List of TarInfo objects or None
+        """
+        try:
+            with open(self.index_path(), 'r') as index_file:
+                index = json.load(index_file)
+        except (IOError, ValueError):
+            return None
+        stat = os.stat(self.path)
+        if index.get('size') != stat.st_size or index.get('mtime') != stat.st_mtime:
+            return None
+        members = []
+        for name, offset_data, size in index['members']:
+            member = tarfile.TarInfo(name.encode('utf-8'))
+            member.type = tarfile.REGTYPE
+            member.offset_data = offset_data
+            member.size = size
+            members.append(member)
+        return members
+
+    def save_index(self, members):
+        """
+        Save names, data offsets and sizes of the regular files of the snapshot
+        @param members: List of TarInfo objects
+        """
+        stat = os.stat(self.path)
+        index = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'members': [(member.name, member.offset_data, member.size) for member in members
+                        if member.isreg() and not member.issparse()],
+        }
+        try:
+            with open(self.index_path(), 'w') as index_file:
+                json.dump(index, index_file)
+        except (IOError, ValueError) as e:
+            sys.stderr.write('Could not save the index: %s\n' % str(e))
+
+    def logs(self):
+        """
+        Get the members of the snapshot from the index or by one scan of the archive
+        @return: List of TarInfo objects
+        """
+        if self.members is None:
+            self.members = self.snapshot.getmembers()
+            if self.use_index:
+                self.save_index(self.members)
+        return self.members
 
     def astute_log(self):
-        for log in self.snapshot.getmembers():
+        for log in self.logs():
             if not log.isfile():
                 continue
-            if log.name.endswith('/astute.log'):
+            if self.matches(log.name, self.astute_patterns):
                 return log
 
     def parse_astute_log(self):
@@ -95,41 +536,111 @@ class FuelSnapshot:
         if not astute_log:
             return
         log = self.snapshot.extractfile(astute_log)
-        AstuteLog.parse(log)
+        AstuteLog.parse(log, astute_log.name)
 
     def puppet_logs(self):
-        for log in self.snapshot.getmembers():
+        for log in self.logs():
             if not log.isfile():
                 continue
-            if log.name.endswith('/puppet-apply.log'):
+            if self.matches(log.name, self.puppet_patterns):
                 yield log
 
     def parse_puppet_logs(self):
         for log in self.puppet_logs():
             name = log.name
-            print ">>> %s" % name
+            notice(">>> %s" % name)
             content = self.snapshot.extractfile(log)
-            PuppetLog.parse(content)
+            PuppetLog.parse(content, name)
+
+    def parse(self, snapshot, astute=True, puppet=True, stream=False):
+        """
+        Parse the logs of one snapshot
+        @param snapshot: Path to the snapshot
+        @param astute: Parse the first Astute log
+        @param puppet: Parse the Puppet logs
+        @param stream: Read the snapshot in one pass
+        """
+        if stream:
+            self.parse_stream(snapshot, astute, puppet)
+            return
+        self.open_fuel_snapshot(snapshot)
+        if astute:
+            self.parse_astute_log()
+        if puppet:
+            self.parse_puppet_logs()
+        self.close_fuel_snapshot()
+
+    def compressed(self):
+        return not isinstance(self.snapshot.fileobj, file)
+
+    def log_tasks(self, astute=True, puppet=True):
+        """
+        Make a task for every log of the open snapshot
+        @param astute: Add the first Astute log
+        @param puppet: Add the Puppet logs
+        @return: List of tasks for parse_member_task
+        """
+        tasks = []
+        logs = []
+        if astute:
+            astute_log = self.astute_log()
+            if astute_log:
+                logs.append(('astute', astute_log))
+        if puppet:
+            logs.extend(('puppet', log) for log in self.puppet_logs())
+        for kind, log in logs:
+            tasks.append((self.path, kind, log.name, log.offset_data, log.size))
+        return tasks
+
+    def parse_stream(self, snapshot, astute=True, puppet=True):
+        """
+        Read the snapshot once from the beginning to the end and parse every
+        matching log when it is found. Compressed snapshots are decompressed
+        only once, but the logs are printed in the order of the archive.
+        @param snapshot: Path to the snapshot
+        @param astute: Parse the first Astute log
+        @param puppet: Parse the Puppet logs
+        """
+        self.path = snapshot
+        members = []
+        stream = tarfile.open(snapshot, 'r|*')
+        try:
+            for log in stream:
+                if self.use_index:
+                    members.append(log)
+                if not log.isfile():
+                    continue
+                if astute and self.matches(log.name, self.astute_patterns):
+                    astute = False
+                    AstuteLog.parse(stream.extractfile(log), log.name)
+                elif puppet and self.matches(log.name, self.puppet_patterns):
+                    notice(">>> %s" % log.name)
+                    PuppetLog.parse(stream.extractfile(log), log.name)
+        finally:
+            stream.close()
+        if self.use_index:
+            self.save_index(members)
 
 
 class FuelLogs:
     @classmethod
-    def puppet_logs(cls):
+    def find_logs(cls, name):
         for root, dirs, files in os.walk('/var/log'):
             for file in files:
-                if file == 'puppet-apply.log':
-                    path = os.path.join(root, file)
-                    print 'Processing: %s' % path
-                    yield path
+                if file == name:
+                    yield os.path.join(root, file)
+
+    @classmethod
+    def puppet_logs(cls):
+        for path in cls.find_logs('puppet-apply.log'):
+            notice('Processing: %s' % path)
+            yield path
 
     @classmethod
     def astute_logs(cls):
-        for root, dirs, files in os.walk('/var/log'):
-            for file in files:
-                if file == 'astute.log':
-                    path = os.path.join(root, file)
-                    print 'Processing: %s' % path
-                    yield path
+        for path in cls.find_logs('astute.log'):
+            notice('Processing: %s' % path)
+            yield path
 
     @classmethod
     def clear_log(cls, file):
@@ -140,45 +651,211 @@ class FuelLogs:
             f.truncate()
             f.close()
 
+
+def captured(function, *args):
+    """
+    Run a function and return everything it prints instead of printing it
+    @param function: Function to run
+    @return: Printed text
+    """
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        function(*args)
+        return sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+
+
+# the tasks are sent to the worker processes,
+# so they are module level functions which return the output
+
+
+def parse_file_task(task):
+    """
+    Parse a log file
+    @param task: Kind of the log and its path
+    @return: Output
+    """
+    return captured(parse_file, *task)
+
+
+def parse_file(kind, path):
+    notice('Processing: %s' % path)
+    parser = AstuteLog if kind == 'astute' else PuppetLog
+    with open(path, 'r') as log:
+        parser.parse(log, path)
+
+
+def parse_member_task(task):
+    """
+    Parse one log of a snapshot, it is read from its offset without scanning the archive
+    @param task: Path to the snapshot, kind of the log, member name, data offset and size
+    @return: Output
+    """
+    return captured(parse_member, *task)
+
+
+def parse_member(snapshot, kind, name, offset_data, size):
+    member = tarfile.TarInfo(name)
+    member.type = tarfile.REGTYPE
+    member.offset_data = offset_data
+    member.size = size
+    archive = tarfile.open(snapshot)
+    try:
+        if kind == 'astute':
+            AstuteLog.parse(archive.extractfile(member), name)
+        else:
+            notice(">>> %s" % name)
+            PuppetLog.parse(archive.extractfile(member), name)
+    finally:
+        archive.close()
+
+
+def parse_snapshot_task(task):
+    """
+    Parse all logs of a snapshot
+    @param task: Path to the snapshot and the options of FuelSnapshot.parse
+    @return: Output
+    """
+    snapshot, options = task
+    astute_patterns, puppet_patterns, use_index, astute, puppet, stream = options
+    snapshot_parser = FuelSnapshot(astute_patterns, puppet_patterns, use_index)
+    return captured(snapshot_parser.parse, snapshot, astute, puppet, stream)
+
+
+# task functions by the tag of the task
+task_functions = {
+    'file': parse_file_task,
+    'member': parse_member_task,
+    'snapshot': parse_snapshot_task,
+}
+
+
+def run_task(task):
+    """
+    Run a tagged task in a worker process
+    @param task: Tag of the task function and the task
+    @return: Output
+    """
+    tag, arguments = task
+    return task_functions[tag](arguments)
+
+
+def run_tasks(tasks, pool):
+    """
+    Run the tasks in the worker processes and print their output
+    in the order of the tasks as soon as it is ready
+    @param tasks: List of tagged tasks
+    @param pool: multiprocessing Pool
+    """
+    for output in pool.imap(run_task, tasks):
+        sys.stdout.write(output)
+        sys.stdout.flush()
+
+
+def parse_parallel(args):
+    """
+    Parse the logs in --jobs processes. There is a task for every log file,
+    for every snapshot or, if there are less snapshots than jobs, for every log
+    of the uncompressed snapshots. Compressed snapshots would have to be
+    decompressed up to every log by its worker, so they are not split.
+    All tasks go to the pool at once, so they all run side by side.
+    @param args: Parsed arguments
+    """
+    from multiprocessing import Pool
+    tasks = []
+    if len(args.snapshots) == 0:
+        notice('Looking for log files at /var/log')
+        if args.astute:
+            tasks.extend(('file', ('astute', path)) for path in FuelLogs.find_logs('astute.log'))
+        if args.puppet:
+            tasks.extend(('file', ('puppet', path)) for path in FuelLogs.find_logs('puppet-apply.log'))
+    else:
+        snapshots = [snapshot for snapshot in args.snapshots if os.path.isfile(snapshot)]
+        options = (args.astute_log, args.puppet_log, args.index, args.astute, args.puppet, args.stream)
+        split = len(snapshots) < args.jobs and not args.stream
+        FS = FuelSnapshot(args.astute_log, args.puppet_log, args.index)
+        for snapshot in snapshots:
+            if split:
+                FS.open_fuel_snapshot(snapshot)
+                if not FS.compressed():
+                    tasks.extend(('member', task) for task in FS.log_tasks(args.astute, args.puppet))
+                    FS.close_fuel_snapshot()
+                    continue
+                FS.close_fuel_snapshot()
+            tasks.append(('snapshot', (snapshot, options)))
+
+    pool = Pool(args.jobs)
+    try:
+        run_tasks(tasks, pool)
+    finally:
+        pool.close()
+        pool.join()
+
 #############################################################
 
-parser = argparse.ArgumentParser()
-parser.add_argument("--astute", "-a", action="store_true", default=False, help='Parse Astute log')
-parser.add_argument("--puppet", "-p", action="store_true", default=False, help='Parse Puppet logs')
-parser.add_argument("--clear",  "-c", action="store_true", default=False, help='Clear the logs on the master node')
-parser.add_argument('snapshots', metavar='SNAPSHOT', type=str, nargs='*',
-                    help='Take logs from these snapshots', default=[])
-args = parser.parse_args()
-
-if not args.puppet and not args.astute:
-    args.puppet = True
-    args.astute = True
-
-if len(args.snapshots) == 0:
-    print 'Looking for log files at /var/log'
-    if args.astute:
-        for astute_log in FuelLogs.astute_logs():
-            if args.clear:
-                FuelLogs.clear_log(astute_log)
-            else:
-                with open(astute_log, 'r') as log:
-                    AstuteLog.parse(log)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--astute", "-a", action="store_true", default=False, help='Parse Astute log')
+    parser.add_argument("--puppet", "-p", action="store_true", default=False, help='Parse Puppet logs')
+    parser.add_argument("--clear",  "-c", action="store_true", default=False, help='Clear the logs on the master node')
+    parser.add_argument("--stream", "-s", action="store_true", default=False,
+                        help='Read every snapshot once from the beginning to the end')
+    parser.add_argument("--index", "-i", action="store_true", default=False,
+                        help='Save the member index next to every snapshot and use it the next time')
+    parser.add_argument("--astute-log", action="append", metavar='PATTERN',
+                        help='Shell pattern of the Astute log names in snapshots, can be repeated')
+    parser.add_argument("--puppet-log", action="append", metavar='PATTERN',
+                        help='Shell pattern of the Puppet log names in snapshots, can be repeated')
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help='Parse the snapshots or the logs in this many processes')
+    parser.add_argument("--rules", "-r", type=str, metavar='FILE',
+                        help='Take the record filters from this YAML file')
+    parser.add_argument("--tags", "-t", action="store_true", default=False,
+                        help='Print the name of the matched rule before every record')
+    parser.add_argument("--count", action="store_true", default=False,
+                        help='Print only the number of records matched by every rule of every log')
+    parser.add_argument("--json", action="store_true", default=False,
+                        help='Print the matched records as events in JSON lines')
+    parser.add_argument('snapshots', metavar='SNAPSHOT', type=str, nargs='*',
+                        help='Take logs from these snapshots', default=[])
+    args = parser.parse_args()
 
-    if args.puppet:
-        for puppet_log in FuelLogs.puppet_logs():
-            if args.clear:
-                FuelLogs.clear_log(puppet_log)
-            else:
-                with open(puppet_log, 'r') as log:
-                    PuppetLog.parse(log)
-else:
-    FS = FuelSnapshot()
-    for snapshot in args.snapshots:
-        if not os.path.isfile(snapshot):
-            continue
-        FS.open_fuel_snapshot(snapshot)
+    if not args.puppet and not args.astute:
+        args.puppet = True
+        args.astute = True
+
+    if args.rules:
+        rule_sets = RuleSet.load(args.rules)
+        AstuteLog.rules = rule_sets.get('astute', RuleSet([]))
+        PuppetLog.rules = rule_sets.get('puppet', RuleSet([]))
+    LogParser.tags = args.tags
+    LogParser.count = args.count
+    LogParser.json_lines = args.json
+
+    if args.jobs > 1 and not args.clear:
+        parse_parallel(args)
+    elif len(args.snapshots) == 0:
+        notice('Looking for log files at /var/log')
         if args.astute:
-            FS.parse_astute_log()
+            for astute_log in FuelLogs.astute_logs():
+                if args.clear:
+                    FuelLogs.clear_log(astute_log)
+                else:
+                    with open(astute_log, 'r') as log:
+                        AstuteLog.parse(log, astute_log)
+
         if args.puppet:
-            FS.parse_puppet_logs()
-        FS.close_fuel_snapshot()
\ No newline at end of file
+            for puppet_log in FuelLogs.puppet_logs():
+                if args.clear:
+                    FuelLogs.clear_log(puppet_log)
+                else:
+                    with open(puppet_log, 'r') as log:
+                        PuppetLog.parse(log, puppet_log)
+    else:
+        FS = FuelSnapshot(args.astute_log, args.puppet_log, args.index)
+        for snapshot in args.snapshots:
+            if not os.path.isfile(snapshot):
+                continue
+            FS.parse(snapshot, args.astute, args.puppet, args.stream)
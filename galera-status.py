@@ -1,31 +1,94 @@
 #!/usr/bin/env python
 
-import MySQLdb
 import os
 import sys
 import argparse
+import threading
+import time
+from array import array
 from color import Color
 
 
+class ConnectionPool:
+    """
+    Idle database connections to one host which are reused between queries
+    """
+
+    def __init__(self, connect, size=2):
+        """
+        @param connect: Function which opens a new connection
+        @param size: Maximum number of idle connections to keep
+        """
+        self.connect = connect
+        self.size = size
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def get(self):
+        """
+        Take an idle connection or open a new one
+        @return: Connection object
+        """
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        return self.connect()
+
+    def put(self, connection):
+        """
+        Return a connection to the pool, close it if the pool is full
+        @param connection: Connection object
+        """
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        """
+        Close all idle connections
+        """
+        with self.lock:
+            idle = self.idle
+            self.idle = []
+        for connection in idle:
+            connection.close()
+
+
 class Galera:
-    def __init__(self):
+    def __init__(self, host='localhost', driver='MySQLdb'):
         self.cursor = None
         self.db = None
         self.data = {}
         self.auth_files = ['/etc/mysql/conf.d/password.cnf', '/root/.my.cnf']
-        self.connect_host = 'localhost'
+        self.connect_host = host
         self.connect_db = 'mysql'
+        self.driver = driver
+        self.pool = ConnectionPool(self.open_connection)
 
-    def connect(self):
+    def open_connection(self):
+        """
+        Open a new connection to the host using the first existing auth file
+        @return: Connection object
+        """
+        driver = __import__(self.driver)
+        options = {
+            'host': self.connect_host,
+            'db': self.connect_db,
+        }
+        if ':' in self.connect_host:
+            options['host'], port = self.connect_host.rsplit(':', 1)
+            options['port'] = int(port)
         for possible_file in self.auth_files:
             if os.path.isfile(possible_file):
-                self.db = MySQLdb.connect(
-                    host=self.connect_host,
-                    db=self.connect_db,
-                    read_default_file=possible_file,
-                )
-                self.cursor = self.db.cursor()
-                break
+                options['read_default_file'] = possible_file
+                return driver.connect(**options)
+        raise StandardError('Could not connect to the database!')
+
+    def connect(self):
+        self.db = self.pool.get()
+        self.cursor = self.db.cursor()
         if not (self.db and self.cursor):
             raise StandardError('Could not connect to the database!')
 
@@ -39,25 +102,234 @@ class Galera:
                 self.data[key] = value
 
     def get_galera_data(self):
+        """
+        Get wsrep variables and status using a pooled connection.
+        A connection which has failed is not returned to the pool.
+        """
+        self.data = {}
         self.connect()
-        self.get_variables("show variables like 'wsrep_%'")
-        self.get_variables("show status like 'wsrep_%'")
-        self.close()
+        try:
+            self.get_variables("show variables like 'wsrep_%'")
+            self.get_variables("show status like 'wsrep_%'")
+        except Exception:
+            self.close()
+            raise
+        self.release()
         if len(self.data) == 0:
             raise StandardError('There is no Galera data!')
 
     def load_from_yaml(self, yaml_data):
-        from yaml import load
+        import yaml
+        # the libyaml loader is much faster if it is available
+        loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
         stream = open(yaml_data, 'r')
-        self.data = load(stream)
+        self.data = yaml.load(stream, Loader=loader)
+        stream.close()
         if (type(self.data) is not dict) or (len(self.data) == 0):
             raise StandardError('There is no Galera data!')
 
+    def release(self):
+        """
+        Return the connection to the pool
+        """
+        if self.cursor:
+            self.cursor.close()
+        if self.db:
+            self.pool.put(self.db)
+        self.cursor = None
+        self.db = None
+
     def close(self):
         if self.cursor:
             self.cursor.close()
         if self.db:
             self.db.close()
+        self.cursor = None
+        self.db = None
+        self.pool.close()
+
+
+class Cluster:
+    """
+    Galera data of all cluster members collected concurrently
+    """
+
+    # wsrep_local_state of a synced node
+    synced_state = '4'
+    # fraction of time replication was paused by flow control
+    max_paused = 0.1
+    # average length of the receive queue
+    max_recv_queue = 1.0
+
+    def __init__(self, members):
+        """
+        @param members: List of Galera objects
+        """
+        self.members = members
+        self.data = {}
+        self.errors = {}
+
+    @staticmethod
+    def collect_member(member):
+        """
+        Get data of one member catching errors, it is run in a thread
+        @param member: Galera object
+        @return: Error message or None
+        """
+        try:
+            member.get_galera_data()
+        except Exception as e:
+            return str(e) or e.__class__.__name__
+
+    def collect(self):
+        """
+        Query all members at the same time
+        """
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(len(self.members))
+        try:
+            errors = pool.map(self.collect_member, self.members)
+        finally:
+            pool.close()
+        self.data = {}
+        self.errors = {}
+        for member, error in zip(self.members, errors):
+            if error:
+                self.errors[member.connect_host] = error
+            else:
+                self.data[member.connect_host] = member.data
+
+    def close(self):
+        for member in self.members:
+            member.close()
+
+    @staticmethod
+    def number(value):
+        """
+        Convert a status value to a number
+        @param value: Value string
+        @return: Float or None
+        """
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def majority(values):
+        """
+        Get the most common value
+        @param values: List of values
+        @return: Value or None if there is a tie
+        """
+        counts = {}
+        for value in values:
+            counts[value] = counts.get(value, 0) + 1
+        ranked = sorted(counts.values(), reverse=True)
+        if not ranked or (len(ranked) > 1 and ranked[0] == ranked[1]):
+            return None
+        return max(counts, key=counts.get)
+
+    def divergence(self):
+        """
+        Find members which differ from the rest of the cluster
+        @return: Dict of hosts and sets of diverging wsrep keys
+        """
+        flags = dict((host, set()) for host in self.data)
+        for key in ['wsrep_local_state', 'wsrep_cluster_conf_id', 'wsrep_cluster_state_uuid', 'wsrep_cluster_status']:
+            common = self.majority([data.get(key) for data in self.data.itervalues()])
+            for host, data in self.data.iteritems():
+                if data.get(key) != common:
+                    flags[host].add(key)
+        for host, data in self.data.iteritems():
+            if data.get('wsrep_local_state') != self.synced_state:
+                flags[host].add('wsrep_local_state')
+            paused = self.number(data.get('wsrep_flow_control_paused'))
+            if paused is not None and paused > self.max_paused:
+                flags[host].add('wsrep_flow_control_paused')
+            recv_queue = self.number(data.get('wsrep_local_recv_queue_avg'))
+            if recv_queue is not None and recv_queue > self.max_recv_queue:
+                flags[host].add('wsrep_local_recv_queue_avg')
+        return flags
+
+
+class History:
+    """
+    Bounded history of numeric wsrep values of one node.
+    Samples are kept in flat arrays used as a ring buffer.
+    """
+
+    # values which only grow, they are shown as rates
+    counters = (
+        'wsrep_replicated', 'wsrep_replicated_bytes', 'wsrep_received', 'wsrep_received_bytes',
+        'wsrep_local_commits', 'wsrep_local_cert_failures', 'wsrep_local_bf_aborts',
+        'wsrep_flow_control_paused_ns', 'wsrep_flow_control_sent', 'wsrep_flow_control_recv',
+    )
+
+    # values which go up and down, they are shown as moving averages
+    gauges = (
+        'wsrep_local_recv_queue', 'wsrep_local_recv_queue_avg', 'wsrep_local_send_queue',
+        'wsrep_local_send_queue_avg', 'wsrep_cert_deps_distance',
+    )
+
+    def __init__(self, size=60):
+        self.size = max(2, size)
+        self.fields = self.counters + self.gauges
+        self.times = array('d', [0.0]) * self.size
+        self.values = array('d', [0.0]) * (self.size * len(self.fields))
+        self.count = 0
+
+    def add(self, timestamp, data):
+        """
+        Write a sample to the ring, overwriting the oldest one
+        @param timestamp: Time of the sample
+        @param data: wsrep data dict
+        """
+        position = self.count % self.size
+        offset = position * len(self.fields)
+        self.times[position] = timestamp
+        for number, field in enumerate(self.fields):
+            self.values[offset + number] = Cluster.number(data.get(field)) or 0.0
+        self.count += 1
+
+    def value(self, age, field):
+        """
+        Get a value of a sample
+        @param age: 0 is the newest sample, 1 is the previous one and so on
+        @param field: Field name
+        @return: Value
+        """
+        position = (self.count - 1 - age) % self.size
+        return self.values[position * len(self.fields) + self.fields.index(field)]
+
+    def time(self, age):
+        return self.times[(self.count - 1 - age) % self.size]
+
+    def stats(self, window=10):
+        """
+        Calculate per second rates of counters and moving averages of gauges
+        over the last samples. A counter which went down was reset, its new
+        value is used as the delta.
+        @param window: Number of samples
+        @return: Dict of rates and averages or None if there are less than two samples
+        """
+        samples = min(window, self.count, self.size)
+        if samples < 2:
+            return None
+        interval = self.time(0) - self.time(samples - 1)
+        if interval <= 0:
+            return None
+        stats = {'interval': interval}
+        for field in self.counters:
+            new_value = self.value(0, field)
+            old_value = self.value(samples - 1, field)
+            delta = new_value if new_value < old_value else new_value - old_value
+            stats[field] = delta / interval
+        for field in self.gauges:
+            stats[field] = sum(self.value(age, field) for age in xrange(samples)) / samples
+        # nanoseconds of pause per second of time
+        stats['flow_control_paused_ratio'] = stats['wsrep_flow_control_paused_ns'] / 1e9
+        return stats
 
 
 class Interface:
@@ -65,11 +337,36 @@ class Interface:
     Functions related to input, output and formatting of data
     """
 
+    report = """
+Cluster: {{ wsrep_cluster_name|default('?')|color_info }} Size: {{ wsrep_cluster_size|default('?')|color_info }} Status: {{ wsrep_cluster_status }}
+
+Replication: {{ wsrep_on|align(3) }} Debug: {{ wsrep_debug|align(3) }}
+Connected:   {{ wsrep_connected|align(3) }}
+Ready:       {{ wsrep_ready|align(3) }}
+
+    """.strip()
+
     def __init__(self):
         self.parser = argparse.ArgumentParser()
         self.parser.add_argument("-d", "--debug", help="debug output", type=int, choices=[0, 1, 2, 3], default=0)
-        self.parser.add_argument("-f", "--file", help="get data from YAML file", type=str)
+        self.parser.add_argument("-f", "--file", help="get data from YAML file, can be repeated to show a cluster",
+                                 type=str, action='append')
+        self.parser.add_argument("-H", "--host", help="get data from this cluster member, can be repeated",
+                                 type=str, action='append')
+        self.parser.add_argument("--driver", help="DB-API module used to connect", type=str, default='MySQLdb')
+        self.parser.add_argument("-c", "--config", help="MySQL options file with credentials", type=str)
+        self.parser.add_argument("-w", "--watch", help="sample the node every N seconds and show rates",
+                                 type=float, metavar='INTERVAL')
+        self.parser.add_argument("-r", "--replay", help="with --watch: replay the YAML files as samples "
+                                                        "taken INTERVAL seconds apart", action='store_true')
+        self.parser.add_argument("--history", help="number of samples to keep", type=int, default=60)
+        self.parser.add_argument("-W", "--window", help="number of samples to calculate rates and averages over",
+                                 type=int, default=10)
         self.parser.add_argument("-y", "--yaml", help="output as YAML", action='store_true')
+        self.parser.add_argument("-p", "--plain", help="print the report without Jinja templates",
+                                 action='store_true')
+        self.parser.add_argument("--template-cache", help="directory for the compiled report templates",
+                                 type=str, metavar='DIR')
         self.parser.add_argument("-j", "--json", help="output as JSON", action='store_true')
         self.args = self.parser.parse_args()
 
@@ -79,14 +376,134 @@ class Interface:
         self.color_info = Color(foreground='blue')
         self.align = Color(align='right')
 
-        self.galera = Galera()
-        if self.args.file:
-            self.galera.load_from_yaml(self.args.file)
+        self.template = None
+        self.cluster = None
+        if self.args.watch:
+            self.watch()
+            return
+
+        if len(self.args.file or []) > 1 or len(self.args.host or []) > 1:
+            self.cluster = self.get_cluster()
         else:
-            self.galera.get_galera_data()
+            self.galera = self.create_galera(self.args.host[0] if self.args.host else 'localhost')
+            if self.args.file:
+                self.galera.load_from_yaml(self.args.file[0])
+            else:
+                self.galera.get_galera_data()
 
         self.result()
 
+    def create_galera(self, host):
+        """
+        Create a Galera object for a host using the chosen driver and credentials
+        @param host: Host name or host:port
+        @return: Galera object
+        """
+        galera = Galera(host, self.args.driver)
+        if self.args.config:
+            galera.auth_files = [self.args.config]
+        return galera
+
+    def samples(self):
+        """
+        Generate samples of one node: replay files or poll the database
+        reusing the pooled connection
+        @return: Iterator of time stamps and data dicts
+        """
+        if self.args.replay:
+            galera = Galera()
+            for number, path in enumerate(self.args.file or []):
+                galera.load_from_yaml(path)
+                yield number * self.args.watch, galera.data
+            return
+
+        galera = self.create_galera(self.args.host[0] if self.args.host else 'localhost')
+        try:
+            while True:
+                time_start = time.time()
+                try:
+                    if self.args.file:
+                        galera.load_from_yaml(self.args.file[0])
+                    else:
+                        galera.get_galera_data()
+                    yield time_start, galera.data
+                except StandardError as e:
+                    self.debug('Sample error: %s' % str(e), 1)
+                time.sleep(max(0, self.args.watch - (time.time() - time_start)))
+        finally:
+            galera.close()
+
+    def format_sample(self, data, stats):
+        """
+        Format the columns of one dashboard line
+        @param data: wsrep data of the sample
+        @param stats: Rates and averages or None
+        @return: List of column strings and their colors
+        """
+        state = data.get('wsrep_local_state_comment', '?')
+        columns = [(state, self.color_good if state == 'Synced' else self.color_bad)]
+        if not stats:
+            return columns + [('-', self.align)] * 6
+        paused_color = self.align
+        if stats['flow_control_paused_ratio'] > Cluster.max_paused:
+            paused_color = self.color_bad
+        queue_color = self.align
+        if stats['wsrep_local_recv_queue'] > Cluster.max_recv_queue:
+            queue_color = self.color_progress
+        return columns + [
+            ('%.0f' % stats['wsrep_replicated_bytes'], self.align),
+            ('%.0f' % stats['wsrep_received_bytes'], self.align),
+            ('%.1f' % stats['wsrep_local_commits'], self.align),
+            ('%.2f' % stats['wsrep_local_cert_failures'], self.align),
+            ('%.1f%%' % (stats['flow_control_paused_ratio'] * 100), paused_color),
+            ('%.2f' % stats['wsrep_local_recv_queue'], queue_color),
+        ]
+
+    def watch(self):
+        """
+        Print a line of rates and averages for every sample until interrupted
+        """
+        from json import dumps
+        history = History(self.args.history)
+        titles = ['Time', 'State', 'Repl B/s', 'Recv B/s', 'Commit/s', 'CertFail/s', 'FC paused', 'Recv queue']
+        widths = [8, 14, 10, 10, 9, 10, 9, 10]
+        for number, (timestamp, data) in enumerate(self.samples()):
+            history.add(timestamp, data)
+            stats = history.stats(self.args.window)
+            if self.args.json:
+                self.puts(dumps({'time': timestamp, 'state': data.get('wsrep_local_state_comment'), 'stats': stats}))
+            else:
+                if number % 20 == 0:
+                    self.puts(self.color_info(' '.join(title.rjust(width) for title, width in zip(titles, widths))))
+                if self.args.replay:
+                    time_string = '+%.0fs' % timestamp
+                else:
+                    time_string = time.strftime('%H:%M:%S', time.localtime(timestamp))
+                columns = [(time_string, self.align)] + self.format_sample(data, stats)
+                self.puts(' '.join(color(text, width, 'right') for (text, color), width in zip(columns, widths)))
+            sys.stdout.flush()
+
+    def get_cluster(self):
+        """
+        Get data of all cluster members from files or databases
+        @return: Cluster object
+        """
+        if self.args.file:
+            cluster = Cluster([])
+            for path in self.args.file:
+                member = Galera()
+                member.load_from_yaml(path)
+                cluster.data[path] = member.data
+        else:
+            cluster = Cluster([self.create_galera(host) for host in self.args.host])
+            cluster.collect()
+            cluster.close()
+        for host, error in sorted(cluster.errors.items()):
+            sys.stderr.write('Could not get data from %s: %s\n' % (host, error))
+        if not cluster.data:
+            raise StandardError('There is no Galera data!')
+        return cluster
+
     def debug(self, msg='', debug=1, offset=None):
         """
         Debug print string
@@ -121,7 +538,10 @@ class Interface:
         @return: YAML string
         """
         from yaml import dump
-        self.puts(dump(self.galera.data))
+        if self.cluster:
+            self.puts(dump(self.cluster.data))
+        else:
+            self.puts(dump(self.galera.data))
 
     def print_json(self):
         """
@@ -129,39 +549,118 @@ class Interface:
         @return: JSON string
         """
         from json import dumps
-        self.puts(dumps(self.galera.data))
+        if self.cluster:
+            self.puts(dumps(self.cluster.data))
+        else:
+            self.puts(dumps(self.galera.data))
 
     def result(self):
         if self.args.yaml:
             self.print_yaml()
         elif self.args.json:
             self.print_json()
+        elif self.cluster:
+            self.print_cluster()
+        elif self.args.plain:
+            self.print_plain()
         else:
             self.print_report()
 
-    def print_report(self):
-        from jinja2 import Environment
-        env = Environment()
+    def print_cluster(self):
+        """
+        Print a table of all cluster members with diverging values colored
+        """
+        columns = [
+            ('Node', 'wsrep_node_name'),
+            ('State', 'wsrep_local_state_comment'),
+            ('Status', 'wsrep_cluster_status'),
+            ('Conf', 'wsrep_cluster_conf_id'),
+            ('Size', 'wsrep_cluster_size'),
+            ('FC paused', 'wsrep_flow_control_paused'),
+            ('Recv queue', 'wsrep_local_recv_queue_avg'),
+            ('Committed', 'wsrep_last_committed'),
+        ]
+        # the comment is colored together with the state
+        flag_keys = {
+            'wsrep_local_state_comment': 'wsrep_local_state',
+        }
+        flags = self.cluster.divergence()
+
+        rows = []
+        for host in sorted(self.cluster.data):
+            data = self.cluster.data[host]
+            rows.append((host, [str(data.get(key, '?')) for title, key in columns]))
+        widths = [len(title) for title, key in columns]
+        for host, values in rows:
+            widths = map(max, widths, map(len, values))
+
+        self.puts(self.color_info('  '.join(title.ljust(width) for (title, key), width in zip(columns, widths)).rstrip()))
+        for host, values in rows:
+            line = []
+            for (title, key), value, width in zip(columns, values, widths):
+                value = value.ljust(width)
+                if flag_keys.get(key, key) in flags[host]:
+                    value = self.color_bad(value)
+                line.append(value)
+            self.output('  '.join(line).rstrip() + '\n')
+
+    def get_template(self):
+        """
+        Compile the report template once. The compiled bytecode is stored
+        on disk, so the next runs don't have to compile it again.
+        @return: Template object
+        """
+        if self.template:
+            return self.template
+        from jinja2 import Environment, DictLoader, FileSystemBytecodeCache
+        cache_dir = self.args.template_cache
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        env = Environment(
+            loader=DictLoader({'report': self.report}),
+            bytecode_cache=FileSystemBytecodeCache(cache_dir),
+            auto_reload=False,
+        )
         env.filters['color_info'] = self.color_info
         env.filters['color_bad'] = self.color_bad
         env.filters['color_good'] = self.color_good
         env.filters['color_progress'] = self.color_progress
         env.filters['align'] = self.align
+        self.template = env.get_template('report')
+        return self.template
 
-        report = """
-Cluster: {{ wsrep_cluster_name|default('?')|color_info }} Size: {{ wsrep_cluster_size|default('?')|color_info }} Status: {{ wsrep_cluster_status }}
-
-Replication: {{ wsrep_on|align(3) }} Debug: {{ wsrep_debug|align(3) }}
-Connected:   {{ wsrep_connected|align(3) }}
-Ready:       {{ wsrep_ready|align(3) }}
-
-        """.strip()
-
-        template = env.from_string(report)
+    def print_report(self):
+        try:
+            template = self.get_template()
+        except ImportError:
+            self.debug('Jinja2 is not available, using the plain report', 1)
+            self.print_plain()
+            return
         self.puts(template.render(self.galera.data))
 
+    def print_plain(self):
+        """
+        Print the same report as the template does without Jinja
+        """
+        data = self.galera.data
+        self.puts('Cluster: %s Size: %s Status: %s' % (
+            self.color_info(str(data.get('wsrep_cluster_name', '?'))),
+            self.color_info(str(data.get('wsrep_cluster_size', '?'))),
+            data.get('wsrep_cluster_status', ''),
+        ))
+        self.puts()
+        self.puts('Replication: %s Debug: %s' % (
+            self.align(str(data.get('wsrep_on', '')), 3),
+            self.align(str(data.get('wsrep_debug', '')), 3),
+        ))
+        self.puts('Connected:   %s' % self.align(str(data.get('wsrep_connected', '')), 3))
+        self.puts('Ready:       %s' % self.align(str(data.get('wsrep_ready', '')), 3))
+
 
 ##############################################################################
 
 if __name__ == '__main__':
-    interface = Interface()
+    try:
+        interface = Interface()
+    except KeyboardInterrupt:
+        pass
@@ -1,5 +1,16 @@
 #!/usr/bin/env python
 import sys
+import re
+import csv
+import time
+import heapq
+import operator
+import threading
+import BaseHTTPServer
+import SocketServer
+from array import array
+from collections import OrderedDict
+from itertools import izip, compress, repeat
 import argparse
 from color import Color
 
@@ -12,9 +23,35 @@ class Interface:
     def __init__(self):
         self.parser = argparse.ArgumentParser()
         self.parser.add_argument("-d", "--debug", help="debug output", type=int, choices=[0, 1, 2, 3], default=0)
-        self.parser.add_argument("-u", "--url", help="get stats from url", type=str)
-        self.parser.add_argument("-s", "--socket", help="get stats from socket", type=str)
-        self.parser.add_argument("-f", "--file", help="get stats from file", type=str)
+        self.parser.add_argument("-u", "--url", help="get stats from url, can be repeated", type=str, action='append')
+        self.parser.add_argument("-s", "--socket", help="get stats from socket, can be repeated", type=str, action='append')
+        self.parser.add_argument("-f", "--file", help="get stats from file, can be repeated", type=str, action='append')
+        self.parser.add_argument("-T", "--timeout", help="timeout of every source in seconds", type=float, default=10)
+        self.parser.add_argument("-C", "--compare", help="show only servers which states differ between sources",
+                                 action='store_true')
+        self.parser.add_argument("-q", "--query", help="show only these proxies, types (1 - frontends, "
+                                                       "2 - backends, 4 - servers) and servers, -1 means any",
+                                 type=int, nargs=3, metavar=('IID', 'TYPE', 'SID'))
+        self.parser.add_argument("--where", help="show only rows matching a condition like 'hrsp_5xx>0', "
+                                                 "'status=DOWN' or 'pxname~^nova', can be repeated",
+                                 type=str, action='append', metavar='CONDITION')
+        self.parser.add_argument("--sort", help="sort rows by a column, add ':desc' to sort in descending order",
+                                 type=str, metavar='COLUMN[:desc]')
+        self.parser.add_argument("--top", help="show only first N rows", type=int, metavar='N')
+        self.parser.add_argument("--columns", help="comma separated list of columns to show", type=str)
+        self.parser.add_argument("-w", "--watch", help="poll stats every N seconds and show rates",
+                                 type=float, metavar='INTERVAL')
+        self.parser.add_argument("-e", "--events", help="show only changes of servers in watch mode",
+                                 action='store_true')
+        self.parser.add_argument("-H", "--history", help="number of samples to keep in watch mode",
+                                 type=int, default=60)
+        self.parser.add_argument("-W", "--window", help="window in seconds to calculate rates over",
+                                 type=float, default=60)
+        self.parser.add_argument("-S", "--serve", help="serve stats over HTTP as JSON, CSV and Prometheus metrics",
+                                 action='store_true')
+        self.parser.add_argument("-a", "--address", help="listen on this address", type=str, default='0.0.0.0')
+        self.parser.add_argument("-p", "--port", help="listen on this port", type=int, default=9101)
+        self.parser.add_argument("--ttl", help="query the sources at most once in N seconds", type=float, default=1.0)
         self.parser.add_argument("-y", "--yaml", help="output as YAML", action='store_true')
         self.parser.add_argument("-c", "--csv", help="output as CSV", action='store_true')
         self.parser.add_argument("-j", "--json", help="output as JSON", action='store_true')
@@ -23,6 +60,7 @@ class Interface:
         self.color_on = Color(foreground='green')
         self.color_off = Color(foreground='red')
         self.color_title = Color(foreground='blue')
+        self.color_changed = Color(foreground='yellow', attribute='bold')
 
         self.color_table = {
             'UP': self.color_on,
@@ -31,7 +69,12 @@ class Interface:
         }
 
         if not (self.args.file or self.args.url or self.args.socket):
-            self.args.socket = '/var/lib/haproxy/stats'
+            self.args.socket = ['/var/lib/haproxy/stats']
+
+        self.sources = self.list_sources()
+        if self.args.compare and len(self.sources) < 2:
+            self.parser.error('--compare needs at least two sources')
+        self.sessions = {}
 
     def debug(self, msg='', debug=1, offset=None):
         """
@@ -61,11 +104,29 @@ class Interface:
         """
         sys.stdout.write(str(msg))
 
-    def get_from_file(self):
+    def list_sources(self):
+        """
+        Get all sources of stats given in the options.
+        The stats are kept by location, so every location is used once.
+        @return: List of (kind, location) tuples
+        """
+        sources = []
+        locations = set()
+        for kind in ['file', 'url', 'socket']:
+            for location in getattr(self.args, kind) or []:
+                if location in locations:
+                    sys.stderr.write('Source %s is given more than once, using it once\n' % location)
+                    continue
+                locations.add(location)
+                sources.append((kind, location))
+        return sources
+
+    def get_from_file(self, path):
         """
         Read stats csv data from a file
+        @param path: Path to the file
         """
-        csv = open(self.args.file)
+        csv = open(path)
         data = csv.read()
         csv.close()
         if data:
@@ -73,53 +134,224 @@ class Interface:
         else:
             raise StandardError('Could not get data from file')
 
-    def get_from_url(self):
+    def get_from_url(self, url):
         """
         Downalod stats csv data from haproxy's status url
+        @param url: Stats url, usually ending with ";csv"
         """
         import urllib2
-        response = urllib2.urlopen(self.args.url)
+        response = urllib2.urlopen(url, timeout=self.args.timeout)
         data = response.read()
         if data:
             return data
         else:
             raise StandardError('Could not get data from URL')
 
-    def get_from_socket(self):
+    def stats_command(self):
+        """
+        Make the "show stat" command for the stats socket
+        @return: Command string
+        """
+        if self.args.query:
+            return "show stat %d %d %d\n" % tuple(self.args.query)
+        return "show stat\n"
+
+    def read_socket(self, sock, buffer_size=65536, terminator=None):
+        """
+        Read everything from a socket until it is closed
+        @param sock: Connected socket
+        @param buffer_size: Initial size of the receive buffer, it grows twice when filled
+        @param terminator: Stop reading when data ends with this string
+        @return: Data string
+        """
+        data = bytearray(buffer_size)
+        view = memoryview(data)
+        size = 0
+        reads = 0
+        while True:
+            if size == len(data):
+                # a bytearray can not be resized while a memoryview of it exists
+                del view
+                data.extend(len(data) * '\0')
+                view = memoryview(data)
+            received = sock.recv_into(view[size:])
+            reads += 1
+            if not received:
+                if terminator:
+                    raise StandardError('Socket was closed before the end of data')
+                break
+            size += received
+            if terminator and data[size - len(terminator):size] == terminator:
+                size -= len(terminator)
+                break
+        del view
+        self.debug('Read %d bytes in %d reads' % (size, reads), 2)
+        return str(data[:size])
+
+    def get_from_socket(self, path):
         """
         Get status csv data from haproxy's control socket
+        @param path: Path to the socket
         """
         import socket
         sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        sock.connect(self.args.socket)
-        message = "show stat\n"
-        buffer_size = 32
-        sock.sendall(message)
-        data = ''
-        buf = sock.recv(buffer_size)
-        while buf:
-            data += buf
-            buf = sock.recv(buffer_size)
+        sock.settimeout(self.args.timeout)
+        try:
+            sock.connect(path)
+            sock.sendall(self.stats_command())
+            data = self.read_socket(sock)
+        finally:
+            sock.close()
         if data:
             return data
         else:
             raise StandardError('Could not get CSV from socket')
 
-    def get_status(self):
+    def open_session(self, path):
         """
-        Get status date using one of methods
+        Open an interactive session with haproxy's control socket
+        which stays connected between the commands
+        @param path: Path to the socket
         """
-        if self.args.file:
-            self.csv = self.get_from_file()
-        elif self.args.url:
-            self.csv = self.get_from_url()
+        import socket
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.args.timeout)
+        try:
+            sock.connect(path)
+            sock.sendall("prompt\n")
+            self.read_socket(sock, 4096, '> ')
+        except StandardError:
+            sock.close()
+            raise
+        self.sessions[path] = sock
+        self.debug('Opened session with: %s' % path, 2)
+
+    def close_session(self, path=None):
+        """
+        Close an interactive session if it is open
+        @param path: Path to the socket, close all sessions if not set
+        """
+        if path is None:
+            for path in self.sessions.keys():
+                self.close_session(path)
+            return
+        sock = self.sessions.pop(path, None)
+        if sock:
+            sock.close()
+
+    def get_from_session(self, path=None):
+        """
+        Get status csv data using the interactive session, open it if needed.
+        Every answer ends with an empty line and the "> " prompt.
+        HAProxy closes sessions which were idle longer than "stats timeout",
+        so if an old session fails, it is opened again and the command is retried once.
+        @param path: Path to the socket, the first socket if not set
+        """
+        if path is None:
+            path = self.args.socket[0]
+        reused = path in self.sessions
+        if not reused:
+            self.open_session(path)
+        try:
+            self.sessions[path].sendall(self.stats_command())
+            data = self.read_socket(self.sessions[path], terminator='\n> ')
+        except StandardError as e:
+            self.close_session(path)
+            if not reused:
+                raise
+            self.debug('Session with %s failed: %s, reconnecting' % (path, str(e)), 1)
+            return self.get_from_session(path)
+        if data:
+            return data
         else:
-            self.csv = self.get_from_socket()
+            raise StandardError('Could not get CSV from socket')
 
-        if not self.csv:
-            raise StandardError('There is no CSV')
+    def get_csv(self, source):
+        """
+        Get stats csv data using one of methods
+        @param source: (kind, location) tuple
+        @return: CSV string
+        """
+        kind, location = source
+        if kind == 'file':
+            return self.get_from_file(location)
+        elif kind == 'url':
+            return self.get_from_url(location)
+        elif self.args.watch:
+            return self.get_from_session(location)
         else:
-            self.status = Status(self, self.csv)
+            return self.get_from_socket(location)
+
+    def get_source_status(self, source):
+        """
+        Get and parse stats of one source
+        @param source: (kind, location) tuple
+        @return: Status object
+        """
+        time_start = time.time()
+        csv = self.get_csv(source)
+        if not csv:
+            raise StandardError('There is no CSV')
+        status = Status(self, csv)
+
+        # the socket filters by itself, other sources have to be filtered here
+        if self.args.query and source[0] != 'socket':
+            status.filter(*self.args.query)
+
+        self.debug('Source: %s %.3f ms' % (source[1], (time.time() - time_start) * 1000), 2)
+        return status
+
+    def fetch_source(self, source):
+        """
+        Get stats of one source catching errors, it is run in a thread
+        @param source: (kind, location) tuple
+        @return: Status object and error message
+        """
+        try:
+            return self.get_source_status(source), None
+        except Exception as e:
+            return None, str(e) or e.__class__.__name__
+
+    def get_statuses(self):
+        """
+        Get stats of all sources concurrently
+        @return: Ordered dict of source locations and Status objects
+        """
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(min(len(self.sources), 32))
+        try:
+            results = pool.map(self.fetch_source, self.sources)
+        finally:
+            pool.close()
+
+        statuses = OrderedDict()
+        for (kind, location), (status, error) in zip(self.sources, results):
+            if error:
+                sys.stderr.write('Could not get stats from %s: %s\n' % (location, error))
+            else:
+                statuses[location] = status
+        if not statuses:
+            raise StandardError('Could not get stats from any source')
+        return statuses
+
+    def fetch_status(self):
+        """
+        Get stats of all sources.
+        Stats of several sources are merged into one Status by source.
+        @return: Ordered dict of sources and their Status objects, Status object
+        """
+        if len(self.sources) == 1:
+            statuses = OrderedDict([(self.sources[0][1], self.get_source_status(self.sources[0]))])
+            return statuses, statuses.values()[0]
+        statuses = self.get_statuses()
+        return statuses, Status.merge(self, statuses)
+
+    def get_status(self):
+        """
+        Get status date using one of methods
+        """
+        self.statuses, self.status = self.fetch_status()
+        self.csv = self.status.csv
 
     def status_color(self, status, string=None):
         """
@@ -140,7 +372,12 @@ class Interface:
         Returns raw csv
         @return: CSV string
         """
-        self.puts(self.csv)
+        if not self.status.sources:
+            self.puts(self.csv)
+            return
+        for source, status in self.status.sources.iteritems():
+            self.puts('>>> %s' % source)
+            self.puts(status.csv)
 
     def print_yaml(self):
         """
@@ -148,7 +385,10 @@ class Interface:
         @return: YAML string
         """
         from yaml import dump
-        self.puts(dump(self.status.data))
+        if self.args.compare:
+            self.puts(dump(self.status.differences()))
+        else:
+            self.puts(dump(self.status.data))
 
     def print_json(self):
         """
@@ -156,7 +396,10 @@ class Interface:
         @return: JSON string
         """
         from json import dumps
-        self.puts(dumps(self.status.data))
+        if self.args.compare:
+            self.puts(dumps(self.status.differences()))
+        else:
+            self.puts(dumps(self.status.data))
 
     def print_service_title(self, service_name, service_element):
         """
@@ -173,8 +416,42 @@ class Interface:
         scur = frontend_element.get('scur', 0)
         rate = frontend_element.get('rate', 0)
         service_title = "* %s %s (%s:%s)" % (service_name, service_status, scur, rate)
+        rates = frontend_element.get('rates') or backend_element.get('rates')
+        if rates:
+            service_title += ' ' + self.rates_string(rates)
         self.puts(service_title)
 
+    @staticmethod
+    def bytes_string(value):
+        """
+        Format a number of bytes
+        @param value: Number of bytes
+        @return: String like 1.5K
+        """
+        for unit in ['', 'K', 'M', 'G']:
+            if abs(value) < 1024:
+                break
+            value /= 1024.0
+        if unit:
+            return '%.1f%s' % (value, unit)
+        return '%d' % value
+
+    def rates_string(self, rates):
+        """
+        Format rates calculated in watch mode
+        @param rates: Rates structure
+        @return: String
+        """
+        rates_string = "[%.1f/s in:%s/s out:%s/s err:%.1f%%]" % (
+            rates['stot'],
+            self.bytes_string(rates['bin']),
+            self.bytes_string(rates['bout']),
+            rates['error_ratio'] * 100,
+        )
+        if rates['error_ratio']:
+            rates_string = self.color_off(rates_string)
+        return rates_string
+
     def print_servers_line(self, service_element):
         """
         Print servers description block
@@ -189,25 +466,214 @@ class Interface:
             scur = server_element.get('scur', 0)
             rate = server_element.get('rate', 0)
             svname = self.status_color(status, server_element['svname'])
+            if server_element.get('changes'):
+                svname = self.color_changed('!') + svname
             server_block = "  %s %s %s (%s:%s)" % (svname, status, check_status, scur, rate)
+            if server_element.get('rates'):
+                server_block += ' ' + self.rates_string(server_element['rates'])
             self.output(server_block)
         self.puts('')
 
+    def print_services(self, data):
+        """
+        Print all services and their servers
+        @param data: Status data
+        """
+        for service in sorted(data):
+            service_element = data[service]
+            self.print_service_title(service, service_element)
+            self.print_servers_line(service_element)
+
+    def print_differences(self):
+        """
+        Print servers which states differ between sources
+        """
+        # some of the sources may have failed
+        sources = len(self.status.sources or {})
+        if sources < 2:
+            raise StandardError('Could not compare, got stats from only %d source' % sources)
+        differences = self.status.differences()
+        if not differences:
+            self.puts('States of all servers are the same on %d sources' % sources)
+            return
+        for service in sorted(differences):
+            self.puts('* %s' % self.color_title(service))
+            for server in sorted(differences[service]):
+                states = differences[service][server]
+                line = ' '.join('%s:%s' % (source, self.status_color(state)) for source, state in states.iteritems())
+                self.puts('%s %s' % (server, line), 1)
+
+    def query_columns(self, table):
+        """
+        Get the list of columns to show for a query
+        @param table: Table object
+        @return: List of column names
+        """
+        if self.args.columns:
+            columns = [column.strip() for column in self.args.columns.split(',') if column.strip()]
+        else:
+            columns = ['pxname', 'svname', 'status', 'check_status']
+            for condition in self.args.where or []:
+                columns.append(Table.parse_condition(condition)[0])
+            if self.args.sort:
+                columns.append(self.args.sort.split(':')[0])
+        if 'source' in table.values and 'source' not in columns:
+            columns.insert(0, 'source')
+        unique_columns = []
+        for column in columns:
+            if column not in table.values:
+                raise StandardError('There is no column: %s' % column)
+            if column not in unique_columns:
+                unique_columns.append(column)
+        return unique_columns
+
+    def query(self):
+        """
+        Run the query given by --where, --sort and --top on the stats table
+        @return: Table object, list of row indexes and list of columns
+        """
+        table = self.status.table()
+        indexes = table.where(self.args.where or [])
+        if self.args.sort:
+            column, _, order = self.args.sort.partition(':')
+            indexes = table.sort(indexes, column, order == 'desc', self.args.top)
+        if self.args.top is not None:
+            indexes = indexes[:self.args.top]
+        return table, indexes, self.query_columns(table)
+
+    def print_query(self):
+        """
+        Print rows selected by the query in the chosen format
+        """
+        table, indexes, columns = self.query()
+        if self.args.json or self.args.yaml:
+            rows = table.rows(indexes, columns, None)
+        else:
+            rows = table.rows(indexes, columns)
+
+        if self.args.csv:
+            output = [','.join(columns)]
+            for row in rows:
+                output.append(','.join(str(value) for value in row))
+            self.puts('# ' + '\n'.join(output))
+            return
+
+        if self.args.json or self.args.yaml:
+            # the rows are nested by their source, service and server even if these columns are not selected
+            key_columns = [column for column in ('source', 'pxname', 'svname') if column in table.values]
+            # yaml can not dump OrderedDict as a plain mapping
+            mapping = OrderedDict if self.args.json else dict
+            data = mapping()
+            for keys, row in izip(table.rows(indexes, key_columns, None), rows):
+                element = data
+                for key in keys[:-1]:
+                    element = element.setdefault(key, mapping())
+                element[keys[-1]] = mapping(izip(columns, row))
+            if self.args.json:
+                from json import dumps
+                self.puts(dumps(data))
+            else:
+                from yaml import dump
+                self.puts(dump(data))
+            return
+
+        widths = [len(column) for column in columns]
+        lines = [[str(value) for value in row] for row in rows]
+        for line in lines:
+            widths = map(max, widths, map(len, line))
+        self.puts(self.color_title('  '.join(column.ljust(width) for column, width in zip(columns, widths)).rstrip()))
+        status_number = columns.index('status') if 'status' in columns else None
+        for line in lines:
+            string = '  '.join(value.ljust(width) for value, width in zip(line, widths)).rstrip()
+            if status_number is not None:
+                string = self.status_color(line[status_number], string)
+            self.puts(string)
+
     def result(self):
         """
         Output human-readable results
         """
-        if self.args.yaml:
+        if self.args.where or self.args.sort or self.args.top is not None or self.args.columns:
+            self.print_query()
+        elif self.args.yaml:
             self.print_yaml()
         elif self.args.csv:
             self.print_csv()
         elif self.args.json:
             self.print_json()
+        elif self.args.compare:
+            self.print_differences()
+        elif self.status.sources:
+            for source, data in self.status.data.iteritems():
+                self.puts('>>> %s' % source)
+                self.print_services(data)
         else:
-            for service in sorted(self.status.data):
-                service_element = self.status.data[service]
-                self.print_service_title(service, service_element)
-                self.print_servers_line(service_element)
+            self.print_services(self.status.data)
+
+    def event_string(self, event):
+        """
+        Format a change event
+        @param event: Event structure
+        @return: String
+        """
+        line = '%s/%s %s: %s -> %s' % (event['pxname'], event['svname'], event['event'], event['old'], event['new'])
+        if 'source' in event:
+            line = '%s %s' % (event['source'], line)
+        return self.color_changed(line)
+
+    def print_events(self, events):
+        """
+        Print change events
+        @param events: List of events
+        """
+        if self.args.json:
+            from json import dumps
+            for event in events:
+                self.puts(dumps(event))
+            return
+        for event in events:
+            self.puts(self.event_string(event))
+
+    def watch(self):
+        """
+        Poll stats, keep counters history, show rates and changes of servers until interrupted
+        """
+        collectors = {}
+        previous = {}
+        while True:
+            time_start = time.time()
+            try:
+                self.get_status()
+                events = []
+                for source, status in self.statuses.iteritems():
+                    if source not in collectors:
+                        collectors[source] = Collector(self.args.history)
+                    collectors[source].add(time_start, status)
+                    collectors[source].annotate(status.data, self.args.window)
+                    if source in previous:
+                        source_events = status.changes(previous[source])
+                        status.mark_changes(source_events)
+                        for event in source_events:
+                            event['time'] = time_start
+                            if self.status.sources:
+                                event['source'] = source
+                        events += source_events
+                    previous[source] = status
+                self.debug('Changes: %d' % len(events), 1)
+
+                if self.args.events:
+                    self.print_events(events)
+                else:
+                    if not (self.args.yaml or self.args.json or self.args.csv):
+                        self.puts(self.color_title(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time_start))))
+                        self.print_events(events)
+                    self.result()
+                sys.stdout.flush()
+                self.debug('Cycle: %.3f ms' % ((time.time() - time_start) * 1000), 1)
+            except StandardError as e:
+                self.debug('Cycle error: %s' % str(e), 1)
+
+            time.sleep(max(0, self.args.watch - (time.time() - time_start)))
 
 
 class Status:
@@ -215,261 +681,789 @@ class Status:
     HAproxy status structure
     """
 
+    # columns of "show stat" used when the CSV has no "# pxname,..." header
+    default_columns = (
+        'pxname', 'svname', 'qcur', 'qmax', 'scur', 'smax', 'slim', 'stot', 'bin', 'bout',
+        'dreq', 'dresp', 'ereq', 'econ', 'eresp', 'wretr', 'wredis', 'status', 'weight', 'act',
+        'bck', 'chkfail', 'chkdown', 'lastchg', 'downtime', 'qlimit', 'pid', 'iid', 'sid', 'throttle',
+        'lbtot', 'tracked', 'type', 'rate', 'rate_lim', 'rate_max', 'check_status', 'check_code',
+        'check_duration', 'hrsp_1xx', 'hrsp_2xx', 'hrsp_3xx', 'hrsp_4xx', 'hrsp_5xx', 'hrsp_other',
+        'hanafail', 'req_rate', 'req_rate_max', 'req_tot', 'cli_abrt', 'srv_abrt',
+    )
+
+    # columns which values are text, every other column is a counter or a gauge
+    text_columns = frozenset([
+        'pxname', 'svname', 'status', 'tracked', 'check_status', 'last_chk', 'last_agt',
+        'agent_status', 'check_desc', 'agent_desc', 'cookie', 'mode', 'algo', 'addr',
+    ])
+
+    # columns which are not metrics
+    id_columns = frozenset(['pid', 'iid', 'sid', 'type'])
+
+    # columns which only grow
+    counter_columns = frozenset([
+        'stot', 'bin', 'bout', 'dreq', 'dresp', 'ereq', 'econ', 'eresp', 'wretr', 'wredis',
+        'chkfail', 'chkdown', 'downtime', 'lbtot', 'hrsp_1xx', 'hrsp_2xx', 'hrsp_3xx',
+        'hrsp_4xx', 'hrsp_5xx', 'hrsp_other', 'hanafail', 'req_tot', 'cli_abrt', 'srv_abrt',
+    ])
+
     def __init__(self, interface, csv):
         self.csv = csv
         self.interface = interface
+        self.columns = list(self.default_columns)
+        self.sources = None
+        self.signatures_cache = None
+        self.column_values = None
+        self.table_cache = None
+        self.parse_csv()
+
+    @classmethod
+    def merge(cls, interface, statuses):
+        """
+        Merge statuses of several sources into one with the source as the first key
+        @param interface: Interface object
+        @param statuses: Ordered dict of sources and Status objects
+        @return: Status object
+        """
+        status = cls(interface, '')
+        status.sources = statuses
+        status.csv = '\n'.join(source.csv for source in statuses.itervalues())
+        status.data = OrderedDict((name, source.data) for name, source in statuses.iteritems())
+        return status
+
+    def signatures(self):
+        """
+        Get the values of every server which are compared between snapshots
+        @return: Dict of (pxname, svname) and ((status, check_status), lastchg)
+        """
+        if self.signatures_cache is None:
+            signatures = {}
+            for service_name, service in self.data.iteritems():
+                for server_name, server in service.iteritems():
+                    state = (server.get('status'), server.get('check_status'))
+                    signatures[(service_name, server_name)] = (state, server.get('lastchg'))
+            self.signatures_cache = signatures
+        return self.signatures_cache
+
+    def changes(self, old):
+        """
+        Find changes of servers since an older snapshot.
+        "flap" means that lastchg was reset, so the state has changed
+        and changed back between the snapshots.
+        @param old: Older Status object of the same source
+        @return: List of events: dicts with pxname, svname, event, old and new values
+        """
+        events = []
+        old_signatures = old.signatures()
+        for key, (state, lastchg) in self.signatures().iteritems():
+            old_signature = old_signatures.get(key)
+            if old_signature is None:
+                events.append(self.event(key, 'added', None, state[0]))
+                continue
+            old_state, old_lastchg = old_signature
+            if state == old_state and lastchg >= old_lastchg:
+                continue
+            if state[0] != old_state[0]:
+                events.append(self.event(key, 'status', old_state[0], state[0]))
+            if state[1] != old_state[1]:
+                events.append(self.event(key, 'check_status', old_state[1], state[1]))
+            if state == old_state:
+                events.append(self.event(key, 'flap', old_lastchg, lastchg))
+        for key in old_signatures:
+            if key not in self.signatures_cache:
+                events.append(self.event(key, 'removed', old_signatures[key][0][0], None))
+        events.sort(key=lambda event: (event['pxname'], event['svname']))
+        return events
 
-        self.status_fields = {
-            'pxname': {
-                'number': 0,
-                'title': 'pxname',
-            },
-            'svname': {
-                'number': 1,
-                'title': 'svname',
-            },
-            'qcur': {
-                'number': 2,
-                'title': 'qcur',
-            },
-            'qmax': {
-                'number': 3,
-                'title': 'qmax',
-            },
-            'scur': {
-                'number': 4,
-                'title': 'scur',
-            },
-            'smax': {
-                'number': 5,
-                'title': 'smax',
-            },
-            'slim': {
-                'number': 6,
-                'title': 'slim',
-            },
-            'stot': {
-                'number': 7,
-                'title': 'stot',
-            },
-            'bin': {
-                'number': 8,
-                'title': 'bin',
-            },
-            'bout': {
-                'number': 9,
-                'title': 'bout',
-            },
-            'dreq': {
-                'number': 10,
-                'title': 'dreq',
-            },
-            'dresp': {
-                'number': 11,
-                'title': 'dresp',
-            },
-            'ereq': {
-                'number': 12,
-                'title': 'ereq',
-            },
-            'econ': {
-                'number': 13,
-                'title': 'econ',
-            },
-            'eresp': {
-                'number': 14,
-                'title': 'eresp',
-            },
-            'wretr': {
-                'number': 15,
-                'title': 'wretr',
-            },
-            'wredis': {
-                'number': 16,
-                'title': 'wredis',
-            },
-            'status': {
-                'number': 17,
-                'title': 'status',
-            },
-            'weight': {
-                'number': 18,
-                'title': 'weight',
-            },
-            'act': {
-                'number': 19,
-                'title': 'act',
-            },
-            'bck': {
-                'number': 20,
-                'title': 'bck',
-            },
-            'chkfail': {
-                'number': 21,
-                'title': 'chkfail',
-            },
-            'chkdown': {
-                'number': 22,
-                'title': 'chkdown',
-            },
-            'lastchg': {
-                'number': 23,
-                'title': 'lastchg',
-            },
-            'downtime': {
-                'number': 24,
-                'title': 'downtime',
-            },
-            'qlimit': {
-                'number': 25,
-                'title': 'qlimit',
-            },
-            'pid': {
-                'number': 26,
-                'title': 'pid',
-            },
-            'iid': {
-                'number': 27,
-                'title': 'iid',
-            },
-            'sid': {
-                'number': 28,
-                'title': 'sid',
-            },
-            'throttle': {
-                'number': 29,
-                'title': 'throttle',
-            },
-            'lbtot': {
-                'number': 30,
-                'title': 'lbtot',
-            },
-            'tracked': {
-                'number': 31,
-                'title': 'tracked',
-            },
-            'type': {
-                'number': 32,
-                'title': 'type',
-            },
-            'rate': {
-                'number': 33,
-                'title': 'rate',
-            },
-            'rate_lim': {
-                'number': 34,
-                'title': 'rate_lim',
-            },
-            'rate_max': {
-                'number': 35,
-                'title': 'rate_max',
-            },
-            'check_status': {
-                'number': 36,
-                'title': 'check_status',
-            },
-            'check_code': {
-                'number': 37,
-                'title': 'check_code',
-            },
-            'check_duration': {
-                'number': 38,
-                'title': 'check_duration',
-            },
-            'hrsp_1xx': {
-                'number': 39,
-                'title': 'hrsp_1xx',
-            },
-            'hrsp_2xx': {
-                'number': 40,
-                'title': 'hrsp_2xx',
-            },
-            'hrsp_3xx': {
-                'number': 41,
-                'title': 'hrsp_3xx',
-            },
-            'hrsp_4xx': {
-                'number': 42,
-                'title': 'hrsp_4xx',
-            },
-            'hrsp_5xx': {
-                'number': 43,
-                'title': 'hrsp_5xx',
-            },
-            'hrsp_other': {
-                'number': 44,
-                'title': 'hrsp_other',
-            },
-            'hanafail': {
-                'number': 45,
-                'title': 'hanafail',
-            },
-            'req_rate': {
-                'number': 46,
-                'title': 'req_rate',
-            },
-            'req_rate_max': {
-                'number': 47,
-                'title': 'req_rate_max',
-            },
-            'req_tot': {
-                'number': 48,
-                'title': 'req_tot',
-            },
-            'cli_abrt': {
-                'number': 49,
-                'title': 'cli_abrt',
-            },
-            'srv_abrt': {
-                'number': 50,
-                'title': 'srv_abrt',
-            },
+    @staticmethod
+    def event(key, event, old, new):
+        """
+        Make a change event
+        @param key: (pxname, svname)
+        @param event: Event type
+        @param old: Old value
+        @param new: New value
+        @return: Event structure
+        """
+        return {
+            'pxname': key[0],
+            'svname': key[1],
+            'event': event,
+            'old': old,
+            'new': new,
         }
-        self.parse_csv()
+
+    def mark_changes(self, events):
+        """
+        Add the list of event types as "changes" to every changed server
+        @param events: List of events
+        """
+        for event in events:
+            server = self.data.get(event['pxname'], {}).get(event['svname'])
+            if server is not None:
+                server.setdefault('changes', []).append(event['event'])
+
+    def differences(self):
+        """
+        Find servers which states differ between sources.
+        A server missing from a source has the state None there.
+        @return: Dict of services, servers and their states by source
+        """
+        differences = {}
+        if not self.sources:
+            return differences
+        servers = set()
+        for data in self.data.itervalues():
+            for service_name, service in data.iteritems():
+                for server_name in service:
+                    servers.add((service_name, server_name))
+        for service_name, server_name in servers:
+            states = OrderedDict()
+            for source, data in self.data.iteritems():
+                server = data.get(service_name, {}).get(server_name)
+                states[source] = server and server.get('status')
+            if len(set(states.itervalues())) > 1:
+                differences.setdefault(service_name, {})[server_name] = states
+        return differences
+
+    @staticmethod
+    def parse_header(line):
+        """
+        Get column names from the "# pxname,svname,..." header line
+        @param line: Header line
+        @return: List of column names
+        """
+        columns = line.lstrip('#').strip().split(',')
+        while columns and not columns[-1]:
+            columns.pop()
+        return columns
+
+    def numeric_columns(self):
+        """
+        Get positions of the columns which values should be converted to numbers
+        @return: List of column indexes
+        """
+        return [number for number, column in enumerate(self.columns) if column not in self.text_columns]
+
+    @staticmethod
+    def to_numbers(values):
+        """
+        Convert column values to integers.
+        Counters repeat a lot, so every distinct value is converted only once.
+        @param values: Sequence of value strings
+        @return: List of integers, empty values are left as empty strings
+        and values which are not integers are left as they are
+        """
+        numbers = {'': ''}
+        for value in set(values):
+            if value:
+                try:
+                    numbers[value] = int(value)
+                except ValueError:
+                    numbers[value] = value
+        return map(numbers.__getitem__, values)
+
+    def filter(self, iid=-1, types=-1, sid=-1):
+        """
+        Leave only the selected rows like "show stat <iid> <type> <sid>" does
+        @param iid: Proxy id or -1 for all proxies
+        @param types: Bit mask of types: 1 - frontends, 2 - backends, 4 - servers
+        @param sid: Server id or -1 for all servers
+        """
+        for service_name in self.data.keys():
+            service = self.data[service_name]
+            for server_name in service.keys():
+                server = service[server_name]
+                if iid != -1 and server.get('iid') != iid:
+                    del service[server_name]
+                elif types != -1 and not types & (1 << server.get('type', 0)):
+                    del service[server_name]
+                elif sid != -1 and server.get('sid') != sid:
+                    del service[server_name]
+            if not service:
+                del self.data[service_name]
+        self.column_values = None
+        self.table_cache = None
+
+    def table(self):
+        """
+        Get the columnar form of the stats
+        @return: Table object
+        """
+        if self.table_cache is None:
+            if self.sources:
+                self.table_cache = Table.merge(OrderedDict(
+                    (source, status.table()) for source, status in self.sources.iteritems()
+                ))
+            elif self.column_values is not None:
+                self.table_cache = Table(self.columns, self.column_values)
+            else:
+                self.table_cache = Table.from_data(self.data, self.columns)
+        return self.table_cache
+
+    def raw_csv(self):
+        """
+        Get the CSV as it was received, every source under its own header
+        @return: CSV string
+        """
+        if not self.sources:
+            return self.csv
+        return ''.join('>>> %s\n%s' % (source, status.csv) for source, status in self.sources.iteritems())
+
+    def export_metrics(self):
+        """
+        Convert stats to Prometheus text format metrics
+        @return: Metrics text
+        """
+        def label(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        table = self.table()
+        types = {0: 'frontend', 1: 'backend', 2: 'server', 3: 'socket'}
+        type_values = table.values.get('type', repeat(float('nan'), table.size))
+        labels = []
+        for number, proxy, server, server_type in izip(
+                xrange(table.size), table.values['pxname'], table.values['svname'], type_values):
+            row_labels = 'proxy="%s",server="%s",type="%s"' % (
+                label(proxy), label(server), types.get(server_type, 'unknown'))
+            if 'source' in table.values:
+                row_labels = 'source="%s",%s' % (label(table.values['source'][number]), row_labels)
+            labels.append(row_labels)
+
+        lines = []
+        if 'status' in table.values:
+            lines.append('# HELP haproxy_status Status of the proxy or the server')
+            lines.append('# TYPE haproxy_status gauge')
+            for row_labels, status in izip(labels, table.values['status']):
+                lines.append('haproxy_status{%s,status="%s"} 1' % (row_labels, label(status)))
+
+        for column in table.columns:
+            column_values = table.values[column]
+            if column in self.id_columns or not isinstance(column_values, array):
+                continue
+            name = 'haproxy_%s' % column
+            if column in self.counter_columns:
+                name += '_total'
+                lines.append('# HELP %s Counter %s of HAProxy stats' % (name, column))
+                lines.append('# TYPE %s counter' % name)
+            else:
+                lines.append('# HELP %s Value %s of HAProxy stats' % (name, column))
+                lines.append('# TYPE %s gauge' % name)
+            for row_labels, value in izip(labels, column_values):
+                # NaN is an empty value
+                if value == value:
+                    lines.append('%s{%s} %d' % (name, row_labels, value))
+
+        return '\n'.join(lines) + '\n'
 
     def parse_csv(self):
         """
-        Parse CSV data into status structure
+        Parse CSV data into status structure.
+        Column names are taken from the header, numeric values are converted
+        to integers, empty values are left as empty strings.
         """
         self.data = {}
-        csv_lines = self.csv.split("\n")
+        csv_lines = self.csv.splitlines()
 
-        for csv_line in csv_lines:
-            if csv_line.startswith('#'):
+        if csv_lines and csv_lines[0].startswith('#'):
+            self.columns = self.parse_header(csv_lines[0])
+            csv_lines = csv_lines[1:]
+
+        columns = self.columns
+        width = len(columns)
+        numeric_columns = self.numeric_columns()
+        service_field = columns.index('pxname')
+        server_field = columns.index('svname')
+
+        rows = []
+        for csv_fields in csv.reader(csv_lines):
+            if len(csv_fields) <= server_field:
                 continue
-            if csv_line.startswith('pxname'):
+            if csv_fields[0].startswith('#') or csv_fields[service_field] == 'pxname':
                 continue
+            if len(csv_fields) < width:
+                csv_fields.extend([''] * (width - len(csv_fields)))
+            rows.append(csv_fields)
 
-            csv_fields = csv_line.split(',')
+        if not rows:
+            return
 
-            if len(csv_fields) < len(self.status_fields):
-                continue
+        # convert a whole column at once, it is much cheaper than converting row by row
+        values = zip(*rows)
+        for number in numeric_columns:
+            values[number] = self.to_numbers(values[number])
+        self.column_values = values
+
+        for csv_fields in izip(*values):
+            service = self.data.get(csv_fields[service_field])
+            if service is None:
+                service = self.data[csv_fields[service_field]] = {}
+            service[csv_fields[server_field]] = dict(izip(columns, csv_fields))
+
+
+class Table:
+    """
+    Columnar form of the stats: a sequence of values for every column.
+    Numeric columns are arrays of floats with NaN for empty values,
+    text columns are lists of strings.
+    """
+
+    operators = OrderedDict([
+        ('>=', operator.ge),
+        ('<=', operator.le),
+        ('!=', operator.ne),
+        ('!~', None),
+        ('=', operator.eq),
+        ('>', operator.gt),
+        ('<', operator.lt),
+        ('~', None),
+    ])
+
+    def __init__(self, columns, values):
+        """
+        @param columns: List of column names
+        @param values: List of column value sequences in the same order
+        """
+        self.columns = []
+        self.values = {}
+        self.size = 0
+        for column, column_values in izip(columns, values):
+            self.add_column(column, column_values)
+
+    def add_column(self, column, column_values):
+        """
+        Add a column, numbers are stored in an array
+        @param column: Column name
+        @param column_values: Sequence of values
+        """
+        nan = float('nan')
+        try:
+            column_values = array('d', [nan if value == '' else value for value in column_values])
+        except TypeError:
+            column_values = list(column_values)
+        self.columns.append(column)
+        self.values[column] = column_values
+        self.size = len(column_values)
+
+    @classmethod
+    def from_data(cls, data, columns):
+        """
+        Make a table from the nested status data
+        @param data: Status data
+        @param columns: List of column names
+        @return: Table object
+        """
+        rows = [server for service in data.itervalues() for server in service.itervalues()]
+        return cls(columns, [[row.get(column, '') for row in rows] for column in columns])
+
+    @classmethod
+    def merge(cls, tables):
+        """
+        Join tables of several sources and add the "source" column
+        @param tables: Ordered dict of sources and tables
+        @return: Table object
+        """
+        table = cls([], [])
+        columns = []
+        for source_table in tables.itervalues():
+            for column in source_table.columns:
+                if column not in columns:
+                    columns.append(column)
+        sources = []
+        for source, source_table in tables.iteritems():
+            sources.extend(repeat(source, source_table.size))
+        table.add_column('source', sources)
+        for column in columns:
+            column_values = []
+            for source_table in tables.itervalues():
+                column_values.extend(source_table.values.get(column, repeat('', source_table.size)))
+            table.add_column(column, column_values)
+        return table
+
+    @classmethod
+    def parse_condition(cls, condition):
+        """
+        Split a condition like "hrsp_5xx>0" to its parts
+        @param condition: Condition string
+        @return: Column, operator and value strings
+        """
+        match = re.match(r'^\s*([\w-]+)\s*(%s)\s*(.*?)\s*$' % '|'.join(map(re.escape, cls.operators)), condition)
+        if not match:
+            raise StandardError('Could not parse the condition: %s' % condition)
+        return match.groups()
+
+    def mask(self, condition, indexes=None):
+        """
+        Evaluate a condition on the whole column at once
+        @param condition: Condition string
+        @param indexes: Evaluate only these rows
+        @return: Sequence of true and false values for every row
+        """
+        column, condition_operator, value = self.parse_condition(condition)
+        if column not in self.values:
+            raise StandardError('There is no column: %s' % column)
+        column_values = self.values[column]
+        numeric = isinstance(column_values, array)
+        if indexes is not None:
+            column_values = map(column_values.__getitem__, indexes)
+        if condition_operator in ['~', '!~']:
+            if numeric:
+                column_values = map(str, column_values)
+            mask = map(re.compile(value).search, column_values)
+            if condition_operator == '!~':
+                mask = map(operator.not_, mask)
+            return mask
+        if numeric:
+            try:
+                value = float(value)
+            except ValueError:
+                raise StandardError('Column %s is numeric: %s' % (column, condition))
+        return map(self.operators[condition_operator], column_values, repeat(value, len(column_values)))
+
+    def where(self, conditions):
+        """
+        Find rows matching all conditions.
+        Every next condition is evaluated only on the rows matched by the previous ones.
+        @param conditions: List of condition strings
+        @return: List of row indexes
+        """
+        indexes = range(self.size)
+        for number, condition in enumerate(conditions):
+            if number == 0:
+                indexes = list(compress(indexes, self.mask(condition)))
+            else:
+                indexes = list(compress(indexes, self.mask(condition, indexes)))
+        return indexes
+
+    def sort(self, indexes, column, reverse=False, top=None):
+        """
+        Sort rows by a column, rows with empty values go last in both orders
+        @param indexes: List of row indexes
+        @param column: Column name
+        @param reverse: Sort in the descending order
+        @param top: Only this many first rows are needed
+        @return: List of row indexes
+        """
+        if column not in self.values:
+            raise StandardError('There is no column: %s' % column)
+        column_values = self.values[column]
+        missing = []
+        if isinstance(column_values, array):
+            present = [index for index in indexes if column_values[index] == column_values[index]]
+            if len(present) < len(indexes):
+                present_set = set(present)
+                missing = [index for index in indexes if index not in present_set]
+            indexes = present
+        key = column_values.__getitem__
+        if top is not None and top < len(indexes):
+            if reverse:
+                return heapq.nlargest(top, indexes, key)
+            return heapq.nsmallest(top, indexes, key)
+        return sorted(indexes, key=key, reverse=reverse) + missing
+
+    def rows(self, indexes, columns, missing=''):
+        """
+        Get rows with values as they are in the stats, numbers become integers again
+        @param indexes: List of row indexes
+        @param columns: List of column names
+        @param missing: Value of the empty numeric cells
+        @return: List of value lists
+        """
+        selected = []
+        for column in columns:
+            column_values = self.values[column]
+            values = map(column_values.__getitem__, indexes)
+            if isinstance(column_values, array):
+                values = [missing if value != value else int(value) if value.is_integer() else value
+                          for value in values]
+            selected.append(values)
+        return map(list, izip(*selected)) if selected else [[] for index in indexes]
+
+
+class Series:
+    """
+    Ring buffer of counter samples of one server.
+    Samples are kept in flat numeric arrays: one slot of the ring holds
+    a time stamp and a value of every counter.
+    """
+
+    def __init__(self, size, fields):
+        self.size = size
+        self.fields = fields
+        self.times = array('d', [0.0]) * size
+        self.values = array('d', [0.0]) * (size * len(fields))
+        self.count = 0
+
+    def add(self, timestamp, server):
+        """
+        Write a sample to the ring, overwriting the oldest one
+        @param timestamp: Time of the sample
+        @param server: Server status structure
+        """
+        position = self.count % self.size
+        offset = position * len(self.fields)
+        self.times[position] = timestamp
+        # empty counters are empty strings
+        self.values[offset:offset + len(self.fields)] = array('d', [server.get(field) or 0 for field in self.fields])
+        self.count += 1
+
+    def window(self, seconds):
+        """
+        Find the oldest and the newest samples inside a time window
+        @param seconds: Window length
+        @return: Ring positions of the first and the last samples
+        """
+        last = (self.count - 1) % self.size
+        first = last
+        for age in xrange(1, min(self.count, self.size)):
+            position = (self.count - 1 - age) % self.size
+            if self.times[last] - self.times[position] > seconds:
+                break
+            first = position
+        return first, last
+
+    def rates(self, seconds):
+        """
+        Calculate per second rates of all counters over a time window.
+        A counter which went down was reset, its new value is used as the delta.
+        @param seconds: Window length
+        @return: Dict of counter rates or None if there are less than two samples
+        """
+        if self.count < 2:
+            return None
+        first, last = self.window(seconds)
+        if first == last:
+            return None
+        interval = self.times[last] - self.times[first]
+        width = len(self.fields)
+        old_values = self.values[first * width:(first + 1) * width]
+        new_values = self.values[last * width:(last + 1) * width]
+        deltas = {}
+        for field, old_value, new_value in izip(self.fields, old_values, new_values):
+            if new_value < old_value:
+                deltas[field] = new_value
+            else:
+                deltas[field] = new_value - old_value
+        rates = dict((field, delta / interval) for field, delta in deltas.iteritems())
+        errors = sum(deltas[field] for field in Collector.errors)
+        if deltas['stot']:
+            rates['error_ratio'] = errors / deltas['stot']
+        else:
+            rates['error_ratio'] = 0.0
+        rates['interval'] = interval
+        return rates
+
+
+class Collector:
+    """
+    Keeps history of counters of every (pxname, svname) between polls
+    """
+    counters = ('stot', 'bin', 'bout', 'req_tot', 'hrsp_5xx', 'econ', 'eresp', 'dreq', 'dresp')
+    errors = ('hrsp_5xx', 'econ', 'eresp')
+
+    def __init__(self, history=60):
+        self.history = max(2, history)
+        self.series = {}
+
+    def add(self, timestamp, status):
+        """
+        Add a sample of every server and forget servers which are gone
+        @param timestamp: Time of the poll
+        @param status: Status object
+        """
+        seen = set()
+        for service_name, service in status.data.iteritems():
+            for server_name, server in service.iteritems():
+                key = (service_name, server_name)
+                seen.add(key)
+                series = self.series.get(key)
+                if series is None:
+                    series = self.series[key] = Series(self.history, self.counters)
+                series.add(timestamp, server)
+        for key in set(self.series) - seen:
+            del self.series[key]
+
+    def annotate(self, data, seconds):
+        """
+        Add the "rates" structure to every server
+        @param data: Status data
+        @param seconds: Window length
+        """
+        for service_name, service in data.iteritems():
+            for server_name, server in service.iteritems():
+                series = self.series.get((service_name, server_name))
+                if series:
+                    server['rates'] = series.rates(seconds)
+
+
+class StatsCache:
+    """
+    Stats shared by all HTTP clients.
+    The sources are queried at most once per TTL, requests which come
+    during a refresh wait for it instead of starting their own.
+    """
+
+    def __init__(self, interface):
+        self.interface = interface
+        self.condition = threading.Condition()
+        self.refreshing = False
+        self.generation = 0
+        self.snapshot = None
+        self.error = None
+        self.checked = 0
+        self.queries = 0
+
+    def refresh(self):
+        """
+        Query the sources and make a new snapshot
+        @return: Snapshot structure
+        """
+        time_start = time.time()
+        statuses, status = self.interface.fetch_status()
+        self.interface.debug('Refresh: %.3f ms' % ((time.time() - time_start) * 1000), 1)
+        return {
+            'time': time_start,
+            'status': status,
+            'outputs': {},
+        }
+
+    def get(self):
+        """
+        Get the current snapshot, refresh it if it is older than TTL
+        @return: Snapshot structure or None if the sources could not be queried
+        """
+        with self.condition:
+            if time.time() - self.checked < self.interface.args.ttl:
+                return self.snapshot
+            if self.refreshing:
+                # take the result of the running refresh
+                generation = self.generation
+                while self.generation == generation:
+                    self.condition.wait()
+                return self.snapshot
+            self.refreshing = True
+
+        snapshot = None
+        error = None
+        try:
+            snapshot = self.refresh()
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            self.interface.debug('Refresh error: %s' % error, 1)
+
+        with self.condition:
+            self.generation += 1
+            self.queries += 1
+            self.checked = time.time()
+            self.refreshing = False
+            if snapshot:
+                self.snapshot = snapshot
+            # keep serving the last good stats, but say what happened
+            self.error = error
+            self.condition.notify_all()
+            return self.snapshot
+
+    def output(self, output_format):
+        """
+        Get the stats rendered in a format, every snapshot renders a format once
+        @param output_format: json, csv or metrics
+        @return: Snapshot structure and the output string
+        """
+        snapshot = self.get()
+        if snapshot is None:
+            return None, None
+        outputs = snapshot['outputs']
+        if output_format not in outputs:
+            status = snapshot['status']
+            if output_format == 'json':
+                from json import dumps
+                outputs[output_format] = dumps(status.data)
+            elif output_format == 'csv':
+                outputs[output_format] = status.raw_csv()
+            else:
+                outputs[output_format] = status.export_metrics()
+        return snapshot, outputs[output_format]
+
+
+class StatsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Answers /metrics, /json and /csv requests
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # send headers and body in one packet
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    content_types = {
+        'metrics': 'text/plain; version=0.0.4',
+        'json': 'application/json',
+        'csv': 'text/plain',
+    }
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0].strip('/')
+        if path == '':
+            path = 'json'
+        if path not in self.content_types:
+            self.send_data(400, 'Use /metrics, /json or /csv')
+            return
 
-            service_field = self.status_fields['pxname']
-            server_field = self.status_fields['svname']
+        cache = self.server.cache
+        snapshot, data = cache.output(path)
+        if snapshot is None:
+            self.send_data(500, 'Could not get stats: %s' % cache.error)
+            return
 
-            for status_field_name in self.status_fields:
-                status_field = self.status_fields[status_field_name]
-                status_field_number = status_field['number']
+        self.send_response(200)
+        self.send_header('Content-Type', self.content_types[path])
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('X-Stats-Age', '%.3f' % (time.time() - snapshot['time']))
+        if cache.error:
+            self.send_header('X-Stats-Error', cache.error.replace('\n', ' '))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
 
-                service_field_value = csv_fields[service_field['number']]
-                server_field_value = csv_fields[server_field['number']]
+    def do_HEAD(self):
+        self.do_GET()
 
-                if service_field_value not in self.data:
-                    self.data[service_field_value] = {}
+    def send_data(self, code=200, msg='OK'):
+        data = msg + '\n'
+        self.send_response(code, msg)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
 
-                if server_field_value not in self.data[service_field_value]:
-                    self.data[service_field_value][server_field_value] = {}
+    def log_message(self, format, *args):
+        self.server.cache.interface.debug(format % args, 2)
 
-                csv_field_value = csv_fields[status_field_number]
 
-                server = self.data[service_field_value][server_field_value]
-                server[status_field_name] = csv_field_value
+class StatsServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
 
 
 ##############################################################################
 
 if __name__ == '__main__':
     interface = Interface()
-    interface.get_status()
-    interface.result()
+    if interface.args.serve:
+        server = StatsServer((interface.args.address, interface.args.port), StatsHandler)
+        server.cache = StatsCache(interface)
+        interface.debug('Listening on %s:%d' % (interface.args.address, interface.args.port), 1)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    elif interface.args.watch:
+        try:
+            interface.watch()
+        except KeyboardInterrupt:
+            pass
+    else:
+        interface.get_status()
+        interface.result()
@@ -12,4 +12,5 @@ make_file() {
 make_file crm_ops.py
 make_file color_chart.py
 make_file cib_check_cgi.py
+make_file cib_health_server.py
 make_file haproxy-status.py